@@ -0,0 +1,223 @@
+"""
+Compares the columnar (Parquet/Arrow) graph export with the streamed JSON export.
+
+Exports are produced from synthetic in-memory cursors that yield documents shaped like the database's, so the timings measure encoding, writing and parsing rather than MongoDB. For each graph size the time and peak traced memory to write each export, its size, and the time to load it back are reported.
+
+Usage (from the server directory):
+    python benchmarks/benchmark_graph_export.py --triples 100000 1000000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import zipfile
+from datetime import datetime
+
+from bson import ObjectId
+
+SERVER_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(SERVER_DIRECTORY)
+
+from models import graph as graph_model
+from services.export import encode_chunks, export_chunks, export_columnar
+
+
+class Cursor:
+    def __init__(self, documents):
+        self.documents = documents
+
+    async def __aiter__(self):
+        for document in self.documents():
+            yield document
+
+
+class SyntheticGraph:
+    """Generates the documents of a graph with `n_triples` triples over `n_triples // 2` nodes on demand."""
+
+    def __init__(self, n_triples: int):
+        self.n_triples = n_triples
+        self.n_nodes = max(2, n_triples // 2)
+        self.now = datetime.utcnow()
+        self.node_class = ObjectId()
+        self.edge_class = ObjectId()
+        self.graph = {
+            "_id": ObjectId(),
+            "name": "benchmark",
+            "node_classes": [{"_id": self.node_class, "name": "Node", "color": "#fff"}],
+            "edge_classes": [{"_id": self.edge_class, "name": "edge", "color": "#fff"}],
+            "plugins": {"completion": None, "error": None},
+            "settings": {},
+            "start_node_count": self.n_nodes,
+            "start_edge_count": n_triples,
+            "created_at": self.now,
+            "updated_at": self.now,
+        }
+        self.node_ids = [ObjectId() for _ in range(self.n_nodes)]
+
+    def item(self, i: int, is_node: bool):
+        errors = [{"id": ObjectId(), "message": "error"}] if i % 10 == 0 else []
+        return {
+            "_id": self.node_ids[i] if is_node else ObjectId(),
+            "name": f"node {i}",
+            "type": self.node_class if is_node else self.edge_class,
+            "value": 1 + i % 5,
+            "properties": [],
+            "is_reviewed": i % 3 == 0,
+            "is_active": True,
+            "errors": errors,
+            "suggestions": [],
+            "created_at": self.now,
+            "updated_at": self.now,
+        }
+
+    def triple_endpoints(self, i: int):
+        return i % self.n_nodes, (i * 7 + 1) % self.n_nodes
+
+    def joined_triples(self):
+        for i in range(self.n_triples):
+            head, tail = self.triple_endpoints(i)
+            yield {
+                "head": self.item(head, True),
+                "edge": self.item(i, False),
+                "tail": self.item(tail, True),
+            }
+
+    def item_columns(self, n: int, is_node: bool):
+        for i in range(n):
+            item = self.item(i, is_node)
+            yield {
+                **item,
+                "errors": len(item["errors"]),
+                "suggestions": len(item["suggestions"]),
+            }
+
+    def triples(self):
+        for i in range(self.n_triples):
+            head, tail = self.triple_endpoints(i)
+            yield {
+                "_id": ObjectId(),
+                "head": self.node_ids[head],
+                "edge": ObjectId(),
+                "tail": self.node_ids[tail],
+            }
+
+    def __getitem__(self, collection: str):
+        return SyntheticCollection(self, collection)
+
+
+class SyntheticCollection:
+    def __init__(self, graph: SyntheticGraph, name: str):
+        self.graph = graph
+        self.name = name
+
+    def aggregate(self, pipeline, **kwargs):
+        if self.name == "triples":
+            return Cursor(self.graph.joined_triples)
+        if self.name == "nodes":
+            return Cursor(lambda: self.graph.item_columns(self.graph.n_nodes, True))
+        return Cursor(lambda: self.graph.item_columns(self.graph.n_triples, False))
+
+    def find(self, *args, **kwargs):
+        return Cursor(self.graph.triples)
+
+
+async def write_json(db: SyntheticGraph, path: str, format, compress: bool):
+    with open(path, "wb") as f:
+        async for chunk in encode_chunks(
+            export_chunks(graph=db.graph, db=db, format=format), compress=compress
+        ):
+            f.write(chunk)
+    return path
+
+
+def load_json(path: str, compress: bool):
+    import gzip
+
+    with (gzip.open if compress else open)(path, "rb") as f:
+        return len(json.load(f)["data"])
+
+
+def load_columnar(path: str, format):
+    import pyarrow.ipc
+    import pyarrow.parquet
+
+    rows = 0
+    with zipfile.ZipFile(path) as z:
+        for name in z.namelist():
+            if name.startswith("triples."):
+                with z.open(name) as f:
+                    if format == graph_model.ExportFormat.parquet:
+                        rows += pyarrow.parquet.read_table(f).num_rows
+                    else:
+                        rows += pyarrow.ipc.open_file(f).read_all().num_rows
+    return rows
+
+
+def measure(label: str, write, load):
+    tracemalloc.start()
+    start = time.perf_counter()
+    path = write()
+    write_seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    rows = load(path)
+    load_seconds = time.perf_counter() - start
+
+    print(
+        f"  {label:<14} write {write_seconds:7.2f}s  peak {peak / 2**20:7.1f} MB  size {os.path.getsize(path) / 2**20:8.1f} MB  load {load_seconds:6.2f}s  ({rows} triples)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--triples", type=int, nargs="+", default=[10_000, 100_000])
+    args = parser.parse_args()
+
+    for n_triples in args.triples:
+        print(f"{n_triples} triples")
+        db = SyntheticGraph(n_triples)
+        directory = tempfile.mkdtemp()
+        try:
+            for label, format, compress in [
+                ("json", graph_model.ExportFormat.json, False),
+                ("json (gzip)", graph_model.ExportFormat.json, True),
+            ]:
+                path = os.path.join(directory, label.replace(" ", "_"))
+                measure(
+                    label,
+                    lambda: asyncio.run(write_json(db, path, format, compress)),
+                    lambda path: load_json(path, compress),
+                )
+
+            for format in [
+                graph_model.ExportFormat.parquet,
+                graph_model.ExportFormat.arrow,
+            ]:
+                format_directory = os.path.join(directory, format.value)
+                os.makedirs(format_directory)
+                measure(
+                    format.value,
+                    lambda: asyncio.run(
+                        export_columnar(
+                            graph=db.graph,
+                            db=db,
+                            format=format,
+                            directory=format_directory,
+                        )
+                    ),
+                    lambda path: load_columnar(path, format),
+                )
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
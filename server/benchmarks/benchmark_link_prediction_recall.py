@@ -0,0 +1,141 @@
+"""
+Reports the recall of the LSH candidate stage of the node2vec link prediction plugin against the exact (all pairs) path.
+
+Recall is measured on node2vec embeddings of the `data/` example graphs, of synthetic community graphs, and of synthetic clustered embeddings (for sizes where training node2vec would dominate).
+
+Usage (from the server directory):
+    python benchmarks/benchmark_link_prediction_recall.py --graph-sizes 1000 5000 --embedding-sizes 20000 50000 100000
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+import networkx as nx
+import numpy as np
+
+SERVER_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(SERVER_DIRECTORY)
+
+from plugins.unsupervised_node2vec_link_prediction import (
+    build_graph,
+    predict_links,
+    predict_links_lsh,
+    train_embeddings,
+)
+
+
+def example_graphs():
+    """Loads the `data/` example graphs. Untyped triples get types alternating by role so some pairs are scored."""
+    for path in sorted(
+        glob.glob(os.path.join(SERVER_DIRECTORY, "..", "data", "*.json"))
+    ):
+        with open(path) as f:
+            triples = json.load(f)
+        triples = [
+            {
+                "head": t["head"],
+                "head_type": t.get("head_type", "head"),
+                "head_id": t["head"],
+                "tail": t["tail"],
+                "tail_type": t.get("tail_type", "tail"),
+                "tail_id": t["tail"],
+            }
+            for t in triples
+        ]
+        yield os.path.basename(path), build_graph(triples)
+
+
+def synthetic_graph(size: int, seed: int = 0) -> nx.Graph:
+    """A graph of densely connected communities of ~20 nodes, with two node types."""
+    communities = max(1, size // 20)
+    G = nx.planted_partition_graph(
+        communities, size // communities, 0.3, 0.001, seed=seed
+    )
+    nx.set_node_attributes(G, {node: ("a" if node % 2 else "b") for node in G}, "type")
+    return G
+
+
+def graph_inputs(G: nx.Graph, num_walks: int):
+    nodes = list(G.nodes)
+    node_index = {node: i for i, node in enumerate(nodes)}
+    embeddings = train_embeddings(
+        G, num_walks=num_walks, workers=os.cpu_count() or 1, use_cache=False
+    )
+    node_types = [G.nodes[node]["type"] for node in nodes]
+    edges = [(node_index[u], node_index[v]) for u, v in G.edges]
+    return embeddings, node_types, edges
+
+
+def synthetic_embeddings(size: int, seed: int = 0):
+    """Clustered embeddings (~10 per cluster), three node types and a ring of existing edges."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(1, size // 10), 64))
+    embeddings = centers[rng.integers(0, len(centers), size)]
+    embeddings = embeddings + 0.08 * rng.normal(size=embeddings.shape)
+    node_types = rng.choice(["a", "b", "c"], size).tolist()
+    edges = [(i, (i + 1) % size) for i in range(size)]
+    return embeddings, node_types, edges
+
+
+def report(name: str, embeddings, node_types, edges, sim_threshold: float, top_k):
+    start = time.perf_counter()
+    exact = predict_links(embeddings, node_types, edges, sim_threshold, top_k=top_k)
+    exact_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    approximate = predict_links_lsh(
+        embeddings, node_types, edges, sim_threshold, top_k=top_k
+    )
+    lsh_time = time.perf_counter() - start
+
+    exact_pairs = {(i, j) for i, j, _ in exact}
+    lsh_pairs = {(i, j) for i, j, _ in approximate}
+    recall = len(exact_pairs & lsh_pairs) / len(exact_pairs) if exact_pairs else 1.0
+
+    print(
+        f"{name:>32} {len(embeddings):>8} {len(exact_pairs):>9} {len(lsh_pairs):>9} {recall:>7.3f} {exact_time:>10.2f} {lsh_time:>8.2f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sim-threshold", type=float, default=0.9)
+    parser.add_argument("--top-k", type=int, default=None)
+    parser.add_argument("--graph-sizes", type=int, nargs="*", default=[1000, 5000])
+    parser.add_argument(
+        "--embedding-sizes", type=int, nargs="*", default=[20000, 50000, 100000]
+    )
+    parser.add_argument(
+        "--num-walks", type=int, default=20, help="node2vec walks per node"
+    )
+    args = parser.parse_args()
+
+    print(
+        f"{'input':>32} {'nodes':>8} {'exact':>9} {'lsh':>9} {'recall':>7} {'exact (s)':>10} {'lsh (s)':>8}"
+    )
+    for name, G in example_graphs():
+        report(name, *graph_inputs(G, args.num_walks), args.sim_threshold, args.top_k)
+
+    for size in args.graph_sizes:
+        report(
+            "synthetic graph",
+            *graph_inputs(synthetic_graph(size), args.num_walks),
+            args.sim_threshold,
+            args.top_k,
+        )
+
+    for size in args.embedding_sizes:
+        report(
+            "synthetic embeddings",
+            *synthetic_embeddings(size),
+            args.sim_threshold,
+            args.top_k,
+        )
+
+
+if __name__ == "__main__":
+    main()
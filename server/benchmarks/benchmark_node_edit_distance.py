@@ -0,0 +1,100 @@
+"""
+Compares the brute force, blocking and parallel (sharded brute force) methods of the Node Edit Distance plugin as the number of nodes grows.
+
+Usage (from the server directory):
+    python benchmarks/benchmark_node_edit_distance.py --sizes 1000 5000 20000 --max-distance 1 --workers 8
+"""
+
+import argparse
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from plugins.node_edit_distance_plugin import (
+    MAX_BLOCKING_DISTANCE,
+    find_similar_nodes,
+)
+
+
+def make_nodes(size: int, seed: int = 0):
+    """Generates (name, type) nodes where roughly a fifth are misspellings of another node."""
+    rng = random.Random(seed)
+    types = ["person", "organisation", "location", "equipment"]
+    names = []
+    for _ in range(size):
+        if names and rng.random() < 0.2:
+            name = list(rng.choice(names))
+            position = rng.randrange(len(name))
+            name[position] = rng.choice(string.ascii_lowercase)
+            names.append("".join(name))
+        else:
+            names.append(
+                "".join(rng.choices(string.ascii_lowercase + " ", k=rng.randint(4, 16)))
+            )
+    return {(name, rng.choice(types)): {str(i)} for i, name in enumerate(names)}
+
+
+def time_method(nodes, max_distance: int, method: str, workers=None):
+    start = time.perf_counter()
+    errors = find_similar_nodes(nodes, max_distance, method=method, workers=workers)
+    return errors, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[1000, 2500, 5000, 10000]
+    )
+    parser.add_argument("--max-distance", type=int, default=1)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Processes used by the parallel method",
+    )
+    parser.add_argument(
+        "--brute-force-limit",
+        type=int,
+        default=10000,
+        help="Sizes above this skip the (quadratic) brute force run",
+    )
+    args = parser.parse_args()
+
+    methods = ["brute_force", "blocking", "parallel"]
+    print(
+        f"{'nodes':>8} "
+        + " ".join(f"{m + ' (s)':>16}" for m in methods)
+        + f" {'pairs':>8}"
+    )
+    for size in args.sizes:
+        nodes = make_nodes(size)
+        results = {}
+        for method in methods:
+            if method != "blocking" and size > args.brute_force_limit:
+                continue
+            if method == "blocking" and args.max_distance > MAX_BLOCKING_DISTANCE:
+                continue
+            results[method] = time_method(
+                nodes, args.max_distance, method, args.workers
+            )
+
+        errors = [errors for errors, _ in results.values()]
+        for other in errors[1:]:
+            assert dict(other) == dict(errors[0]), "Outputs differ between methods"
+            assert list(other) == list(
+                errors[0]
+            ), "Output order differs between methods"
+
+        pairs = sum(len(v) for v in errors[0].values()) // 2 if errors else 0
+        times = [
+            f"{results[m][1]:>16.3f}" if m in results else f"{'-':>16}" for m in methods
+        ]
+        print(f"{size:>8} " + " ".join(times) + f" {pairs:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Compares populating triples with batched `$in` loads (`services.triples`) against the previous triple `$lookup` aggregation, on hub-heavy graphs.
+
+Requires a MongoDB instance (`MONGO_URI` in settings, or `--uri`). A synthetic graph is written to a temporary database, which is dropped afterwards. Each graph has `--hubs` hub nodes that every triple touches with probability `--hub-share`, so hub nodes are incident to most triples, as with the popular entities of real graphs.
+
+Usage (from the server directory):
+    python benchmarks/benchmark_populate_triples.py --triples 10000 100000 --hubs 10
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime
+
+from bson import ObjectId
+
+SERVER_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(SERVER_DIRECTORY)
+
+from database import create_client
+from services.bulk import bulk_insert
+from services.triples import find_populated_triples
+from settings import settings
+
+
+def lookup_pipeline(graph_id: ObjectId):
+    """The `$lookup` pipeline used before triples were populated with `$in` loads"""
+    return [
+        {"$match": {"graph_id": graph_id}},
+        *[
+            {
+                "$lookup": {
+                    "from": collection,
+                    "localField": field,
+                    "foreignField": "_id",
+                    "as": field,
+                }
+            }
+            for field, collection in [
+                ("head", "nodes"),
+                ("tail", "nodes"),
+                ("edge", "edges"),
+            ]
+        ],
+        {"$unwind": "$head"},
+        {"$unwind": "$tail"},
+        {"$unwind": "$edge"},
+        {
+            "$project": {
+                "graph_id": 0,
+                "head.graph_id": 0,
+                "edge.graph_id": 0,
+                "tail.graph_id": 0,
+            }
+        },
+    ]
+
+
+def item(graph_id: ObjectId, name: str, now: datetime):
+    return {
+        "_id": ObjectId(),
+        "graph_id": graph_id,
+        "name": name,
+        "type": ObjectId(),
+        "value": 1,
+        "properties": [{"id": ObjectId(), "name": "source", "value": name}],
+        "errors": [],
+        "suggestions": [],
+        "is_reviewed": False,
+        "is_active": True,
+        "created_at": now,
+        "updated_at": now,
+    }
+
+
+async def create_graph(db, n_triples: int, n_hubs: int, hub_share: float, seed: int):
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    graph_id = ObjectId()
+
+    n_nodes = max(n_hubs + 2, n_triples // 2)
+    nodes = [item(graph_id, f"node {i}", now) for i in range(n_nodes)]
+    hubs, others = nodes[:n_hubs], nodes[n_hubs:]
+
+    edges, triples = [], []
+    for _ in range(n_triples):
+        head = rng.choice(hubs) if rng.random() < hub_share else rng.choice(others)
+        tail = rng.choice(others)
+        edge = item(graph_id, None, now)
+        edges.append(edge)
+        triples.append(
+            {
+                "_id": ObjectId(),
+                "graph_id": graph_id,
+                "head": head["_id"],
+                "edge": edge["_id"],
+                "tail": tail["_id"],
+            }
+        )
+
+    await bulk_insert(db["nodes"], nodes)
+    await bulk_insert(db["edges"], edges)
+    await bulk_insert(db["triples"], triples)
+    await db["triples"].create_index([("graph_id", 1), ("head", 1)])
+    return graph_id
+
+
+async def timed(coroutine):
+    start = time.perf_counter()
+    result = await coroutine
+    return result, time.perf_counter() - start
+
+
+async def run(args):
+    if args.uri:
+        settings.MONGO_URI = args.uri
+    client = create_client()
+    db = client[f"cleangraph_benchmark_{uuid.uuid4().hex[:8]}"]
+    try:
+        for n_triples in args.triples:
+            graph_id = await create_graph(
+                db, n_triples, args.hubs, args.hub_share, args.seed
+            )
+
+            for repeat in range(args.repeats):
+                looked_up, lookup_seconds = await timed(
+                    db["triples"].aggregate(lookup_pipeline(graph_id)).to_list(None)
+                )
+                populated, populate_seconds = await timed(
+                    find_populated_triples({"graph_id": graph_id}, db)
+                )
+                assert len(looked_up) == len(populated)
+
+                print(
+                    f"{n_triples:>9} triples, {args.hubs} hubs ({args.hub_share:.0%} of triples): $lookup {lookup_seconds:7.2f}s  $in populate {populate_seconds:7.2f}s  speedup {lookup_seconds / populate_seconds:5.1f}x"
+                )
+    finally:
+        await client.drop_database(db.name)
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--uri", default=None, help="Defaults to MONGO_URI")
+    parser.add_argument("--triples", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--hubs", type=int, default=10)
+    parser.add_argument("--hub-share", type=float, default=0.8)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+The application-wide MongoDB client.
+
+A single Motor client (and so a single connection pool) is shared by every request and background job, rather than a client being created per request. It is connected on application startup and closed on shutdown (see `main.py`). Pool size, timeouts and compression are configured in `settings.py`, and pool activity is recorded by `PoolMetrics`.
+"""
+
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Optional
+
+import motor.motor_asyncio
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo import monitoring
+
+from settings import settings
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """
+    Counts connection pool events per server.
+
+    Listener callbacks run on driver threads, so counters are guarded by a lock.
+    """
+
+    COUNTERS = (
+        "connections_created",
+        "connections_closed",
+        "checkouts",
+        "checkout_failures",
+        "pool_clears",
+    )
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started_at = time.time()
+        self._pools: Dict[str, Dict[str, int]] = defaultdict(self._new_pool)
+
+    def _new_pool(self) -> Dict[str, int]:
+        return {"open": 0, "checked_out": 0, **{c: 0 for c in self.COUNTERS}}
+
+    def _record(self, address, **deltas: int) -> None:
+        key = "%s:%s" % address
+        with self._lock:
+            pool = self._pools[key]
+            for name, delta in deltas.items():
+                pool[name] += delta
+
+    def pool_created(self, event):
+        self._record(event.address)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._record(event.address, pool_clears=1)
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._record(event.address, connections_created=1, open=1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._record(event.address, connections_closed=1, open=-1)
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self._record(event.address, checkout_failures=1)
+
+    def connection_checked_out(self, event):
+        self._record(event.address, checkouts=1, checked_out=1)
+
+    def connection_checked_in(self, event):
+        self._record(event.address, checked_out=-1)
+
+    def snapshot(self) -> Dict:
+        """Returns the pool configuration and a copy of the per-server counters."""
+        with self._lock:
+            pools = {address: dict(pool) for address, pool in self._pools.items()}
+        return {
+            "max_pool_size": settings.MONGO_MAX_POOL_SIZE,
+            "min_pool_size": settings.MONGO_MIN_POOL_SIZE,
+            "uptime_seconds": round(time.time() - self._started_at, 1),
+            "pools": pools,
+        }
+
+
+def create_client(**kwargs) -> AsyncIOMotorClient:
+    """Creates a Motor client configured from settings. Keyword arguments override the settings."""
+    options = {
+        "maxPoolSize": settings.MONGO_MAX_POOL_SIZE,
+        "minPoolSize": settings.MONGO_MIN_POOL_SIZE,
+        "maxIdleTimeMS": settings.MONGO_MAX_IDLE_TIME_MS,
+        "waitQueueTimeoutMS": settings.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        "connectTimeoutMS": settings.MONGO_CONNECT_TIMEOUT_MS,
+        "socketTimeoutMS": settings.MONGO_SOCKET_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": settings.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    }
+    if settings.MONGO_COMPRESSORS:
+        options["compressors"] = settings.MONGO_COMPRESSORS
+    options.update(kwargs)
+
+    return motor.motor_asyncio.AsyncIOMotorClient(
+        settings.MONGO_URI,
+        **{key: value for key, value in options.items() if value is not None},
+    )
+
+
+class Database:
+    def __init__(self):
+        self.client: Optional[AsyncIOMotorClient] = None
+        self.metrics = PoolMetrics()
+
+    def connect(self) -> None:
+        """Creates the shared client. Connections are opened lazily by the driver."""
+        if self.client is None:
+            self.metrics = PoolMetrics()
+            self.client = create_client(event_listeners=[self.metrics])
+
+    def close(self) -> None:
+        if self.client is not None:
+            self.client.close()
+            self.client = None
+
+    @property
+    def db(self) -> AsyncIOMotorDatabase:
+        if self.client is None:
+            raise RuntimeError("Database client is not connected")
+        return self.client[settings.MONGO_DB_NAME]
+
+
+database = Database()
@@ -3,13 +3,19 @@ db_manager.py
 
 A script to manage MongoDB collections using Typer CLI.
 """
+
 import asyncio
-from typing import NoReturn
+from typing import NoReturn, Optional
 
 import typer
-import motor.motor_asyncio
+from bson import ObjectId
 from motor.core import AgnosticDatabase
 
+from database import create_client
+from services.indexes import INDEXES, ensure_indexes, verify_indexes
+from services.neighbourhood import refresh_neighbourhoods
+from services.degree import refresh_degrees, verify_degrees
+from services.graph import collect_orphans, find_orphaned_graph_ids
 from settings import settings
 
 app = typer.Typer()
@@ -21,7 +27,7 @@ def get_db() -> AgnosticDatabase:
     Returns:
         motor.motor_asyncio.AsyncIOMotorDatabase: The database object.
     """
-    client = motor.motor_asyncio.AsyncIOMotorClient(settings.MONGO_URI)
+    client = create_client()
     return client[settings.MONGO_DB_NAME]
 
 
@@ -48,6 +54,129 @@ async def drop_all_collections_async() -> NoReturn:
         typer.echo(f"An error occurred: {e}")
 
 
+@app.command()
+def create_indexes() -> NoReturn:
+    """Creates the indexes declared in services/indexes.py."""
+    asyncio.run(create_indexes_async())
+
+
+async def create_indexes_async() -> NoReturn:
+    """Asynchronous task to create the declared indexes, then verify them."""
+    db = get_db()
+    try:
+        for name in await ensure_indexes(db):
+            typer.echo(f"Created index {name}")
+        await verify_indexes_async()
+    except Exception as e:
+        typer.echo(f"An error occurred: {e}")
+
+
+@app.command("verify-indexes")
+def verify_indexes_command() -> NoReturn:
+    """Reports which declared indexes exist, and the queries they serve."""
+    asyncio.run(verify_indexes_async())
+
+
+async def verify_indexes_async() -> NoReturn:
+    """Asynchronous task to report each declared index as present or missing."""
+    db = get_db()
+    try:
+        missing = await verify_indexes(db)
+        for declaration in INDEXES:
+            state = "MISSING" if declaration in missing else "ok"
+            typer.echo(
+                f"[{state}] {declaration.collection}.{declaration.name} {declaration.keys} - {declaration.serves}"
+            )
+        if missing:
+            typer.echo(
+                f"{len(missing)} index(es) missing - run `python db_manager.py create-indexes`"
+            )
+    except Exception as e:
+        typer.echo(f"An error occurred: {e}")
+
+
+@app.command()
+def rebuild_neighbourhoods(
+    graph_id: Optional[str] = typer.Argument(
+        None, help="The graph to rebuild. Rebuilds every graph if omitted."
+    )
+) -> NoReturn:
+    """Rebuilds the neighbourhood summaries stored on graph nodes."""
+    asyncio.run(rebuild_neighbourhoods_async(graph_id))
+
+
+async def rebuild_neighbourhoods_async(graph_id: Optional[str]) -> NoReturn:
+    """Asynchronous task to recompute the neighbourhood summaries of one or all graphs."""
+    db = get_db()
+    try:
+        query = {} if graph_id is None else {"_id": ObjectId(graph_id)}
+        async for graph in db["graphs"].find(query, {"_id": 1}):
+            summaries = await refresh_neighbourhoods(graph_id=graph["_id"], db=db)
+            typer.echo(
+                f"Rebuilt {len(summaries)} neighbourhoods for graph {graph['_id']}"
+            )
+    except Exception as e:
+        typer.echo(f"An error occurred: {e}")
+
+
+@app.command("verify-degrees")
+def verify_degrees_command(
+    graph_id: Optional[str] = typer.Argument(
+        None, help="The graph to verify. Verifies every graph if omitted."
+    ),
+    repair: bool = typer.Option(
+        False, "--repair", help="Recount and store the degrees of graphs that drifted."
+    ),
+) -> NoReturn:
+    """Checks the degree counters stored on graph nodes against their triples."""
+    asyncio.run(verify_degrees_async(graph_id, repair))
+
+
+async def verify_degrees_async(graph_id: Optional[str], repair: bool) -> NoReturn:
+    """Asynchronous task to report (and optionally repair) drifted node degrees of one or all graphs."""
+    db = get_db()
+    try:
+        query = {} if graph_id is None else {"_id": ObjectId(graph_id)}
+        async for graph in db["graphs"].find(query, {"_id": 1}):
+            drifted = await verify_degrees(graph_id=graph["_id"], db=db)
+            for node in drifted[:10]:
+                typer.echo(
+                    f"  node {node['_id']}: stored {node['stored']} actual {node['actual']}"
+                )
+            state = f"{len(drifted)} node(s) drifted" if drifted else "ok"
+            typer.echo(f"[{state}] graph {graph['_id']}")
+            if drifted and repair:
+                degrees = await refresh_degrees(graph_id=graph["_id"], db=db)
+                typer.echo(f"Repaired degrees of {len(degrees)} nodes")
+    except Exception as e:
+        typer.echo(f"An error occurred: {e}")
+
+
+@app.command("gc-orphans")
+def gc_orphans(
+    dry_run: bool = typer.Option(
+        False, "--dry-run", help="Report orphaned documents without deleting them."
+    ),
+) -> NoReturn:
+    """Deletes nodes, edges, triples and jobs left behind by graphs that no longer exist."""
+    asyncio.run(gc_orphans_async(dry_run))
+
+
+async def gc_orphans_async(dry_run: bool) -> NoReturn:
+    """Asynchronous task to sweep documents of deleted graphs."""
+    db = get_db()
+    try:
+        orphaned_ids = await find_orphaned_graph_ids(db=db)
+        for graph_id in orphaned_ids:
+            typer.echo(f"  orphaned graph {graph_id}")
+        collected = await collect_orphans(db=db, dry_run=dry_run)
+        action = "Would delete" if dry_run else "Deleted"
+        counts = ", ".join(f"{count} {name}" for name, count in collected.items())
+        typer.echo(f"{action} {counts} of {len(orphaned_ids)} orphaned graph(s)")
+    except Exception as e:
+        typer.echo(f"An error occurred: {e}")
+
+
 if __name__ == "__main__":
     """Entry point of the script. When run directly, this script will initiate the Typer CLI."""
     app()
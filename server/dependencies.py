@@ -1,11 +1,11 @@
 from fastapi import HTTPException, status
-import motor.motor_asyncio
 from motor.motor_asyncio import AsyncIOMotorClient
-from settings import settings
+
+from database import database
 
 
 async def get_db() -> AsyncIOMotorClient:
-    """Returns a database client.
+    """Returns the database from the shared, application-wide client.
 
     Raises:
         HTTPException: If there is an error connecting to the database.
@@ -14,11 +14,8 @@ async def get_db() -> AsyncIOMotorClient:
         AsyncIOMotorClient: A database client.
     """
 
-    # Create a database client
-    client = motor.motor_asyncio.AsyncIOMotorClient(settings.MONGO_URI)
-
-    # Get the database from the client
-    db = client[settings.MONGO_DB_NAME]
+    # Get the database from the shared client (connections are pooled, so nothing is closed per request)
+    db = database.db
 
     try:
         # Yield the database client to the dependent function
@@ -29,6 +26,3 @@ async def get_db() -> AsyncIOMotorClient:
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Service unavailable",
         )
-    finally:
-        # Close the database client
-        client.close()
@@ -4,7 +4,11 @@ from loguru import logger
 from starlette.middleware.base import BaseHTTPMiddleware
 import sys
 
-from routers import plugin, graph, errors, suggestions
+from database import database
+from routers import plugin, graph, errors, suggestions, jobs, health
+from services.indexes import check_indexes
+from services.jobs import job_queue
+from settings import settings
 
 
 class LoguruMiddleware(BaseHTTPMiddleware):
@@ -68,6 +72,22 @@ app.include_router(graph.router)
 app.include_router(errors.router)
 app.include_router(suggestions.router)
 app.include_router(plugin.router)
+app.include_router(jobs.router)
+app.include_router(health.router)
+
+
+@app.on_event("startup")
+async def startup_event():
+    database.connect()
+    await check_indexes(database.db, create=settings.MONGO_ENSURE_INDEXES)
+    await job_queue.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await job_queue.stop()
+    database.close()
+
 
 if __name__ == "__main__":
     import uvicorn
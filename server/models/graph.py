@@ -315,11 +315,52 @@ class SubGraph(BaseModel):
     )
 
 
+class SubGraphSort(str, Enum):
+    errors = "errors"
+    suggestions = "suggestions"
+    progress = "progress"
+    value = "value"
+
+
+class SortOrder(str, Enum):
+    asc = "asc"
+    desc = "desc"
+
+
 class Graph(CreateGraph):
     id: PyObjectId = Field(alias="_id")
     node_classes: List[OutputItemClass]
     edge_classes: List[OutputItemClass]
     subgraphs: List[SubGraph]
+    next_cursor: Optional[str] = Field(
+        default=None,
+        description="Cursor for the next page of subgraphs. None if there are no more subgraphs.",
+    )
+    total_errors: Optional[int] = Field(
+        default=None,
+        description="Errors over all subgraphs. Only returned with the first page (see `/graph/overview/{graph_id}`).",
+    )
+    total_suggestions: Optional[int] = Field(
+        default=None,
+        description="Suggestions over all subgraphs. Only returned with the first page.",
+    )
+    start_node_count: int
+    start_edge_count: int
+    reviewed_nodes: int
+    reviewed_edges: int
+
+    class Config:
+        allow_population_by_field_name = True
+        arbitrary_types_allowed = True
+        json_encoders = {ObjectId: str}
+
+
+class GraphOverview(BaseModel):
+    id: PyObjectId = Field(alias="_id")
+    name: str
+    subgraph_count: int = Field(
+        ge=0, description="The number of nodes centring a subgraph"
+    )
     total_errors: int
     total_suggestions: int
     start_node_count: int
@@ -390,6 +431,14 @@ class GraphDataWithFocusNode(GraphData):
         json_encoders = {ObjectId: str}
 
 
+class MergeNodes(BaseModel):
+    node_ids: List[str] = Field(
+        ..., min_items=2, description="The nodes to merge into a single new node"
+    )
+    name: str
+    type: str
+
+
 class MergedNode(BaseModel):
     item_modified: bool
     new_node: Node
@@ -402,6 +451,12 @@ class MergedNode(BaseModel):
         json_encoders = {ObjectId: str}
 
 
+class AppliedErrors(BaseModel):
+    merged: List[MergedNode]
+    applied_error_ids: List[str]
+    skipped_error_ids: List[str]
+
+
 # Download
 # TODO: add Models to errors/suggestions/properties
 class DownloadTriple(BaseModel):
@@ -434,6 +489,13 @@ class DownloadMeta(BaseModel):
     updated_at: datetime
 
 
+class ExportFormat(str, Enum):
+    json = "json"
+    ndjson = "ndjson"
+    parquet = "parquet"
+    arrow = "arrow"  # Arrow IPC file format
+
+
 class GraphDownload(BaseModel):
     meta: DownloadMeta
     data: List[DownloadTriple]
@@ -0,0 +1,77 @@
+from typing import Dict, List, Optional
+from pydantic import BaseModel, Field
+from enum import Enum
+from datetime import datetime
+from bson import ObjectId
+
+from models.utils import PyObjectId
+
+
+class JobKind(str, Enum):
+    create_graph = "create_graph"
+    delete_graph = "delete_graph"
+
+
+class JobStatus(str, Enum):
+    queued = "queued"
+    running = "running"
+    completed = "completed"
+    failed = "failed"
+    cancelled = "cancelled"
+
+
+class JobPhase(str, Enum):
+    parse = "parse"
+    nodes = "nodes"
+    edges = "edges"
+    triples = "triples"
+    plugins = "plugins"
+
+
+# Relative share of overall progress attributed to each phase
+JOB_PHASE_WEIGHTS: Dict[JobPhase, int] = {
+    JobPhase.parse: 10,
+    JobPhase.nodes: 20,
+    JobPhase.edges: 20,
+    JobPhase.triples: 30,
+    JobPhase.plugins: 20,
+}
+
+# Phases of each kind of job, in the order they execute
+JOB_KIND_PHASE_WEIGHTS: Dict[JobKind, Dict[JobPhase, int]] = {
+    JobKind.create_graph: JOB_PHASE_WEIGHTS,
+    JobKind.delete_graph: {
+        JobPhase.triples: 40,
+        JobPhase.edges: 40,
+        JobPhase.nodes: 20,
+    },
+}
+
+
+class Job(BaseModel):
+    id: PyObjectId = Field(alias="_id")
+    kind: JobKind
+    graph_id: Optional[PyObjectId] = Field(
+        description="The UUID of the graph the job operates on"
+    )
+    status: JobStatus = JobStatus.queued
+    phase: Optional[JobPhase] = Field(description="The phase currently executing")
+    phases: Dict[JobPhase, int] = Field(
+        default={}, description="Percentage complete of each phase"
+    )
+    progress: int = Field(default=0, ge=0, le=100, description="Overall percentage")
+    error: Optional[str]
+    warnings: List[str] = Field(
+        default=[],
+        description="Problems that didn't fail the job (e.g. a plugin that timed out)",
+    )
+    created_at: datetime
+    updated_at: datetime
+    started_at: Optional[datetime]
+    finished_at: Optional[datetime]
+
+    class Config:
+        allow_population_by_field_name = True
+        arbitrary_types_allowed = True
+        use_enum_values = True
+        json_encoders = {ObjectId: str}
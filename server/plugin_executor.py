@@ -0,0 +1,190 @@
+"""
+The plugin executor runs plugin "execute" functions in separate worker processes so CPU-bound plugins (e.g. edit distance comparisons or node2vec training) never block the API event loop.
+
+At most `settings.PLUGIN_MAX_WORKERS` plugins run at once. Each run is given a timeout and (optionally) an address space limit; runs that exceed their timeout, or whose awaiting task is cancelled, have their process terminated.
+
+On POSIX each worker leads its own process group, so processes a plugin starts itself (e.g. a process pool) are terminated with it rather than left running. Plugins that start processes must share the address space limit between them (see `RLIMIT_AS`).
+"""
+
+import asyncio
+import multiprocessing
+import os
+import signal
+import time
+import traceback
+from typing import Dict, List, Optional
+
+from loguru import logger
+
+from plugin_manager import PluginManager
+from plugin_models import ModelOutput
+from settings import settings
+
+
+class PluginExecutionError(Exception):
+    pass
+
+
+class PluginTimeoutError(PluginExecutionError):
+    pass
+
+
+def _limit_memory(max_memory_mb: Optional[int]) -> None:
+    """Limits the address space of the current process (POSIX only)."""
+    if not max_memory_mb:
+        return
+    try:
+        import resource
+
+        limit = max_memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    except (ImportError, ValueError, OSError) as e:
+        logger.warning(f"Unable to apply plugin memory limit: {e}")
+
+
+def _run_plugin(
+    conn,
+    plugin_directory: str,
+    plugin_type: str,
+    plugin_name: str,
+    triples: List[Dict],
+    max_memory_mb: Optional[int],
+) -> None:
+    """Entry point of a plugin worker process. Sends ("ok", output) or ("error", traceback) back to the parent."""
+    try:
+        if hasattr(os, "setpgid"):
+            # Processes started by the plugin join this group, so are terminated with it
+            os.setpgid(0, 0)
+        _limit_memory(max_memory_mb)
+
+        plugin_manager = PluginManager()
+        plugin_manager.load_plugin(plugin_directory, plugin_name)
+        plugin = plugin_manager.get_plugins()[plugin_type][plugin_name]
+
+        conn.send(("ok", plugin.execute(triples=triples)))
+    except BaseException:
+        conn.send(("error", traceback.format_exc()))
+    finally:
+        conn.close()
+
+
+def _terminate(process) -> None:
+    """Terminates a worker process and any processes it started (its process group)."""
+    if hasattr(os, "killpg") and process.pid is not None:
+        try:
+            os.killpg(process.pid, signal.SIGTERM)
+        except (ProcessLookupError, PermissionError):
+            pass  # The group has already exited (or the worker hadn't created it yet)
+    if process.is_alive():
+        process.terminate()
+
+
+class PluginExecutor:
+    def __init__(self):
+        self._context = multiprocessing.get_context(settings.PLUGIN_START_METHOD)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        # Created lazily so it's bound to the running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(settings.PLUGIN_MAX_WORKERS)
+        return self._semaphore
+
+    async def execute(
+        self,
+        plugin_type: str,
+        plugin_name: str,
+        triples: List[Dict],
+        timeout: Optional[float] = None,
+        max_memory_mb: Optional[int] = None,
+    ) -> ModelOutput:
+        """
+        Executes a plugin in a worker process and returns its output.
+
+        Arguments
+        ---------
+        plugin_type: The plugin type ("edm" or "cm").
+        plugin_name: The plugin module name within `settings.PLUGIN_DIRECTORY`.
+        triples: The populated triples passed to the plugin's execute function.
+        timeout: Seconds before the run is terminated. Defaults to `settings.PLUGIN_TIMEOUT_SECONDS`.
+        max_memory_mb: Address space limit of the worker. Defaults to `settings.PLUGIN_MAX_MEMORY_MB`.
+
+        Raises
+        ------
+        PluginTimeoutError: If the plugin did not finish within the timeout.
+        PluginExecutionError: If the plugin raised an exception or its process died.
+        """
+        timeout = timeout or settings.PLUGIN_TIMEOUT_SECONDS
+        max_memory_mb = max_memory_mb or settings.PLUGIN_MAX_MEMORY_MB
+
+        async with self.semaphore:
+            receiver, sender = self._context.Pipe(duplex=False)
+            process = self._context.Process(
+                target=_run_plugin,
+                args=(
+                    sender,
+                    settings.PLUGIN_DIRECTORY,
+                    plugin_type,
+                    plugin_name,
+                    triples,
+                    max_memory_mb,
+                ),
+                name=f"plugin-{plugin_name}",
+            )
+
+            start = time.perf_counter()
+            process.start()
+            sender.close()  # Only the child writes; lets EOF be detected if it dies
+
+            try:
+                status, payload = await self._receive(
+                    receiver, process, deadline=start + timeout
+                )
+            except PluginTimeoutError:
+                logger.error(f"Plugin {plugin_name} timed out after {timeout}s")
+                raise
+            finally:
+                receiver.close()
+                _terminate(process)
+                await asyncio.get_running_loop().run_in_executor(None, process.join, 5)
+
+        logger.info(
+            f"Plugin {plugin_name} finished in {time.perf_counter() - start:.2f}s"
+        )
+
+        if status != "ok":
+            raise PluginExecutionError(f"Plugin {plugin_name} failed:\n{payload}")
+
+        return payload
+
+    @staticmethod
+    async def _receive(receiver, process, deadline: float, interval: float = 0.1):
+        """Waits for the worker's result without blocking the event loop."""
+        loop = asyncio.get_running_loop()
+
+        def exited() -> PluginExecutionError:
+            process.join(1)
+            return PluginExecutionError(
+                f"Plugin process exited unexpectedly (exit code {process.exitcode})"
+            )
+
+        while True:
+            if receiver.poll():
+                try:
+                    # Unpickling large outputs is done off the event loop
+                    return await loop.run_in_executor(None, receiver.recv)
+                except EOFError:
+                    # The pipe stays readable at EOF, so the worker has exited without a result
+                    raise exited()
+
+            if not process.is_alive():
+                raise exited()
+
+            if time.perf_counter() > deadline:
+                raise PluginTimeoutError("Plugin execution timed out")
+
+            await asyncio.sleep(interval)
+
+
+plugin_executor = PluginExecutor()
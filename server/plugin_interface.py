@@ -1,20 +1,24 @@
 """
-    The plugin interface provides the entire graph as a set of triples with properties at creation time to the Plugin class "execute" function. Each triples node/edge can have any arbitrary 'error' or 'suggestion' appended to it which will be added when provided an output from the "execute" function of [{'is_node': bool, 'id': str, 'error_type': str, 'error_value': str}] for errors and [{'is_node': bool, 'id': str, 'suggestion_type': str, 'suggestion_value': str}] for suggestions. These will then be rendered in the UI, etc.
+The plugin interface provides the entire graph as a set of triples with properties at creation time to the Plugin class "execute" function. Each triples node/edge can have any arbitrary 'error' or 'suggestion' appended to it which will be added when provided an output from the "execute" function of [{'is_node': bool, 'id': str, 'error_type': str, 'error_value': str}] for errors and [{'is_node': bool, 'id': str, 'suggestion_type': str, 'suggestion_value': str}] for suggestions. These will then be rendered in the UI, etc.
 
-    TODO:
-    - optional kwargs (these can be rendered in the client), they will require typing to render UI elements correctly.
-    - validation/guard rails to ensure it doesn't break the system when they are called at graph creation time
-    - timeout/resource utilisation ?
+TODO:
+- optional kwargs (these can be rendered in the client), they will require typing to render UI elements correctly.
+- validation/guard rails to ensure it doesn't break the system when they are called at graph creation time
+
+Plugins are executed in a separate worker process by the plugin executor (`plugin_executor.py`). A plugin may set `timeout` (seconds) and `max_memory_mb` to override the defaults in `settings`; runs that exceed them are terminated.
 
 """
 
 from abc import ABC, abstractmethod
+from typing import Optional
 from plugin_models import ModelInput, ModelOutput
 
 
 class BasePlugin(ABC):
     name: str = "Unnamed Plugin"
     description: str = "No description"
+    timeout: Optional[int] = None  # Overrides settings.PLUGIN_TIMEOUT_SECONDS
+    max_memory_mb: Optional[int] = None  # Overrides settings.PLUGIN_MAX_MEMORY_MB
 
     @abstractmethod
     def execute(self, data: ModelInput, **kwargs) -> ModelOutput:
@@ -1,4 +1,5 @@
 import os
+import sys
 import importlib.util
 
 from plugin_interface import (
@@ -17,17 +18,23 @@ class PluginManager:
                 module_name = filename[:-3]
 
                 if not module_name.startswith("_"):
-                    spec = importlib.util.spec_from_file_location(
-                        module_name, f"{path}/{filename}"
-                    )
-                    module = importlib.util.module_from_spec(spec)
-                    spec.loader.exec_module(module)
-
-                    if issubclass(module.Plugin, ErrorDetectionModelPluginInterface):
-                        self._plugins["edm"][module_name] = module.Plugin()
-
-                    if issubclass(module.Plugin, CompletionModelPluginInferface):
-                        self._plugins["cm"][module_name] = module.Plugin()
+                    self.load_plugin(path, module_name)
+
+    def load_plugin(self, path, module_name):
+        """Loads a single plugin module (e.g. inside a plugin worker process)"""
+        spec = importlib.util.spec_from_file_location(
+            module_name, f"{path}/{module_name}.py"
+        )
+        module = importlib.util.module_from_spec(spec)
+        # Registered so functions defined in plugins can be pickled (e.g. by process pools)
+        sys.modules[module_name] = module
+        spec.loader.exec_module(module)
+
+        if issubclass(module.Plugin, ErrorDetectionModelPluginInterface):
+            self._plugins["edm"][module_name] = module.Plugin()
+
+        if issubclass(module.Plugin, CompletionModelPluginInferface):
+            self._plugins["cm"][module_name] = module.Plugin()
 
     def get_plugins(self):
         return self._plugins
@@ -7,7 +7,12 @@ import sys
 sys.path.append("..")  # Adds the parent directory to the list of paths
 
 
-from plugins.node_edit_distance_plugin import simple_node_edit_distance
+from plugins.node_edit_distance_plugin import (
+    simple_node_edit_distance,
+    find_similar_nodes,
+)
+import random
+import string
 
 
 class TestEditDistance(unittest.TestCase):
@@ -60,6 +65,32 @@ class TestEditDistance(unittest.TestCase):
 
         # self.assertEqual(result, expected_result)
 
+    def test_blocking_matches_brute_force(self):
+        rng = random.Random(0)
+        names = ["".join(rng.choices("abcde", k=rng.randint(0, 7))) for _ in range(300)]
+        # Add near duplicates and shared names with different types
+        names += [
+            name[:-1] + rng.choice(string.ascii_lowercase)
+            for name in names[:50]
+            if name
+        ]
+        nodes = {
+            (name, rng.choice(["fruit", "color"])): {str(i)}
+            for i, name in enumerate(names)
+        }
+
+        for max_distance in range(0, 4):
+            brute_force = find_similar_nodes(nodes, max_distance, method="brute_force")
+            blocking = find_similar_nodes(nodes, max_distance, method="blocking")
+
+            self.assertEqual(list(blocking.keys()), list(brute_force.keys()))
+            self.assertEqual(dict(blocking), dict(brute_force))
+
+        parallel = find_similar_nodes(nodes, 4, method="parallel", workers=3)
+        brute_force = find_similar_nodes(nodes, 4, method="brute_force")
+        self.assertEqual(list(parallel.keys()), list(brute_force.keys()))
+        self.assertEqual(dict(parallel), dict(brute_force))
+
 
 if __name__ == "__main__":
     unittest.main()
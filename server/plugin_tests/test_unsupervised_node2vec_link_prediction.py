@@ -1,6 +1,8 @@
 from typing import List, Dict
 import unittest
 import random
+import os
+import tempfile
 from bson import ObjectId
 
 import sys
@@ -10,7 +12,14 @@ sys.path.append("..")  # Adds the parent directory to the list of paths
 
 from plugins.unsupervised_node2vec_link_prediction import (
     unsupervised_node2vec_link_prediction,
+    predict_links,
+    predict_links_lsh,
+    build_graph,
+    train_embeddings,
 )
+from plugins._embedding_cache import EmbeddingCache, graph_key
+from settings import settings
+import numpy as np
 
 
 def generate_triples(num: int, seed: int = 0) -> List[Dict[str, str]]:
@@ -51,10 +60,171 @@ class TestUnsupervisedNode2VecLinkPrediction(unittest.TestCase):
     def test_unsupervised_node2vec_link_prediction(self):
         triples = generate_triples(num=50)
 
-        result = unsupervised_node2vec_link_prediction(triples, sim_threshold=0.5)
+        result = unsupervised_node2vec_link_prediction(
+            triples, sim_threshold=0.5, use_cache=False
+        )
 
         print(result)
 
+    def test_predict_links_matches_pairwise(self):
+        rng = np.random.default_rng(0)
+        n = 120
+        embeddings = rng.normal(size=(n, 8))
+        embeddings[5] = 0  # Zero vectors are never similar
+        node_types = rng.choice(["fruit", "color", "shape"], size=n).tolist()
+        existing_edges = {(i, (i * 7 + 3) % n) for i in range(n)}
+        threshold = 0.6
+
+        def cosine(i, j):
+            a, b = embeddings[i], embeddings[j]
+            norm = np.linalg.norm(a) * np.linalg.norm(b)
+            return 0 if norm == 0 else a @ b / norm
+
+        linked = existing_edges | {(j, i) for i, j in existing_edges}
+        expected = {
+            (i, j)
+            for i in range(n)
+            for j in range(i + 1, n)
+            if node_types[i] != node_types[j]
+            and (i, j) not in linked
+            and cosine(i, j) > threshold
+        }
+
+        for block_size in [7, 64, 1024]:
+            links = predict_links(
+                embeddings, node_types, existing_edges, threshold, block_size=block_size
+            )
+            self.assertEqual({(i, j) for i, j, _ in links}, expected)
+
+        # Every top-k link is one of its nodes' k best candidates
+        top_k = 3
+        links = predict_links(
+            embeddings,
+            node_types,
+            existing_edges,
+            threshold,
+            top_k=top_k,
+            block_size=16,
+        )
+        self.assertTrue({(i, j) for i, j, _ in links} <= expected)
+
+        def kth_best(node):
+            return sorted(
+                (
+                    cosine(node, other)
+                    for other in range(n)
+                    if other != node
+                    and node_types[other] != node_types[node]
+                    and (node, other) not in linked
+                ),
+                reverse=True,
+            )[top_k - 1]
+
+        for i, j, _ in links:
+            self.assertTrue(cosine(i, j) >= min(kth_best(i), kth_best(j)) - 1e-5)
+
+    def test_predict_links_lsh_recall(self):
+        rng = np.random.default_rng(0)
+        n = 3000
+        centers = rng.normal(size=(300, 32))
+        embeddings = centers[rng.integers(0, 300, n)] + 0.1 * rng.normal(size=(n, 32))
+        node_types = rng.choice(["fruit", "color"], size=n).tolist()
+        existing_edges = [(i, i + 1) for i in range(n - 1)]
+
+        exact = {
+            (i, j)
+            for i, j, _ in predict_links(embeddings, node_types, existing_edges, 0.9)
+        }
+        approximate = {
+            (i, j)
+            for i, j, _ in predict_links_lsh(
+                embeddings, node_types, existing_edges, 0.9
+            )
+        }
+
+        # LSH only ever misses links; it never adds any
+        self.assertTrue(approximate <= exact)
+        self.assertGreater(len(exact & approximate) / len(exact), 0.95)
+
+    def test_predict_links_lsh_oversized_buckets(self):
+        # Skewed embeddings all hash to a few large buckets
+        rng = np.random.default_rng(0)
+        n = 1000
+        embeddings = np.ones((n, 16)) + 0.05 * rng.normal(size=(n, 16))
+        node_types = rng.choice(["fruit", "color"], size=n).tolist()
+        existing_edges = [(i, i + 1) for i in range(n - 1)]
+
+        def pairs(links):
+            return {(i, j) for i, j, _ in links}
+
+        enumerated = pairs(
+            predict_links_lsh(
+                embeddings, node_types, existing_edges, 0.995, batch_size=100
+            )
+        )
+        blocked = pairs(
+            predict_links_lsh(
+                embeddings,
+                node_types,
+                existing_edges,
+                0.995,
+                max_bucket_size=32,
+                block_size=16,
+            )
+        )
+
+        self.assertTrue(enumerated)
+        self.assertEqual(blocked, enumerated)
+        self.assertTrue(
+            blocked
+            <= pairs(predict_links(embeddings, node_types, existing_edges, 0.995))
+        )
+
+
+class TestEmbeddingCache(unittest.TestCase):
+    def test_graph_key_ignores_edge_order_and_direction(self):
+        params = {"dimensions": 64}
+        key = graph_key([("a", "b"), ("b", "c")], params)
+
+        self.assertEqual(key, graph_key([("c", "b"), ("b", "a"), ("a", "b")], params))
+        self.assertNotEqual(key, graph_key([("a", "b"), ("b", "d")], params))
+        self.assertNotEqual(
+            key, graph_key([("a", "b"), ("b", "c")], {"dimensions": 32})
+        )
+
+    def test_least_recently_used_entries_are_evicted(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = EmbeddingCache(directory, max_mb=1)
+            embeddings = np.zeros((1024, 100), dtype=np.float32)  # ~400KB each
+
+            cache.put("a", embeddings)
+            cache.put("b", embeddings)
+            os.utime(os.path.join(directory, "a.npy"), (0, 0))
+            os.utime(os.path.join(directory, "b.npy"), (1, 1))
+            cache.get("a")  # "a" is now the most recently used
+            cache.put("c", embeddings)
+
+            self.assertIsNotNone(cache.get("a"))
+            self.assertIsNone(cache.get("b"))
+            np.testing.assert_array_equal(cache.get("c"), embeddings)
+
+    def test_unchanged_graph_reuses_embeddings(self):
+        triples = generate_triples(num=50)
+        directory = settings.EMBEDDING_CACHE_DIRECTORY
+        with tempfile.TemporaryDirectory() as cache_directory:
+            settings.EMBEDDING_CACHE_DIRECTORY = cache_directory
+            try:
+                first = train_embeddings(build_graph(triples), num_walks=5)
+                # Re-ordered triples describe the same graph
+                second = train_embeddings(build_graph(triples[::-1]), num_walks=5)
+            finally:
+                settings.EMBEDDING_CACHE_DIRECTORY = directory
+
+        G = build_graph(triples[::-1])
+        first_by_node = dict(zip(build_graph(triples).nodes, first.tolist()))
+        second_by_node = dict(zip(G.nodes, second.tolist()))
+        self.assertEqual(first_by_node, second_by_node)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,98 @@
+"""
+A persistent, size bounded cache of node embeddings for completion plugins.
+
+Embeddings are stored as `.npy` files named by a SHA-256 key of the graph's content and the training hyperparameters, so re-running a plugin on an unchanged (or re-uploaded) graph skips training. Files are loaded memory-mapped and evicted least recently used first (by modification time, which is refreshed on every hit) once the cache exceeds its size limit.
+
+Prefixed with `_` so the Plugin Manager doesn't load it as a plugin.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+from settings import settings
+
+
+def graph_key(edges: Iterable[Tuple[Any, Any]], params: Dict[str, Any]) -> str:
+    """
+    Returns a stable hash of an undirected edge set and the hyperparameters used to embed it.
+
+    Edges are canonicalised (endpoints and edges sorted, duplicates removed) so edge order and direction don't affect the key.
+    """
+    canonical_edges = sorted({tuple(sorted((str(u), str(v)))) for u, v in edges})
+    digest = hashlib.sha256()
+    digest.update(json.dumps(params, sort_keys=True).encode("utf-8"))
+    for u, v in canonical_edges:
+        digest.update(json.dumps([u, v]).encode("utf-8"))
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, directory: str, max_mb: int):
+        self.directory = directory
+        self.max_bytes = max_mb * 1024 * 1024
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.npy")
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """Returns the (read-only, memory-mapped) embeddings cached under `key`, or None."""
+        path = self._path(key)
+        try:
+            embeddings = np.load(path, mmap_mode="r")
+            os.utime(path)  # Mark as recently used
+        except (FileNotFoundError, ValueError, OSError):
+            return None
+        return embeddings
+
+    def put(self, key: str, embeddings: np.ndarray) -> None:
+        """Stores embeddings under `key`, then evicts the least recently used entries over the size limit."""
+        os.makedirs(self.directory, exist_ok=True)
+
+        # Written to a temporary file first so concurrent readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, np.ascontiguousarray(embeddings))
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        self.evict(keep=key)
+
+    def evict(self, keep: Optional[str] = None) -> None:
+        """Removes least recently used entries until the cache fits within its size limit."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".npy"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == self._path(keep or ""):
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """Returns the configured embedding cache, or None if caching is disabled."""
+    if not settings.EMBEDDING_CACHE_DIRECTORY:
+        return None
+    return EmbeddingCache(
+        directory=settings.EMBEDDING_CACHE_DIRECTORY,
+        max_mb=settings.EMBEDDING_CACHE_MAX_MB,
+    )
@@ -5,9 +5,15 @@ from plugin_models import ModelInput, ModelOutput, Error
 import models.graph as graph_model
 
 import Levenshtein
-from typing import List, Dict, Tuple, Set
+from typing import List, Dict, Optional, Tuple, Set
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 import itertools
+import multiprocessing
+import os
+import sys
+
+from settings import settings
 
 
 def node_edit_distance(triples: List[Dict], max_distance: int = 1) -> List[Dict]:
@@ -69,13 +75,15 @@ def node_edit_distance(triples: List[Dict], max_distance: int = 1) -> List[Dict]
     return output_errors
 
 
-def simple_node_edit_distance(triples: List[Dict], max_distance: int = 1) -> List[Dict]:
+def simple_node_edit_distance(
+    triples: List[Dict], max_distance: int = 1, workers: Optional[int] = None
+) -> List[Dict]:
     """
     Identifies nodes with similar names using Levenshtein edit distance - does not provide any information except the names that were detected as similar.
     Used for detecting potential typographical errors, synonyms or alternative spellings.
     """
     nodes = group_nodes_by_name_type(triples)
-    errors = find_similar_nodes(nodes, max_distance)
+    errors = find_similar_nodes(nodes, max_distance, workers=workers)
     output_errors = format_errors(errors, nodes)
 
     return output_errors
@@ -90,7 +98,53 @@ def group_nodes_by_name_type(triples: List[Dict]) -> Dict[Tuple[str, str], Set[s
     return nodes
 
 
+# Deletion neighbourhoods grow as O(len(name) ** max_distance), so larger distances use brute force.
+MAX_BLOCKING_DISTANCE = 3
+# Below this many unique names the process pool start up outweighs sharding the brute force comparison.
+MIN_PARALLEL_NAMES = 2_000
+
+
 def find_similar_nodes(
+    nodes: Dict[Tuple[str, str], List[str]],
+    max_distance: int,
+    method: str = "auto",
+    workers: Optional[int] = None,
+) -> Dict[Tuple[str, str], Set[Tuple[str, str]]]:
+    """
+    Finds all pairs of (name, type) nodes whose names are within `max_distance` edits of each other.
+
+    Arguments
+    ---------
+    nodes: Mapping of (name, type) to node ids.
+    max_distance: Maximum Levenshtein distance between similar names.
+    method: "blocking" (sub-quadratic candidate generation), "brute_force" (all pairs), "parallel" (all pairs sharded across processes) or "auto" (blocking when `max_distance` <= MAX_BLOCKING_DISTANCE, otherwise parallel for large inputs).
+    workers: Number of processes used by the parallel method. Defaults to the number of CPUs.
+
+    Returns
+    -------
+    Mapping of each (name, type) node to the set of nodes it is similar to. All methods return identical results.
+    """
+    workers = workers or os.cpu_count() or 1
+
+    if method == "auto":
+        if max_distance <= MAX_BLOCKING_DISTANCE:
+            method = "blocking"
+        elif workers > 1 and len(nodes) >= MIN_PARALLEL_NAMES:
+            method = "parallel"
+        else:
+            method = "brute_force"
+
+    if method == "brute_force":
+        return find_similar_nodes_brute_force(nodes, max_distance)
+    if method == "blocking":
+        return find_similar_nodes_blocking(nodes, max_distance)
+    if method == "parallel":
+        return find_similar_nodes_parallel(nodes, max_distance, workers)
+
+    raise ValueError(f"Unknown method: {method}")
+
+
+def find_similar_nodes_brute_force(
     nodes: Dict[Tuple[str, str], List[str]], max_distance: int
 ) -> Dict[Tuple[str, str], Set[Tuple[str, str]]]:
     unique_nodes = list(nodes.keys())  # [(node_name, node_type), ...]
@@ -106,6 +160,229 @@ def find_similar_nodes(
     return errors
 
 
+def deletion_neighbourhood(name: str, max_distance: int) -> Set[str]:
+    """Returns every string obtained by deleting up to `max_distance` characters from `name` (including `name`)."""
+    variants = {name}
+    frontier = {name}
+    for _ in range(max_distance):
+        frontier = {
+            variant[:i] + variant[i + 1 :]
+            for variant in frontier
+            for i in range(len(variant))
+        }
+        variants |= frontier
+    return variants
+
+
+def find_similar_name_pairs(
+    names: List[str], max_distance: int
+) -> Set[Tuple[int, int]]:
+    """
+    Finds index pairs (i < j) of distinct names within `max_distance` edits using a deletion-neighbourhood (SymSpell-style) index.
+
+    If two names are within k edits, deleting at most k characters from each yields a common string, so only names sharing a deletion variant need to be compared. This is exact; candidates are verified with `Levenshtein.distance`.
+    """
+    index = defaultdict(list)
+    for i, name in enumerate(names):
+        for variant in deletion_neighbourhood(name, max_distance):
+            index[variant].append(i)
+
+    checked = set()
+    pairs = set()
+    for bucket in index.values():
+        # Buckets are in ascending index order, so combinations yield (i < j)
+        for pair in itertools.combinations(bucket, 2):
+            if pair in checked:
+                continue
+            checked.add(pair)
+
+            i, j = pair
+            if (
+                abs(len(names[i]) - len(names[j])) <= max_distance
+                and Levenshtein.distance(names[i], names[j]) <= max_distance
+            ):
+                pairs.add(pair)
+
+    return pairs
+
+
+def compare_name_shard(
+    names: List[str], shard: int, shards: int, max_distance: int
+) -> List[Tuple[int, int]]:
+    """
+    Brute force compares the rows `i` of the upper triangle where `i % shards == shard` and returns the index pairs (i < j) within `max_distance`.
+
+    Rows are interleaved, rather than split into contiguous blocks, so each shard receives a similar number of comparisons.
+    """
+    pairs = []
+    for i in range(shard, len(names), shards):
+        name1 = names[i]
+        for j in range(i + 1, len(names)):
+            if Levenshtein.distance(name1, names[j]) <= max_distance:
+                pairs.append((i, j))
+    return pairs
+
+
+# Smallest address space a shard process is started with; it must hold a Python interpreter and a copy of the names
+MIN_SHARD_MEMORY_BYTES = 512 * 1024 * 1024
+
+
+def address_space_limit() -> Optional[int]:
+    """The address space limit (RLIMIT_AS) of this process in bytes, e.g. as set by the plugin executor, or None if unlimited."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    soft, _ = resource.getrlimit(resource.RLIMIT_AS)
+    return None if soft == resource.RLIM_INFINITY else soft
+
+
+def address_space_used() -> int:
+    """The address space this process currently uses in bytes (0 where it can't be read)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+
+def shard_memory_budget(workers: int) -> Tuple[int, Optional[int]]:
+    """
+    Splits what's left of this process's address space limit between shard processes, so the pool counts against the plugin's memory limit rather than each shard inheriting all of it.
+
+    Returns
+    -------
+    The number of shard processes to start (fewer than `workers` if the budget can't give each at least MIN_SHARD_MEMORY_BYTES, and 0 if it can't fit two), and each one's address space limit (None if unlimited).
+    """
+    limit = address_space_limit()
+    if limit is None:
+        return workers, None
+    remaining = limit - address_space_used()
+    shards = min(workers, max(0, remaining) // MIN_SHARD_MEMORY_BYTES)
+    if shards < 2:
+        return 0, None
+    return shards, remaining // shards
+
+
+def init_shard_worker(memory_limit: Optional[int]) -> None:
+    if memory_limit is not None:
+        import resource
+
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+
+
+def find_similar_name_pairs_parallel(
+    names: List[str], max_distance: int, workers: int
+) -> Set[Tuple[int, int]]:
+    """
+    Finds index pairs (i < j) of names within `max_distance` edits, sharding the brute force comparison across a process pool.
+
+    Shards are spawned (rather than forked, which would start each at this process's size) and share this process's remaining memory limit. If the limit can't fit two shards, names are compared in this process.
+    """
+    shards, memory_limit = shard_memory_budget(min(workers, len(names)) or 1)
+    if shards < 2:
+        return set(compare_name_shard(names, 0, 1, max_distance))
+
+    # Spawned workers start with this path, and need the plugin directory on it to unpickle this module's functions
+    plugin_directory = os.path.dirname(os.path.abspath(__file__))
+    if plugin_directory not in sys.path:
+        sys.path.append(plugin_directory)
+
+    with ProcessPoolExecutor(
+        max_workers=shards,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_shard_worker,
+        initargs=(memory_limit,),
+    ) as executor:
+        results = executor.map(
+            compare_name_shard,
+            itertools.repeat(names, shards),
+            range(shards),
+            itertools.repeat(shards, shards),
+            itertools.repeat(max_distance, shards),
+        )
+        return {pair for shard_pairs in results for pair in shard_pairs}
+
+
+def find_similar_nodes_parallel(
+    nodes: Dict[Tuple[str, str], List[str]], max_distance: int, workers: int
+) -> Dict[Tuple[str, str], Set[Tuple[str, str]]]:
+    name_to_nodes, names = group_keys_by_name(nodes)
+    return expand_name_pairs(
+        nodes,
+        name_to_nodes,
+        names,
+        find_similar_name_pairs_parallel(names, max_distance, workers),
+    )
+
+
+def find_similar_nodes_blocking(
+    nodes: Dict[Tuple[str, str], List[str]], max_distance: int
+) -> Dict[Tuple[str, str], Set[Tuple[str, str]]]:
+    name_to_nodes, names = group_keys_by_name(nodes)
+    return expand_name_pairs(
+        nodes,
+        name_to_nodes,
+        names,
+        find_similar_name_pairs(names, max_distance),
+    )
+
+
+def group_keys_by_name(
+    nodes: Dict[Tuple[str, str], List[str]],
+) -> Tuple[Dict[str, List[Tuple[str, str]]], List[str]]:
+    """Groups (name, type) keys by name. Returns the groups and the unique names, both in key order."""
+    name_to_nodes = defaultdict(list)
+    for node in nodes:
+        name_to_nodes[node[0]].append(node)
+    return name_to_nodes, list(name_to_nodes.keys())
+
+
+def expand_name_pairs(
+    nodes: Dict[Tuple[str, str], List[str]],
+    name_to_nodes: Dict[str, List[Tuple[str, str]]],
+    names: List[str],
+    name_pairs: Set[Tuple[int, int]],
+) -> Dict[Tuple[str, str], Set[Tuple[str, str]]]:
+    """Expands similar name index pairs into similar (name, type) keys, ordered as the brute force comparison would output them."""
+    errors = defaultdict(set)
+
+    # Nodes sharing a name (with different types) are always similar
+
+    for same_name_nodes in name_to_nodes.values():
+        for node1, node2 in itertools.combinations(same_name_nodes, 2):
+            errors[node1].add(node2)
+            errors[node2].add(node1)
+
+    for i, j in name_pairs:
+        for node1 in name_to_nodes[names[i]]:
+            for node2 in name_to_nodes[names[j]]:
+                errors[node1].add(node2)
+                errors[node2].add(node1)
+
+    return order_like_brute_force(errors, list(nodes.keys()))
+
+
+def order_like_brute_force(
+    errors: Dict[Tuple[str, str], Set[Tuple[str, str]]],
+    unique_nodes: List[Tuple[str, str]],
+) -> Dict[Tuple[str, str], Set[Tuple[str, str]]]:
+    """
+    Orders similar node keys as the brute force comparison would have inserted them, so errors are output in the same order.
+
+    A node is first inserted in the outer iteration of its earliest partner (or its own, if earlier), and within an iteration the outer node precedes its partners.
+    """
+    position = {node: i for i, node in enumerate(unique_nodes)}
+
+    def first_inserted(node: Tuple[str, str]) -> Tuple[int, int]:
+        earliest_partner = min(position[partner] for partner in errors[node])
+        return (min(position[node], earliest_partner), position[node])
+
+    return defaultdict(
+        set, ((node, errors[node]) for node in sorted(errors, key=first_inserted))
+    )
+
+
 def format_errors(
     errors: Dict[Tuple[str, str], Set[Tuple[str, str]]],
     nodes: Dict[Tuple[str, str], List[str]],
@@ -152,6 +429,11 @@ class Plugin(ErrorDetectionModelPluginInterface):
     )
 
     def execute(self, triples: List[Dict]) -> ModelOutput:
-        error_output = simple_node_edit_distance(triples=triples)
+        # Distances above MAX_BLOCKING_DISTANCE are compared across a process pool for large graphs
+        error_output = simple_node_edit_distance(
+            triples=triples,
+            max_distance=settings.EDIT_DISTANCE_MAX_DISTANCE,
+            workers=settings.EDIT_DISTANCE_WORKERS,
+        )
 
         return ModelOutput(type="errors", data=error_output)
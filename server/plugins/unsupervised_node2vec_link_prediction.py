@@ -4,21 +4,251 @@ from plugin_interface import (
 from plugin_models import ModelInput, ModelOutput, Suggestion
 import models.graph as graph_model
 
-from typing import List, Dict
+from typing import List, Dict, Iterable, Iterator, Optional, Tuple
+from collections import defaultdict
+import heapq
 
 import networkx as nx
+import numpy as np
 from node2vec import Node2Vec
-from sklearn.metrics.pairwise import cosine_similarity
 
+from plugins._embedding_cache import get_embedding_cache, graph_key
 
-def unsupervised_node2vec_link_prediction(
-    triples: List[Dict], sim_threshold: float = 0.99
-):
+
+def normalise_rows(embeddings: np.ndarray) -> np.ndarray:
+    """Scales each embedding to unit length so dot products are cosine similarities. Zero vectors are left as zero."""
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.where(norms == 0, 1, norms)
+
+
+def predict_links(
+    embeddings: np.ndarray,
+    node_types: List[str],
+    existing_edges: Iterable[Tuple[int, int]],
+    sim_threshold: float = 0.99,
+    top_k: Optional[int] = None,
+    block_size: int = 1024,
+) -> List[Tuple[int, int, float]]:
     """
-    Unsupervised link prediction using node2vec graph embeddings. Returns links that may exist between two nodes.
+    Finds pairs of nodes whose embeddings have a cosine similarity above `sim_threshold`.
+
+    Similarities are computed as blocked matrix products over the normalised embedding matrix, so at most `block_size` x n similarities are held in memory at once. Pairs of the same type, existing edges and self pairs are masked out.
+
+    Arguments
+    ---------
+    embeddings: Matrix of node embeddings (n x dimensions).
+    node_types: The type of each node (row).
+    existing_edges: Index pairs of nodes that are already linked (in either direction).
+    sim_threshold: Minimum (exclusive) cosine similarity of a predicted link.
+    top_k: If provided, only each node's `top_k` most similar candidates are kept.
+    block_size: Number of rows compared per matrix product.
+
+    Returns
+    -------
+    Sorted (i, j, similarity) tuples with i < j.
+    """
+    vectors = normalise_rows(embeddings)
+    n = len(vectors)
+    if n < 2:
+        return []
+
+    _, types = np.unique(np.asarray(node_types, dtype=object), return_inverse=True)
+
+    # Existing edges in both directions, sorted by row so each block's edges are a contiguous slice
+    edges = np.array(
+        [(i, j) for i, j in existing_edges for i, j in ((i, j), (j, i))],
+        dtype=np.int64,
+    ).reshape(-1, 2)
+    edges = edges[np.argsort(edges[:, 0], kind="stable")]
+
+    links = {}
+    for start in range(0, n, block_size):
+        end = min(start + block_size, n)
+        rows = np.arange(start, end)
+
+        # Without top_k only the upper triangle (j > i) is needed; top_k requires every candidate of a row
+        col_start = start if top_k is None else 0
+        similarities = vectors[start:end] @ vectors[col_start:].T
+
+        if top_k is None:
+            cols = np.arange(col_start, n)
+            similarities[cols[None, :] <= rows[:, None]] = -np.inf
+        else:
+            similarities[rows - start, rows] = -np.inf
+        similarities[types[start:end, None] == types[None, col_start:]] = -np.inf
+
+        lo, hi = np.searchsorted(edges[:, 0], [start, end])
+        block_edges = edges[lo:hi]
+        block_edges = block_edges[block_edges[:, 1] >= col_start]
+        similarities[block_edges[:, 0] - start, block_edges[:, 1] - col_start] = -np.inf
+
+        if top_k is None:
+            block_rows, block_cols = np.nonzero(similarities > sim_threshold)
+        else:
+            k = min(top_k, n)
+            candidates = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+            candidate_sims = np.take_along_axis(similarities, candidates, axis=1)
+            block_rows, ranks = np.nonzero(candidate_sims > sim_threshold)
+            block_cols = candidates[block_rows, ranks]
+
+        for r, c in zip(block_rows.tolist(), block_cols.tolist()):
+            i, j = sorted((r + start, c + col_start))
+            links[(i, j)] = float(similarities[r, c])
+
+    return sorted((i, j, sim) for (i, j), sim in links.items())
+
+
+# Above this many nodes, candidates come from the LSH index rather than all pairs. With
+# `benchmarks/benchmark_link_prediction_recall.py` (synthetic embeddings, one core) the
+# exact path took 3.7s/7.5s/23.3s/84.3s at 20k/30k/50k/100k nodes and LSH 5.3s/6.1s/12.9s/25.1s,
+# both with full recall: they cross over at ~30k nodes, and LSH is clearly faster from 50k.
+LSH_MIN_NODES = 50_000
+
+
+def lsh_buckets(
+    vectors: np.ndarray, n_tables: int, n_bits: int, seed: int = 0
+) -> Iterator[np.ndarray]:
+    """
+    Yields the rows sharing a bucket in each of `n_tables` random hyperplane (SimHash) hash tables.
+
+    Each table hashes a vector to the signs of its projections onto `n_bits` random hyperplanes. Two vectors at angle θ share a bit with probability 1 - θ/π, so similar embeddings are likely to share a bucket in at least one table.
+    """
+    rng = np.random.default_rng(seed)
+    weights = 1 << np.arange(n_bits, dtype=np.int64)
+    for _ in range(n_tables):
+        planes = rng.standard_normal((vectors.shape[1], n_bits)).astype(np.float32)
+        codes = ((vectors @ planes) > 0).astype(np.int64) @ weights
+        order = np.argsort(codes, kind="stable")
+        boundaries = np.flatnonzero(np.diff(codes[order])) + 1
+        for bucket in np.split(order, boundaries):
+            if len(bucket) > 1:
+                yield bucket
+
+
+def keep_top_k(
+    links: Dict[Tuple[int, int], float], top_k: int
+) -> Dict[Tuple[int, int], float]:
+    """Keeps the links that are among the `top_k` most similar links of either of their nodes."""
+    by_node = defaultdict(list)
+    for (i, j), sim in links.items():
+        by_node[i].append((sim, j))
+        by_node[j].append((sim, i))
+
+    kept = {}
+    for node, candidates in by_node.items():
+        for sim, other in heapq.nlargest(top_k, candidates):
+            kept[(min(node, other), max(node, other))] = sim
+    return kept
+
+
+def bucket_pairs(size: int, batch_size: int) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Yields the index pairs (a, b) with a < b of a bucket of `size` rows, in chunks of about `batch_size` pairs.
+
+    Chunks hold whole rows of the upper triangle, so a chunk exceeds `batch_size` only if a single row does (i.e. `size` > `batch_size`).
+    """
+    counts = np.arange(size - 1, 0, -1)  # Pairs of each row with the rows after it
+    ends = np.cumsum(counts)
+    start = 0
+    while start < size - 1:
+        offset = ends[start - 1] if start else 0
+        stop = int(np.searchsorted(ends, offset + batch_size, side="right"))
+        stop = min(max(stop, start + 1), size - 1)
+        chunk_counts = counts[start:stop]
+        a = np.repeat(np.arange(start, stop), chunk_counts)
+        row_offsets = np.repeat(np.cumsum(chunk_counts) - chunk_counts, chunk_counts)
+        b = a + 1 + np.arange(len(a)) - row_offsets
+        yield a, b
+        start = stop
+
+
+def predict_links_lsh(
+    embeddings: np.ndarray,
+    node_types: List[str],
+    existing_edges: Iterable[Tuple[int, int]],
+    sim_threshold: float = 0.99,
+    top_k: Optional[int] = None,
+    n_tables: int = 16,
+    n_bits: Optional[int] = None,
+    seed: int = 0,
+    batch_size: int = 1_000_000,
+    max_bucket_size: int = 1024,
+    block_size: int = 1024,
+) -> List[Tuple[int, int, float]]:
+    """
+    Approximate version of `predict_links` that only scores pairs sharing an LSH bucket.
+
+    Arguments
+    ---------
+    n_tables: Number of hash tables. More tables increase recall (and work).
+    n_bits: Hyperplanes per table. Defaults to log2(n / 64), i.e. buckets of ~64 nodes.
+    seed: Seed of the random hyperplanes.
+    batch_size: Number of candidate pairs scored at once.
+    max_bucket_size: Buckets with more rows (e.g. from skewed embeddings) are scored with blocked matrix products, as in `predict_links`, rather than enumerating their pairs.
+    block_size: Number of rows of an oversized bucket compared per matrix product.
+
+    Other arguments and the return value are as for `predict_links`. Links missed by the index are the only difference from the exact path. Memory is bounded by `batch_size` pairs and `block_size` x `max(bucket sizes)` similarities, whatever the bucket sizes.
     """
+    vectors = normalise_rows(embeddings)
+    n = len(vectors)
+    if n < 2:
+        return []
 
-    # Create graph from triples, with type information as node attributes
+    _, types = np.unique(np.asarray(node_types, dtype=object), return_inverse=True)
+    edge_keys = np.unique(
+        np.array([min(i, j) * n + max(i, j) for i, j in existing_edges], dtype=np.int64)
+    )
+    if n_bits is None:
+        n_bits = max(1, int(round(np.log2(n / 64))))
+
+    links = {}
+
+    def keep_links(i: np.ndarray, j: np.ndarray, sims: np.ndarray) -> None:
+        keep = (types[i] != types[j]) & ~np.isin(i * n + j, edge_keys)
+        for a, b, sim in zip(i[keep].tolist(), j[keep].tolist(), sims[keep].tolist()):
+            links[(a, b)] = sim
+
+    def score(i: np.ndarray, j: np.ndarray) -> None:
+        sims = np.einsum("ij,ij->i", vectors[i], vectors[j])
+        keep = sims > sim_threshold
+        keep_links(i[keep], j[keep], sims[keep])
+
+    def score_blocked(rows: np.ndarray) -> None:
+        bucket_vectors = vectors[rows]
+        for start in range(0, len(rows), block_size):
+            similarities = bucket_vectors[start : start + block_size] @ bucket_vectors.T
+            r, c = np.nonzero(similarities > sim_threshold)
+            r_rows = r + start
+            upper = c > r_rows
+            keep_links(rows[r_rows[upper]], rows[c[upper]], similarities[r, c][upper])
+
+    # Zero vectors are never similar to anything, but would all share a bucket
+    nonzero = np.flatnonzero(np.any(vectors != 0, axis=1))
+
+    pending, pending_size = [], 0
+    for bucket in lsh_buckets(vectors[nonzero], n_tables, n_bits, seed):
+        rows = nonzero[np.sort(bucket)]
+        if len(rows) > max_bucket_size:
+            score_blocked(rows)
+            continue
+        for a, b in bucket_pairs(len(rows), batch_size):
+            pending.append((rows[a], rows[b]))
+            pending_size += len(a)
+            if pending_size >= batch_size:
+                score(*(np.concatenate(x) for x in zip(*pending)))
+                pending, pending_size = [], 0
+    if pending:
+        score(*(np.concatenate(x) for x in zip(*pending)))
+
+    if top_k is not None:
+        links = keep_top_k(links, top_k)
+
+    return sorted((i, j, sim) for (i, j), sim in links.items())
+
+
+def build_graph(triples: List[Dict]) -> nx.Graph:
+    """Creates an undirected graph from triples, with type and id information as node attributes."""
     G = nx.Graph()
     node_types = {}
     node_ids = {}
@@ -32,56 +262,120 @@ def unsupervised_node2vec_link_prediction(
     nx.set_node_attributes(G, node_types, "type")
     nx.set_node_attributes(G, node_ids, "id")
 
+    return G
+
+
+def train_embeddings(
+    G: nx.Graph,
+    dimensions: int = 64,
+    walk_length: int = 30,
+    num_walks: int = 200,
+    workers: int = 4,
+    use_cache: bool = True,
+) -> np.ndarray:
+    """
+    Trains node2vec on the graph and returns the embedding matrix, with rows in `G.nodes` order.
+
+    Embeddings are cached by the graph's edges and the hyperparameters, so an unchanged graph is only trained once (see `plugins/_embedding_cache.py`).
+    """
+    params = {
+        "model": "node2vec",
+        "dimensions": dimensions,
+        "walk_length": walk_length,
+        "num_walks": num_walks,
+        "window": 10,
+        "min_count": 1,
+        "batch_words": 4,
+    }
+
+    # Cached rows are stored in sorted node order, so they don't depend on triple order
+    sorted_nodes = sorted(G.nodes, key=str)
+    node_index = {node: i for i, node in enumerate(sorted_nodes)}
+    rows = [node_index[node] for node in G.nodes]
+
+    cache = get_embedding_cache() if use_cache else None
+    if cache is not None:
+        key = graph_key(G.edges, params)
+        cached = cache.get(key)
+        if cached is not None and cached.shape == (len(sorted_nodes), dimensions):
+            print("Using cached node2vec embeddings")
+            return np.asarray(cached[rows])
+
     # Initialize Node2Vec model
-    node2vec = Node2Vec(G, dimensions=64, walk_length=30, num_walks=200, workers=4)
+    node2vec = Node2Vec(
+        G,
+        dimensions=dimensions,
+        walk_length=walk_length,
+        num_walks=num_walks,
+        workers=workers,
+    )
 
     # Fit Node2Vec model
-    model = node2vec.fit(window=10, min_count=1, batch_words=4)
-    # print("model trained")
+    model = node2vec.fit(
+        window=params["window"],
+        min_count=params["min_count"],
+        batch_words=params["batch_words"],
+    )
 
     # Get node embeddings
-    embeddings = model.wv
-    # print("got embeddings")
-
-    # Perform link prediction
-    def predict_link(node1, node2, threshold=sim_threshold) -> bool:
-        return (
-            cosine_similarity(
-                embeddings[node1].reshape(1, -1), embeddings[node2].reshape(1, -1)
-            )
-            > threshold
-        )
+    embeddings = np.vstack([model.wv[node] for node in sorted_nodes])
+
+    if cache is not None:
+        cache.put(key, embeddings)
+
+    return embeddings[rows]
+
+
+def unsupervised_node2vec_link_prediction(
+    triples: List[Dict],
+    sim_threshold: float = 0.99,
+    top_k: Optional[int] = None,
+    block_size: int = 1024,
+    candidates: str = "auto",
+    use_cache: bool = True,
+):
+    """
+    Unsupervised link prediction using node2vec graph embeddings. Returns links that may exist between two nodes.
+
+    `candidates` is "exact" (all pairs), "lsh" (approximate nearest neighbours) or "auto" (LSH for graphs with at least LSH_MIN_NODES nodes). `use_cache` is passed to `train_embeddings`.
+    """
+
+    G = build_graph(triples)
+    embeddings = train_embeddings(G, use_cache=use_cache)
 
     # Get all nodes
     nodes = list(G.nodes)
 
-    # Predict link between all pairs of nodes (excluding pairs with the same name and those already in the graph)
+    if candidates == "auto":
+        candidates = "lsh" if len(nodes) >= LSH_MIN_NODES else "exact"
+
+    # Predict links between all pairs of nodes (excluding pairs with the same type and those already in the graph)
+    node_index = {node: i for i, node in enumerate(nodes)}
+    prediction_inputs = dict(
+        embeddings=embeddings,
+        node_types=[G.nodes[node]["type"] for node in nodes],
+        existing_edges=[(node_index[u], node_index[v]) for u, v in G.edges],
+        sim_threshold=sim_threshold,
+        top_k=top_k,
+    )
+    if candidates == "lsh":
+        links = predict_links_lsh(**prediction_inputs)
+    elif candidates == "exact":
+        links = predict_links(**prediction_inputs, block_size=block_size)
+    else:
+        raise ValueError(f"Unknown candidates: {candidates}")
+
     predicted_links_set = set()
-    for i in range(len(nodes)):
-        for j in range(i + 1, len(nodes)):
-            if (
-                nodes[i] != nodes[j]
-                and not G.has_edge(nodes[i], nodes[j])
-                and G.nodes[nodes[i]]["type"] != G.nodes[nodes[j]]["type"]
-            ):
-                if predict_link(nodes[i], nodes[j]):
-                    link_tuple = tuple(
-                        sorted(
-                            [
-                                (
-                                    G.nodes[nodes[i]]["id"],
-                                    nodes[i],
-                                    G.nodes[nodes[i]]["type"],
-                                ),
-                                (
-                                    G.nodes[nodes[j]]["id"],
-                                    nodes[j],
-                                    G.nodes[nodes[j]]["type"],
-                                ),
-                            ]
-                        )
-                    )
-                    predicted_links_set.add(link_tuple)
+    for i, j, _ in links:
+        link_tuple = tuple(
+            sorted(
+                [
+                    (G.nodes[nodes[i]]["id"], nodes[i], G.nodes[nodes[i]]["type"]),
+                    (G.nodes[nodes[j]]["id"], nodes[j], G.nodes[nodes[j]]["type"]),
+                ]
+            )
+        )
+        predicted_links_set.add(link_tuple)
 
     predicted_links = [
         {
@@ -1,10 +1,11 @@
 from typing import List, Dict, Tuple, Optional, Union, Generator, Any
 from collections import Counter
-from fastapi import APIRouter, Depends, HTTPException, status, Query, Body
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Body, Request
 from dependencies import get_db
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from pymongo.errors import PyMongoError
 from bson import ObjectId
+from bson.errors import InvalidId
 import traceback
 import random
 from enum import Enum
@@ -14,12 +15,51 @@ import string
 
 from models import graph as graph_model
 from services.graph import get_item_classes
+from services.cache import cached_response
+from services.merge import apply_errors
 
 router = APIRouter(prefix="/errors", tags=["Errors"])
 
 
 @router.get("/{graph_id}")
-async def get_errors(graph_id: str, db: AssertionError = Depends(get_db)):
+async def get_errors(
+    graph_id: str, request: Request, db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Fetches all errors on the current graph. Responses are cached per graph version."""
+    graph_id = ObjectId(graph_id)
+    return await cached_response(
+        request=request,
+        graph_id=graph_id,
+        db=db,
+        compute=lambda: fetch_errors(graph_id=graph_id, db=db),
+    )
+
+
+@router.post("/apply/{graph_id}")
+async def apply_errors_endpoint(
+    graph_id: str,
+    error_ids: List[str] = Body(..., embed=True),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+) -> graph_model.AppliedErrors:
+    """Applies the merge actions of accepted node errors in a single batch"""
+    try:
+        graph_id = ObjectId(graph_id)
+        error_ids = [ObjectId(_id) for _id in error_ids]
+    except InvalidId:
+        raise HTTPException(status_code=400, detail="Invalid graph or error id")
+
+    if not await db["graphs"].find_one({"_id": graph_id}, {"_id": 1}):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Graph not found"
+        )
+    return await apply_errors(
+        graph_id=graph_id,
+        error_ids=error_ids,
+        db=db,
+    )
+
+
+async def fetch_errors(graph_id: ObjectId, db: AsyncIOMotorDatabase):
     """Fetches all errors on the current graph
 
     TODO
@@ -1,10 +1,16 @@
 from typing import List, Dict, Optional
-from fastapi import APIRouter, Depends, Query, Body, HTTPException
+from fastapi import APIRouter, Depends, Query, Body, HTTPException, Request
+from fastapi.responses import FileResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from dependencies import get_db
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from bson import ObjectId
+from bson.errors import InvalidId
 
+import os
 import random
+import shutil
+import tempfile
 
 from models import graph as graph_model
 from models.misc import (
@@ -20,7 +26,12 @@ from models.misc import (
 import services.create_graph as create_graph_services
 import services.graph as graph_services
 import services.item as item_services
-
+import services.merge as merge_services
+import services.export as export_services
+from settings import settings
+from services.neighbourhood import refresh_neighbourhoods
+from services.degree import refresh_degrees
+from services.cache import bump_graph_version, cached_response
 
 router = APIRouter(prefix="/graph", tags=["Graph"])
 
@@ -30,10 +41,42 @@ async def create_graph(
     graph: graph_model.InputGraph,
     db: AsyncIOMotorDatabase = Depends(get_db),
 ):
-    """Creates a graph in the database and optionally executes error detection (edm) and completion (cm) plugins"""
+    """Creates a graph in the database and optionally executes error detection (edm) and completion (cm) plugins.
+
+    Returns the graph id and the id of the background job populating it (see `/jobs/{job_id}`).
+    """
     return await create_graph_services.create_graph(graph=graph, db=db)
 
 
+@router.post("/stream")
+async def create_graph_from_stream(
+    request: Request,
+    name: str = Query(...),
+    filename: Optional[str] = None,
+    edm: Optional[str] = None,
+    cm: Optional[str] = None,
+    node_classes: List[str] = Query([]),
+    edge_classes: List[str] = Query([]),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    """Creates a graph from a newline-delimited JSON (NDJSON) request body of triples.
+
+    The body is read incrementally (e.g. `Transfer-Encoding: chunked` or a streamed file upload) so the upload is never held in memory as a whole. Each line must be a single triple object, e.g. `{"head": "...", "relation": "...", "tail": "..."}`.
+
+    Returns the graph id and the id of the background job populating it (see `/jobs/{job_id}`).
+    """
+    graph = graph_model.BaseGraph(
+        name=name,
+        node_classes=node_classes,
+        edge_classes=edge_classes,
+        filename=filename,
+        plugins=graph_model.Plugins(edm=edm, cm=cm),
+    )
+    return await create_graph_services.create_graph_from_stream(
+        graph=graph, chunks=request.stream(), db=db
+    )
+
+
 @router.get("/", response_model=List[graph_model.SimpleGraph])
 async def read_graphs(
     skip: int = 0, limit: int = 10, db: AsyncIOMotorDatabase = Depends(get_db)
@@ -58,10 +101,50 @@ async def acknowledge(
     )
 
 
+@router.get("/overview/{graph_id}", response_model=graph_model.GraphOverview)
+async def read_graph_overview(
+    graph_id: str, db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Fetches the overview statistics of a single graph without its subgraphs"""
+    return await graph_services.get_graph_overview(graph_id=ObjectId(graph_id), db=db)
+
+
 @router.get("/{graph_id}", response_model=graph_model.Graph)
-async def read_graph(graph_id: str, db: AsyncIOMotorDatabase = Depends(get_db)):
-    """Fetches the details of a single graph"""
-    return await graph_services.read_graph(graph_id=ObjectId(graph_id), db=db)
+async def read_graph(
+    graph_id: str,
+    request: Request,
+    limit: Optional[int] = Query(
+        default=None,
+        ge=1,
+        le=1000,
+        description="Maximum number of subgraphs to return. All subgraphs are returned if omitted.",
+    ),
+    cursor: Optional[str] = Query(
+        default=None, description="The `next_cursor` of the previous page"
+    ),
+    sort: graph_model.SubGraphSort = graph_model.SubGraphSort.value,
+    order: graph_model.SortOrder = graph_model.SortOrder.desc,
+    search: Optional[str] = Query(
+        default=None, description="Case-insensitive filter on subgraph names"
+    ),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    """Fetches the details of a single graph and a page of its subgraphs. Responses are cached per graph version."""
+    graph_id = ObjectId(graph_id)
+    return await cached_response(
+        request=request,
+        graph_id=graph_id,
+        db=db,
+        compute=lambda: graph_services.read_graph(
+            graph_id=graph_id,
+            db=db,
+            limit=limit,
+            cursor=cursor,
+            sort=sort,
+            order=order,
+            search=search,
+        ),
+    )
 
 
 @router.get(
@@ -82,9 +165,64 @@ async def sample_graph_data(
 
 @router.get("/download/{graph_id}", response_model=graph_model.GraphDownload)
 async def download_graph(
-    graph_id: str, db: AsyncIOMotorDatabase = Depends(get_db)
+    graph_id: str, request: Request, db: AsyncIOMotorDatabase = Depends(get_db)
 ) -> graph_model.GraphDownload:
-    return await graph_services.download(graph_id=ObjectId(graph_id), db=db)
+    """Downloads a graph. Responses are cached per graph version."""
+    graph_id = ObjectId(graph_id)
+    return await cached_response(
+        request=request,
+        graph_id=graph_id,
+        db=db,
+        compute=lambda: graph_services.download(graph_id=graph_id, db=db),
+    )
+
+
+@router.get("/export/{graph_id}")
+async def export_graph(
+    graph_id: str,
+    format: graph_model.ExportFormat = graph_model.ExportFormat.json,
+    compress: bool = Query(default=False, description="Gzip the export"),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+) -> StreamingResponse:
+    """Streams a graph export as JSON (same structure as /download) or NDJSON, optionally gzipped.
+
+    Parquet and Arrow exports are returned as a zip of nodes, edges and triples tables (and the graph's metadata), and require pyarrow.
+    """
+    graph = await db["graphs"].find_one({"_id": ObjectId(graph_id)})
+    if graph is None:
+        raise HTTPException(status_code=404, detail="Graph not found")
+
+    if format in export_services.COLUMNAR_FORMATS:
+        export_services.import_pyarrow()
+        directory = tempfile.mkdtemp(dir=settings.JOB_SPOOL_DIRECTORY)
+        try:
+            archive_path = await export_services.export_columnar(
+                graph=graph, db=db, format=format, directory=directory
+            )
+        except BaseException:
+            shutil.rmtree(directory, ignore_errors=True)
+            raise
+        return FileResponse(
+            archive_path,
+            media_type="application/zip",
+            filename=os.path.basename(archive_path),
+            background=BackgroundTask(shutil.rmtree, directory, ignore_errors=True),
+        )
+
+    filename = f"{graph_id}.{format.value}" + (".gz" if compress else "")
+    media_type = {
+        graph_model.ExportFormat.json: "application/json",
+        graph_model.ExportFormat.ndjson: "application/x-ndjson",
+    }[format]
+
+    return StreamingResponse(
+        export_services.encode_chunks(
+            export_services.export_chunks(graph=graph, db=db, format=format),
+            compress=compress,
+        ),
+        media_type="application/gzip" if compress else media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
 
 
 @router.delete("/property")
@@ -106,9 +244,13 @@ async def delete_property(
 @router.delete("/{graph_id}")
 async def delete_graph(
     graph_id: str, db: AsyncIOMotorDatabase = Depends(get_db)
-) -> str:
-    """Deletes a single graph"""
-    return await graph_services.delete_graph(graph_id=ObjectId(graph_id), db=db)
+) -> Dict[str, Optional[str]]:
+    """Deletes a single graph. Large graphs have their items deleted by a background job, whose id is returned."""
+    try:
+        graph_id = ObjectId(graph_id)
+    except InvalidId:
+        raise HTTPException(status_code=400, detail="Invalid graph id")
+    return await graph_services.delete_graph(graph_id=graph_id, db=db)
 
 
 @router.patch("/{item_id}")
@@ -140,6 +282,22 @@ async def merge_node(
     )
 
 
+@router.post("/merge")
+async def merge_nodes(
+    data: graph_model.MergeNodes, db: AsyncIOMotorDatabase = Depends(get_db)
+) -> graph_model.MergedNode:
+    """Merges a cluster of duplicate nodes into a single new node"""
+    try:
+        return await merge_services.merge_nodes(
+            node_ids=[ObjectId(node_id) for node_id in data.node_ids],
+            name=data.name,
+            type=ObjectId(data.type),
+            db=db,
+        )
+    except InvalidId:
+        raise HTTPException(status_code=400, detail="Invalid node or type id")
+
+
 @router.patch("/settings/{graph_id}")
 async def update_settings(
     graph_id: str,
@@ -202,10 +360,21 @@ async def update_item_class(
 
 
 @router.get("/items/{graph_id}")
-async def get_graph_items(graph_id: str, db: AsyncIOMotorDatabase = Depends(get_db)):
-    """Gets unique graph items"""
-
+async def get_graph_items(
+    graph_id: str, request: Request, db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Gets unique graph items. Responses are cached per graph version."""
     graph_id = ObjectId(graph_id)
+    return await cached_response(
+        request=request,
+        graph_id=graph_id,
+        db=db,
+        compute=lambda: fetch_graph_items(graph_id=graph_id, db=db),
+    )
+
+
+async def fetch_graph_items(graph_id: ObjectId, db: AsyncIOMotorDatabase):
+    """Gets unique graph items"""
 
     print("graph_id", graph_id)
 
@@ -382,6 +551,14 @@ async def add_graph_items(
         triple_id = triple.inserted_id
         print(f"Created triple: {triple_id}")
 
+        await refresh_neighbourhoods(
+            graph_id=graph_id, db=db, node_ids=[head_node_id, tail_node_id]
+        )
+        await refresh_degrees(
+            graph_id=graph_id, db=db, node_ids=[head_node_id, tail_node_id]
+        )
+        await bump_graph_version(graph_id=graph_id, db=db)
+
         output = {"head": head_node, "edge": edge, "tail": tail_node}
 
         print("output", output)
@@ -0,0 +1,26 @@
+from fastapi import APIRouter, HTTPException, status
+from loguru import logger
+
+from database import database
+
+router = APIRouter(prefix="/health", tags=["Health"])
+
+
+@router.get("/")
+async def get_health():
+    """Checks the API can reach the database"""
+    try:
+        await database.db.command("ping")
+    except Exception as e:
+        logger.error(f"Database ping failed: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Database unavailable",
+        )
+    return {"status": "ok"}
+
+
+@router.get("/db-pool")
+async def get_db_pool_metrics():
+    """Fetches connection pool metrics of the shared database client (open and checked out connections, checkouts, failures)"""
+    return database.metrics.snapshot()
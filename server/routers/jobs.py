@@ -0,0 +1,19 @@
+from fastapi import APIRouter
+from bson import ObjectId
+
+from models.job import Job
+from services.jobs import job_queue
+
+router = APIRouter(prefix="/jobs", tags=["Jobs"])
+
+
+@router.get("/{job_id}", response_model=Job)
+async def get_job(job_id: str) -> Job:
+    """Fetches the status, current phase and progress of a background job"""
+    return await job_queue.get(job_id=ObjectId(job_id))
+
+
+@router.delete("/{job_id}")
+async def cancel_job(job_id: str):
+    """Cancels a queued or running background job"""
+    return await job_queue.cancel(job_id=ObjectId(job_id))
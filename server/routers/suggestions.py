@@ -1,6 +1,6 @@
 from typing import List, Dict, Tuple, Optional, Union, Generator, Any
 from collections import Counter
-from fastapi import APIRouter, Depends, HTTPException, status, Query, Body
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Body, Request
 from dependencies import get_db
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from pymongo.errors import PyMongoError
@@ -14,12 +14,26 @@ import string
 
 from models import graph as graph_model
 from services.graph import get_item_classes
+from services.cache import cached_response
 
 router = APIRouter(prefix="/suggestions", tags=["Suggestions"])
 
 
 @router.get("/{graph_id}")
-async def get_suggestions(graph_id: str, db: AssertionError = Depends(get_db)):
+async def get_suggestions(
+    graph_id: str, request: Request, db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Fetches all suggestions on the current graph. Responses are cached per graph version."""
+    graph_id = ObjectId(graph_id)
+    return await cached_response(
+        request=request,
+        graph_id=graph_id,
+        db=db,
+        compute=lambda: fetch_suggestions(graph_id=graph_id, db=db),
+    )
+
+
+async def fetch_suggestions(graph_id: ObjectId, db: AsyncIOMotorDatabase):
     """Fetches all suggestions on the current graph
 
     TODO
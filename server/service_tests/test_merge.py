@@ -0,0 +1,167 @@
+import copy
+import unittest
+from typing import Dict, List
+from unittest.mock import patch
+
+import sys
+
+sys.path.append("..")  # Adds the parent directory to the list of paths
+
+from bson import ObjectId
+
+import services.merge as merge_services
+from services.merge import UnionFind, apply_errors
+
+
+class FakeCursor:
+    """The subset of a Motor cursor used by `apply_errors`"""
+
+    def __init__(self, documents: List[Dict]):
+        self.documents = documents
+
+    async def to_list(self, length):
+        return self.documents
+
+    def __aiter__(self):
+        self._iterator = iter(self.documents)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iterator)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class FakeNodes:
+    """Finds nodes by error id or by name, returning fresh copies as MongoDB does"""
+
+    def __init__(self, nodes: List[Dict]):
+        self.nodes = nodes
+
+    def find(self, query: Dict):
+        if "errors.id" in query:
+            error_ids = query["errors.id"]["$in"]
+            found = [
+                n for n in self.nodes if any(e["id"] in error_ids for e in n["errors"])
+            ]
+        else:
+            found = [n for n in self.nodes if n["name"] in query["name"]["$in"]]
+        return FakeCursor(copy.deepcopy(found))
+
+
+def make_node(name: str, type: ObjectId, value: int = 1) -> Dict:
+    return {"_id": ObjectId(), "name": name, "type": type, "value": value, "errors": []}
+
+
+def add_error(node: Dict, target_name: str, type: ObjectId) -> ObjectId:
+    error_id = ObjectId()
+    node["errors"].append(
+        {
+            "id": error_id,
+            "acknowledged": False,
+            "action": {
+                "name": "update",
+                "data": {"item_name": target_name, "item_type": str(type)},
+            },
+        }
+    )
+    return error_id
+
+
+class TestUnionFind(unittest.TestCase):
+    def test_chains_and_shared_targets_form_one_group(self):
+        a, b, c, d, e = (ObjectId() for _ in range(5))
+        union_find = UnionFind()
+        union_find.union(a, b)
+        union_find.union(b, c)
+        union_find.union(d, c)
+        union_find.union(e, e)
+
+        groups = sorted(sorted(group) for group in union_find.groups())
+        self.assertEqual(groups, sorted([sorted([a, b, c, d]), [e]]))
+
+    def test_symmetric_pair_forms_one_group(self):
+        a, b = ObjectId(), ObjectId()
+        union_find = UnionFind()
+        union_find.union(a, b)
+        union_find.union(b, a)
+
+        self.assertEqual(union_find.find(a), union_find.find(b))
+        self.assertEqual(len(union_find.groups()), 1)
+
+
+class TestApplyErrors(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.graph_id = ObjectId()
+        self.type = ObjectId()
+
+    async def apply(self, nodes: List[Dict], error_ids: List[ObjectId]):
+        """Applies errors, returning the result and the node groups passed to `merge_node_groups`"""
+        merged_groups = []
+
+        async def merge_node_groups(groups, graph_id, db):
+            merged_groups.extend(groups)
+            return []
+
+        with patch.object(merge_services, "merge_node_groups", merge_node_groups):
+            result = await apply_errors(
+                graph_id=self.graph_id,
+                error_ids=error_ids,
+                db={"nodes": FakeNodes(nodes)},
+            )
+        return result, merged_groups
+
+    async def test_symmetric_pair_is_merged_once_with_both_errors_acknowledged(self):
+        apple = make_node("apple", self.type, value=5)
+        appel = make_node("appel", self.type)
+        error_ids = [
+            add_error(apple, "appel", self.type),
+            add_error(appel, "apple", self.type),
+        ]
+
+        result, groups = await self.apply([apple, appel], error_ids)
+
+        self.assertEqual(sorted(result.applied_error_ids), sorted(map(str, error_ids)))
+        self.assertEqual(result.skipped_error_ids, [])
+        self.assertEqual(len(groups), 1)
+        # Both are erroneous, so the highest valued node names the merge
+        self.assertEqual(groups[0].name, "apple")
+        errors = [e for node in groups[0].nodes for e in node["errors"]]
+        self.assertEqual(len(errors), 2)
+        self.assertTrue(all(e["acknowledged"] for e in errors))
+
+    async def test_chain_is_merged_into_node_without_errors(self):
+        aple = make_node("aple", self.type, value=9)
+        appl = make_node("appl", self.type)
+        apple = make_node("apple", self.type)
+        error_ids = [
+            add_error(aple, "appl", self.type),
+            add_error(appl, "apple", self.type),
+        ]
+
+        result, groups = await self.apply([aple, appl, apple], error_ids)
+
+        self.assertEqual(len(result.applied_error_ids), 2)
+        self.assertEqual(len(groups), 1)
+        self.assertEqual(
+            {node["_id"] for node in groups[0].nodes},
+            {aple["_id"], appl["_id"], apple["_id"]},
+        )
+        self.assertEqual(groups[0].name, "apple")
+        errors = [e for node in groups[0].nodes for e in node["errors"]]
+        self.assertTrue(all(e["acknowledged"] for e in errors))
+
+    async def test_errors_without_target_are_skipped(self):
+        banan = make_node("banan", self.type)
+        error_id = add_error(banan, "banana", self.type)
+
+        result, groups = await self.apply([banan], [error_id])
+
+        self.assertEqual(result.applied_error_ids, [])
+        self.assertEqual(result.skipped_error_ids, [str(error_id)])
+        self.assertEqual(groups, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,153 @@
+"""Helpers for writing large numbers of documents in bounded batches"""
+
+import asyncio
+import time
+from itertools import islice
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+from loguru import logger
+from pymongo import UpdateOne
+
+from settings import settings
+
+
+def batched(iterable: Iterable[Any], batch_size: int) -> Iterable[List[Any]]:
+    """Yields lists of at most `batch_size` items from `iterable` without materialising it."""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+async def run_concurrently(*aws: Awaitable) -> List[Any]:
+    """
+    Runs awaitables concurrently and returns their results.
+
+    Unlike a bare `asyncio.gather`, if any awaitable fails the remaining ones are cancelled (and awaited) before the exception is re-raised, so no writes keep running behind a failed operation.
+    """
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+async def bulk_insert(
+    collection: Any,
+    documents: Iterable[Dict],
+    batch_size: Optional[int] = None,
+    concurrency: Optional[int] = None,
+    on_progress: Optional[Callable[[int], Awaitable[None]]] = None,
+) -> int:
+    """
+    Inserts documents into a collection in bounded, unordered batches.
+
+    Documents are expected to carry pre-assigned `_id`s, so callers never rely on the order of `inserted_ids`. `documents` may be a generator; at most `concurrency` batches of `batch_size` documents are held in memory at once.
+
+    Arguments
+    ---------
+    collection: The Motor collection to insert into.
+    documents: The documents to insert.
+    batch_size: Number of documents per `insert_many`. Defaults to `settings.BULK_WRITE_BATCH_SIZE`.
+    concurrency: Maximum number of in-flight batches. Defaults to `settings.BULK_WRITE_CONCURRENCY`.
+    on_progress: Optional callback awaited with the running total of inserted documents after each batch.
+
+    Returns
+    -------
+    The number of documents inserted.
+    """
+    batch_size = batch_size or settings.BULK_WRITE_BATCH_SIZE
+    concurrency = concurrency or settings.BULK_WRITE_CONCURRENCY
+
+    semaphore = asyncio.Semaphore(concurrency)
+    tasks = []
+    inserted_total = 0
+
+    async def insert_batch(batch_number: int, batch: List[Dict]) -> int:
+        nonlocal inserted_total
+        try:
+            start = time.perf_counter()
+            await collection.insert_many(batch, ordered=False)
+            elapsed = time.perf_counter() - start
+            logger.debug(
+                f"Inserted batch {batch_number} of {len(batch)} documents into '{collection.name}' in {elapsed:.3f}s ({len(batch) / max(elapsed, 1e-9):.0f} docs/s)"
+            )
+            inserted_total += len(batch)
+            if on_progress is not None:
+                await on_progress(inserted_total)
+            return len(batch)
+        finally:
+            semaphore.release()
+
+    start = time.perf_counter()
+    try:
+        for batch_number, batch in enumerate(batched(documents, batch_size)):
+            # Acquire before the next batch is built so memory stays bounded
+            await semaphore.acquire()
+            # Fail fast rather than continuing to write behind a failed batch
+            for task in tasks:
+                if task.done() and not task.cancelled() and task.exception():
+                    semaphore.release()
+                    raise task.exception()
+            tasks.append(asyncio.ensure_future(insert_batch(batch_number, batch)))
+        inserted = sum(await asyncio.gather(*tasks))
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+    elapsed = time.perf_counter() - start
+    logger.info(
+        f"Inserted {inserted} documents into '{collection.name}' in {len(tasks)} batches in {elapsed:.2f}s ({inserted / max(elapsed, 1e-9):.0f} docs/s)"
+    )
+
+    return inserted
+
+
+async def bulk_push(
+    collection: Any,
+    field: str,
+    values_by_id: Dict[Any, List[Dict]],
+    batch_size: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Appends values to an array field on many documents using batched `bulk_write` calls.
+
+    Values are grouped by document `_id` so each document receives a single `$push`/`$each` update, regardless of how many values are appended to it.
+
+    Arguments
+    ---------
+    collection: The Motor collection to update.
+    field: The array field to push values onto (e.g. "errors").
+    values_by_id: Mapping of document `_id` to the values to append.
+    batch_size: Number of updates per `bulk_write`. Defaults to `settings.PLUGIN_WRITE_BATCH_SIZE`.
+
+    Returns
+    -------
+    Write metrics: the number of documents, values, batches and seconds spent writing.
+    """
+    batch_size = batch_size or settings.PLUGIN_WRITE_BATCH_SIZE
+
+    updates = (
+        UpdateOne({"_id": _id}, {"$push": {field: {"$each": values}}})
+        for _id, values in values_by_id.items()
+    )
+
+    start = time.perf_counter()
+    batches = 0
+    for batch in batched(updates, batch_size):
+        await collection.bulk_write(batch, ordered=False)
+        batches += 1
+
+    return {
+        "documents": len(values_by_id),
+        "values": sum(len(values) for values in values_by_id.values()),
+        "batches": batches,
+        "seconds": round(time.perf_counter() - start, 3),
+    }
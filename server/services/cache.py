@@ -0,0 +1,158 @@
+"""
+Response caching for read-heavy graph endpoints.
+
+Each graph document holds a `version` counter that every mutating service bumps (`bump_graph_version`). Cached responses are keyed by graph id, version, path and query, so a write makes all of a graph's cached responses unreachable without any explicit invalidation; stale entries are then evicted least recently used first.
+
+Responses carry a weak ETag derived from the same key, so clients sending `If-None-Match` get a `304 Not Modified` for an unchanged graph without the response being computed or transferred.
+
+The cache backend is pluggable: `MemoryCacheBackend` is used by default, and any `CacheBackend` (e.g. one backed by Redis, for sharing across workers) can be assigned to `response_cache.backend`.
+"""
+
+import hashlib
+import json
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional
+
+from bson import ObjectId
+from fastapi import Request, Response, status
+from fastapi.encoders import jsonable_encoder
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from settings import settings
+
+
+class CacheBackend:
+    """Stores serialised responses by key."""
+
+    async def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: bytes) -> None:
+        raise NotImplementedError
+
+    async def clear(self) -> None:
+        raise NotImplementedError
+
+
+class MemoryCacheBackend(CacheBackend):
+    """An in-process LRU cache bounded by the total size of its values."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._size = 0
+
+    async def get(self, key: str) -> Optional[bytes]:
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: bytes) -> None:
+        if len(value) > self.max_bytes:
+            return
+        if key in self._entries:
+            self._size -= len(self._entries.pop(key))
+        self._entries[key] = value
+        self._size += len(value)
+        while self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+
+    async def clear(self) -> None:
+        self._entries.clear()
+        self._size = 0
+
+
+class ResponseCache:
+    def __init__(self, backend: Optional[CacheBackend]):
+        self.backend = backend
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return None if self.backend is None else await self.backend.get(key)
+
+    async def set(self, key: str, value: bytes) -> None:
+        if self.backend is not None:
+            await self.backend.set(key, value)
+
+
+response_cache = ResponseCache(
+    backend=(
+        MemoryCacheBackend(max_bytes=settings.RESPONSE_CACHE_MAX_MB * 1024 * 1024)
+        if settings.RESPONSE_CACHE_MAX_MB > 0
+        else None
+    )
+)
+
+
+async def get_graph_version(
+    graph_id: ObjectId, db: AsyncIOMotorDatabase
+) -> Optional[int]:
+    """Returns a graph's version, or None if the graph doesn't exist"""
+    graph = await db["graphs"].find_one({"_id": graph_id}, {"version": 1})
+    return None if graph is None else graph.get("version", 0)
+
+
+async def bump_graph_version(graph_id: ObjectId, db: AsyncIOMotorDatabase) -> None:
+    """Marks a graph as modified so its cached responses are no longer served"""
+    await db["graphs"].update_one({"_id": graph_id}, {"$inc": {"version": 1}})
+
+
+def _opaque_tag(etag: str) -> str:
+    etag = etag.strip()
+    return etag[2:] if etag.startswith("W/") else etag
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison, as required for If-None-Match
+    candidates = {_opaque_tag(tag) for tag in if_none_match.split(",")}
+    return _opaque_tag(etag) in candidates
+
+
+async def cached_response(
+    request: Request,
+    graph_id: ObjectId,
+    db: AsyncIOMotorDatabase,
+    compute: Callable[[], Awaitable[Any]],
+) -> Response:
+    """
+    Serves a graph endpoint's JSON response from the cache, computing and caching it on a miss.
+
+    Arguments
+    ---------
+    request: The incoming request. Its path and query form part of the cache key.
+    graph_id: The graph the response is derived from.
+    compute: Produces the response content. Anything `jsonable_encoder` accepts (including models using `_id` aliases) may be returned.
+
+    Returns
+    -------
+    A JSON response with an ETag, or a 304 response if the client's `If-None-Match` matches.
+    """
+    version = await get_graph_version(graph_id=graph_id, db=db)
+    if version is None:
+        # Let the endpoint report the missing graph
+        return await compute()
+
+    key = f"{graph_id}:{version}:{request.url.path}?{request.url.query}"
+    etag = f'W/"{hashlib.sha1(key.encode()).hexdigest()}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    body = await response_cache.get(key)
+    if body is None:
+        content = await compute()
+        if content is None:
+            # Services return None after logging a failure - don't cache it
+            return content
+        body = json.dumps(
+            jsonable_encoder(content, custom_encoder={ObjectId: str})
+        ).encode("utf-8")
+        await response_cache.set(key, body)
+
+    return Response(content=body, media_type="application/json", headers=headers)
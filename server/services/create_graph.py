@@ -1,10 +1,26 @@
-from typing import List, Dict, Tuple, Optional, Union, Any, Set
-from collections import Counter, defaultdict
-from fastapi import HTTPException
+from typing import (
+    List,
+    Dict,
+    Tuple,
+    Optional,
+    Union,
+    Any,
+    Set,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Iterable,
+)
+from collections import Counter
+from fastapi import HTTPException, status
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from pymongo.errors import PyMongoError
 from bson import ObjectId
 import traceback
+import json
+import asyncio
+import os
+import tempfile
 
 from loguru import logger
 from settings import settings
@@ -14,48 +30,45 @@ from services.utils import (
     gen_random_properties,
     parse_and_sanitise_properties,
 )
+from services.bulk import bulk_insert, run_concurrently
 from services.plugins import execute_plugins
-from services.graph import delete_graph
+from services.neighbourhood import refresh_neighbourhoods
+from services.degree import count_degrees, empty_degrees
+from services.cache import bump_graph_version
+from services.graph import delete_graph_items
+from services.jobs import JobProgress, job_queue
 
 from models import graph as graph_model
+from models.job import JobKind, JobPhase
 
 
 async def cleanup_graph(graph_id: ObjectId, db: AsyncIOMotorDatabase):
     """Cleans up graph for instnaces where something has gone wrong."""
-    await delete_graph(graph_id=graph_id, db=db)
+    try:
+        await db["graphs"].delete_one({"_id": graph_id})
+        await delete_graph_items(graph_id=graph_id, db=db)
+    except Exception as e:
+        logger.error(f"Failed to clean up graph {graph_id}: {e}")
 
 
-def extract_nodes_and_edges(
-    graph: graph_model.InputGraph,
-) -> Tuple[Dict[Tuple, int], Dict[Tuple, int], Set, Set]:
+class TripleAccumulator:
     """
-    Processes graph data to extract nodes and triples.
-
-    Extracts unique nodes and triples including their freqeuencies and types which are used to create node/edge taxonomies.
-    Graph data can be simple {head, relation, tail} or complex {head, head_type, head_properties, ...}
-
+    Incrementally accumulates unique nodes, triples and ontology classes from input triples.
 
-    TODO
-    ----
-    - Allow properties to be added. Currently they are dropped whenever users upload rich graph data.
+    Only the unique (name, type) node keys and (head, head_type, relation, tail, tail_type) triple keys are kept, along with their frequencies, so memory grows with the number of unique items rather than the size of the upload. Used by both whole-graph uploads and streaming (NDJSON) ingestion.
     """
 
-    node_classes = set()
-    edge_classes = set()
+    def __init__(self):
+        self.node_classes = set()
+        self.edge_classes = set()
 
-    nodes = Counter()
-    triples = Counter()
+        self.nodes = Counter()
+        self.triples = Counter()
 
-    node_properties = defaultdict(
-        list
-    )  # Stores node properties as {(name, type): {...properties...}}
-    edge_properties = defaultdict(
-        list
-    )  # Stores edge properties as {(head,head_type, relation, tail, tail_type): {...properties...})}
+        self.count = 0
 
-    logger.info(graph.triples)
-
-    for entry in graph.triples:
+    def add(self, entry: graph_model.Triple) -> None:
+        """Adds a single input triple to the accumulator."""
         head_key = (entry.head, entry.head_type)
         tail_key = (entry.tail, entry.tail_type)
         triple_key = (
@@ -67,79 +80,122 @@ def extract_nodes_and_edges(
         )
 
         # Increment frequency
-        nodes[head_key] += 1
-        nodes[tail_key] += 1
-        triples[triple_key] += 1
-
-        # Capture properties - if supplied
-        if entry.head_properties:
-            # logger.info(f"entry.head_properties: {entry.head_properties}")
-            node_properties[head_key].append(entry.head_properties)
-        if entry.tail_properties:
-            # logger.info(f"entry.tail_properties: {entry.tail_properties}")
-            node_properties[tail_key].append(entry.tail_properties)
-        if entry.relation_properties:
-            # logger.info(f"entry.relation_properties: {entry.relation_properties}")
-            edge_properties[triple_key].append(entry.relation_properties)
+        self.nodes[head_key] += 1
+        self.nodes[tail_key] += 1
+        self.triples[triple_key] += 1
 
         # Capture classes - if typed graph
         if entry.head_type:
-            node_classes.add(entry.head_type)
+            self.node_classes.add(entry.head_type)
         if entry.tail_type:
-            node_classes.add(entry.tail_type)
-        edge_classes.add(entry.relation)
-
-    if len(node_classes) == 0:
-        # Untyped graph uploaded
-        logger.info("Untyped graph")
-        node_classes.add(settings.UNTYPED_GRAPH_NODE_CLASS)
-
-    logger.info(f"triples: {triples}")
-
-    # Resolve properties
-    # logger.info(f"node_properties: {node_properties}")
-    # logger.info(f"edge_properties: {edge_properties}")
-
-    # logger.info(
-    #     f"nodes: {nodes}",
-    # )
-
-    # Enrich nodes/triples - detect property types...
-    output_nodes = {}
-    for node_key, count in nodes.items():
-        _node_properties = node_properties[node_key]
-        # Combine list of properties into single dict
-        _combined_properties = {k: v for d in _node_properties for k, v in d.items()}
-        # Sanitise properties
-        _properties = parse_and_sanitise_properties(_combined_properties)
-
-        # Update the 'nodes' dictionary directly
-        output_nodes[node_key] = {
-            "frequency": count,
-            "properties": _properties,
-        }
+            self.node_classes.add(entry.tail_type)
+        self.edge_classes.add(entry.relation)
 
-    logger.info(f"output_nodes: {output_nodes}")
-
-    # Enrich nodes/triples - detect property types...
-    output_triples = {}
-    for triple_key, count in triples.items():
-        logger.info(f"triple key: {triple_key}")
-        _edge_properties = edge_properties[triple_key]
-        # Combine list of properties into single dict
-        _combined_properties = {k: v for d in _edge_properties for k, v in d.items()}
-        # Sanitise properties
-        _properties = parse_and_sanitise_properties(_combined_properties)
-
-        # Update the 'nodes' dictionary directly
-        output_triples[triple_key] = {
-            "frequency": count,
-            "properties": _properties,
-        }
+        self.count += 1
+
+    def result(self) -> Tuple[Dict[Tuple, int], Dict[Tuple, int], Set, Set]:
+        """Returns the unique nodes, triples, node classes and edge classes."""
+        if len(self.node_classes) == 0:
+            # Untyped graph uploaded
+            logger.info("Untyped graph")
+            self.node_classes.add(settings.UNTYPED_GRAPH_NODE_CLASS)
+
+        logger.info(
+            f"Extracted {len(self.nodes)} unique nodes and {len(self.triples)} unique triples from {self.count} triples"
+        )
 
-    logger.info(f"output_triples {output_triples}")
+        return self.nodes, self.triples, self.node_classes, self.edge_classes
 
-    return nodes, triples, node_classes, edge_classes
+
+def extract_nodes_and_edges(
+    graph: graph_model.InputGraph,
+) -> Tuple[Dict[Tuple, int], Dict[Tuple, int], Set, Set]:
+    """
+    Processes graph data to extract nodes and triples.
+
+    Extracts unique nodes and triples including their freqeuencies and types which are used to create node/edge taxonomies.
+    Graph data can be simple {head, relation, tail} or complex {head, head_type, head_properties, ...}
+
+
+    TODO
+    ----
+    - Allow properties to be added. Currently they are dropped whenever users upload rich graph data.
+    """
+    accumulator = TripleAccumulator()
+
+    for entry in graph.triples:
+        accumulator.add(entry)
+
+    return accumulator.result()
+
+
+async def iter_ndjson_triples(
+    chunks: AsyncIterator[bytes],
+) -> AsyncIterator[graph_model.Triple]:
+    """
+    Parses newline-delimited JSON (NDJSON) triples from an asynchronous stream of byte chunks.
+
+    Only the current chunk and any trailing partial line are buffered. Blank lines are skipped.
+
+    Raises:
+        HTTPException: If a line is not a valid JSON triple.
+    """
+    buffer = b""
+    line_number = 0
+
+    def parse(line: bytes) -> graph_model.Triple:
+        try:
+            return graph_model.Triple(**json.loads(line))
+        except (ValueError, TypeError) as e:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"Invalid triple on line {line_number}: {e}",
+            )
+
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            line_number += 1
+            if line.strip():
+                yield parse(line)
+
+    if buffer.strip():
+        line_number += 1
+        yield parse(buffer)
+
+
+async def extract_nodes_and_edges_from_stream(
+    chunks: AsyncIterator[bytes],
+    on_progress: Optional[Callable[[int], Awaitable[None]]] = None,
+) -> Tuple[Dict[Tuple, int], Dict[Tuple, int], Set, Set]:
+    """
+    Streaming counterpart of `extract_nodes_and_edges` for NDJSON uploads.
+
+    Triples are consumed one at a time so the upload is never materialised as an `InputGraph`. Progress is logged (and passed to `on_progress`, if supplied) every `settings.INGEST_PROGRESS_INTERVAL` triples.
+    """
+    accumulator = TripleAccumulator()
+
+    async for entry in iter_ndjson_triples(chunks):
+        accumulator.add(entry)
+
+        if accumulator.count % settings.INGEST_PROGRESS_INTERVAL == 0:
+            logger.info(
+                f"Parsed {accumulator.count} triples ({len(accumulator.nodes)} unique nodes, {len(accumulator.triples)} unique triples)"
+            )
+            if on_progress is not None:
+                await on_progress(accumulator.count)
+
+    if accumulator.count == 0:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="No triples supplied",
+        )
+
+    if on_progress is not None:
+        await on_progress(accumulator.count)
+
+    return accumulator.result()
 
 
 def create_ontology_classes(
@@ -158,30 +214,41 @@ def create_ontology_classes(
     return node_classes_with_ids, edge_classes_with_ids
 
 
+def assign_object_ids(keys: Iterable[Tuple]) -> Dict[Tuple, ObjectId]:
+    """
+    Pre-assigns ObjectIds to item keys.
+
+    Assigning ids up front means inserts don't depend on the order of `inserted_ids`, and nodes, edges and triples can be written concurrently.
+    """
+    return {key: ObjectId() for key in keys}
+
+
 async def create_insert_nodes(
     nodes_db_collection,
     nodes: Dict[Tuple, int],
     node_classes_with_ids: Dict[str, ObjectId],
     graph_id: ObjectId,
+    node_ids: Optional[Dict[Tuple, ObjectId]] = None,
+    degrees: Optional[Dict[Tuple, Dict[str, int]]] = None,
+    on_progress: Optional[Callable[[int], Awaitable[None]]] = None,
 ) -> Dict[Tuple, ObjectId]:
     """
     Create unique nodes with frequencies and insert into graph database.
 
-    NOTE
-    ----
-    THIS ASSUMES THE INSERTED_IDS ARE THE SAME ORDER AS THE NODE DATA DOCS
+    Documents are built lazily and inserted in bounded batches using the pre-assigned `node_ids` (assigned here if not supplied). Nodes are written with their `degrees` (see `services/degree.py`) by node key; nodes without degrees have zero degrees.
 
     TODO
     ----
     settings.UNTYPED_GRAPH_NODE_CLASS if type_ is None else type_, # TODO: make this work for untyped graphs.
 
     """
-    node_data = []
-    node_ids = {}
+    if node_ids is None:
+        node_ids = assign_object_ids(nodes.keys())
 
-    for (name, type_), frequency in nodes.items():
-        node_data.append(
-            graph_model.CreateItem(
+    node_data = (
+        {
+            "_id": node_ids[(name, type_)],
+            **graph_model.CreateItem(
                 name=name,
                 type=node_classes_with_ids[
                     type_
@@ -189,13 +256,14 @@ async def create_insert_nodes(
                 value=frequency,
                 graph_id=graph_id,
                 properties=gen_random_properties(),
-            ).dict()
-        )
+            ).dict(),
+            **(degrees or {}).get((name, type_), empty_degrees()),
+        }
+        for (name, type_), frequency in nodes.items()
+    )
 
     try:
-        result = await nodes_db_collection.insert_many(node_data)
-        for (name, type_), inserted_id in zip(nodes.keys(), result.inserted_ids):
-            node_ids[(name, type_)] = inserted_id
+        await bulk_insert(nodes_db_collection, node_data, on_progress=on_progress)
     except Exception as e:
         logger.error(e)
         raise Exception(f"Unable to create node: {e}")
@@ -210,36 +278,35 @@ async def create_insert_edges(
     triples: Dict[Tuple, int],
     edge_classes_with_ids: Dict[str, ObjectId],
     graph_id: ObjectId,
+    edge_ids: Optional[Dict[Tuple, ObjectId]] = None,
+    on_progress: Optional[Callable[[int], Awaitable[None]]] = None,
 ) -> Dict[Tuple, ObjectId]:
     """
     Create unique edges with respective frequencies
 
-    NOTE
-    ----
-    THIS ASSUMES THE INSERTED_IDS ARE THE SAME ORDER AS THE EDGE DATA DOCS
+    Documents are built lazily and inserted in bounded batches using the pre-assigned `edge_ids` (assigned here if not supplied).
 
     TODO
     ----
     - Add properties
     """
-    edge_data = []
-    edge_ids = {}
+    if edge_ids is None:
+        edge_ids = assign_object_ids(triples.keys())
 
-    for (head, head_type, relation, tail, tail_type), frequency in triples.items():
-        edge_data.append(
-            graph_model.CreateItem(
-                type=edge_classes_with_ids[relation],
+    edge_data = (
+        {
+            "_id": edge_ids[triple_key],
+            **graph_model.CreateItem(
+                type=edge_classes_with_ids[triple_key[2]],
                 value=frequency,
                 graph_id=graph_id,
-            ).dict()
-        )
+            ).dict(),
+        }
+        for triple_key, frequency in triples.items()
+    )
 
     try:
-        result = await edges_db_collection.insert_many(edge_data)
-        for (head, head_type, relation, tail, tail_type), inserted_id in zip(
-            triples.keys(), result.inserted_ids
-        ):
-            edge_ids[(head, head_type, relation, tail, tail_type)] = inserted_id
+        await bulk_insert(edges_db_collection, edge_data, on_progress=on_progress)
     except Exception as e:
         logger.error(e)
         raise Exception(f"Unable to create edge: {e}")
@@ -290,103 +357,300 @@ async def create_insert_triples(
     node_ids: Dict[Tuple, ObjectId],
     edge_ids: Dict[Tuple, ObjectId],
     graph_id: ObjectId,
+    on_progress: Optional[Callable[[int], Awaitable[None]]] = None,
 ) -> None:
     """
     Create triples and insert them into graph database.
+
+    Triples reference the pre-assigned node and edge ids, so they can be inserted while the nodes and edges themselves are still being written.
     """
-    triple_data = []
-    for triple in triples:
-        head, head_type, relation, tail, tail_type = triple
-        triple_data.append(
-            {
-                "head": node_ids[(head, head_type)],
-                "edge": edge_ids[(head, head_type, relation, tail, tail_type)],
-                "tail": node_ids[(tail, tail_type)],
-                "graph_id": graph_id,
-            }
-        )
+    triple_data = (
+        {
+            "head": node_ids[(head, head_type)],
+            "edge": edge_ids[(head, head_type, relation, tail, tail_type)],
+            "tail": node_ids[(tail, tail_type)],
+            "graph_id": graph_id,
+        }
+        for head, head_type, relation, tail, tail_type in triples
+    )
 
-    # Insert triples in batch
-    await triples_db_collection.insert_many(triple_data)
+    await bulk_insert(triples_db_collection, triple_data, on_progress=on_progress)
     logger.info("created triples")
 
 
-async def create_graph(graph: graph_model.InputGraph, db: AsyncIOMotorDatabase):
-    """
-    Creates a graph in the database.
+async def insert_base_graph(
+    graph: graph_model.BaseGraph, db: AsyncIOMotorDatabase
+) -> ObjectId:
+    """Inserts the base graph project document (without nodes, edges or triples)."""
+    db_graph = await db["graphs"].insert_one(
+        graph_model.CreateGraph(
+            **graph.dict(exclude={"triples"}),
+            start_node_count=0,
+            start_edge_count=0,
+            settings=graph_model.Settings(
+                display_errors=(graph.plugins.edm is not None),
+                display_suggestions=(graph.plugins.cm is not None),
+            ),
+        ).dict()
+    )
 
-    Note
-    ----
-    It also executes error detection (edm) and completion (cm) plugins (if specified).
+    logger.info(f"Created base graph project with _id: {str(db_graph.inserted_id)}")
+
+    return db_graph.inserted_id
+
+
+async def populate_graph(
+    graph_id: ObjectId,
+    graph_plugins: graph_model.Plugins,
+    nodes: Dict[Tuple, int],
+    triples: Dict[Tuple, int],
+    node_classes: Set[str],
+    edge_classes: Set[str],
+    db: AsyncIOMotorDatabase,
+    progress: Optional[JobProgress] = None,
+) -> None:
     """
+    Inserts extracted nodes, edges and triples for a graph, executes its plugins and builds its neighbourhood summaries.
 
-    try:
-        db_graph = await db["graphs"].insert_one(
-            graph_model.CreateGraph(
-                **graph.dict(),
-                start_node_count=0,
-                start_edge_count=0,
-                settings=graph_model.Settings(
-                    display_errors=(graph.plugins.edm is not None),
-                    display_suggestions=(graph.plugins.cm is not None),
-                ),
-            ).dict()
-        )
+    If `progress` is supplied, the nodes, edges, triples and plugins phases are reported to it as they complete.
+    """
 
-        graph_id = db_graph.inserted_id
+    def report(phase: JobPhase, total: int):
+        if progress is None:
+            return None
+        return lambda count: progress.update(phase, count / max(total, 1) * 100)
 
-        logger.info(f"Created base graph project with _id: {str(graph_id)}")
+    node_classes_with_ids, edge_classes_with_ids = create_ontology_classes(
+        node_classes=node_classes, edge_classes=edge_classes
+    )
 
-        nodes, triples, node_classes, edge_classes = extract_nodes_and_edges(
-            graph=graph
-        )
+    # Ids are assigned up front so nodes, edges and triples can be inserted concurrently
+    node_ids = assign_object_ids(nodes.keys())
+    edge_ids = assign_object_ids(triples.keys())
 
-        node_classes_with_ids, edge_classes_with_ids = create_ontology_classes(
-            node_classes=node_classes, edge_classes=edge_classes
-        )
+    # Every edge starts active, so triples count towards their nodes' active degrees
+    degrees = count_degrees(
+        ((head, head_type), (tail, tail_type), True)
+        for head, head_type, _, tail, tail_type in triples
+    )
 
-        # "nodes" are {(name, type): {"frequency": int, "properties": List[Dict]}}
-        node_ids = await create_insert_nodes(
+    await run_concurrently(
+        create_insert_nodes(
             nodes_db_collection=db["nodes"],
             nodes=nodes,
             node_classes_with_ids=node_classes_with_ids,
             graph_id=graph_id,
-        )
-
-        edge_ids = await create_insert_edges(
+            node_ids=node_ids,
+            degrees=degrees,
+            on_progress=report(JobPhase.nodes, len(nodes)),
+        ),
+        create_insert_edges(
             edges_db_collection=db["edges"],
             triples=triples,
             edge_classes_with_ids=edge_classes_with_ids,
             graph_id=graph_id,
-        )
-
-        await add_graph_ontology_and_counts(
+            edge_ids=edge_ids,
+            on_progress=report(JobPhase.edges, len(triples)),
+        ),
+        create_insert_triples(
+            triples_db_collection=db["triples"],
+            triples=triples,
+            node_ids=node_ids,
+            edge_ids=edge_ids,
+            graph_id=graph_id,
+            on_progress=report(JobPhase.triples, len(triples)),
+        ),
+        add_graph_ontology_and_counts(
             graphs_db_collection=db["graphs"],
             graph_id=graph_id,
             node_classes_with_ids=node_classes_with_ids,
             edge_classes_with_ids=edge_classes_with_ids,
             start_node_count=len(nodes),
             start_edge_count=len(triples),
-        )
+        ),
+    )
 
-        await create_insert_triples(
-            triples_db_collection=db["triples"],
-            triples=triples,
-            node_ids=node_ids,
-            edge_ids=edge_ids,
+    await execute_plugins(
+        db=db, graph_id=graph_id, graph_plugins=graph_plugins, progress=progress
+    )
+
+    # Summaries include plugin errors/suggestions, so are built last
+    await refresh_neighbourhoods(graph_id=graph_id, db=db)
+    # Responses cached while the graph was populating are now stale
+    await bump_graph_version(graph_id=graph_id, db=db)
+
+    if progress is not None:
+        await progress.update(JobPhase.plugins, 100)
+
+
+ExtractFunction = Callable[
+    [JobProgress], Awaitable[Tuple[Dict[Tuple, int], Dict[Tuple, int], Set, Set]]
+]
+
+
+async def build_graph(
+    graph_id: ObjectId,
+    graph_plugins: graph_model.Plugins,
+    extract: ExtractFunction,
+    db: AsyncIOMotorDatabase,
+    progress: JobProgress,
+) -> None:
+    """
+    Extracts and populates a graph as a background job.
+
+    The partially created graph is cleaned up if any phase fails or the job is cancelled.
+    """
+    try:
+        nodes, triples, node_classes, edge_classes = await extract(progress)
+        await progress.update(JobPhase.parse, 100)
+
+        await populate_graph(
             graph_id=graph_id,
+            graph_plugins=graph_plugins,
+            nodes=nodes,
+            triples=triples,
+            node_classes=node_classes,
+            edge_classes=edge_classes,
+            db=db,
+            progress=progress,
         )
+    except BaseException as e:
+        logger.error(f"An error occurred while processing the graph: {str(e)}")
+        await cleanup_graph(graph_id=graph_id, db=db)
+        raise
+
 
-        await execute_plugins(db=db, graph_id=graph_id, graph_plugins=graph.plugins)
+async def submit_graph_job(
+    graph: graph_model.BaseGraph,
+    extract: ExtractFunction,
+    db: AsyncIOMotorDatabase,
+    cleanup: Optional[Callable[[], None]] = None,
+) -> Dict[str, str]:
+    """
+    Creates the base graph and queues the remainder of graph creation as a background job.
 
-        return {"id": str(graph_id)}
+    `cleanup` is called if the job can't be queued or is cancelled before it starts (e.g. to remove spooled uploads).
+    """
+
+    async def on_cancel(job_db: AsyncIOMotorDatabase):
+        if cleanup is not None:
+            cleanup()
+        await cleanup_graph(graph_id=graph_id, db=job_db)
+
+    try:
+        graph_id = await insert_base_graph(graph=graph, db=db)
     except PyMongoError as e:
-        logger.error(f"An error occurred while processing the graph: {str(e)}")
-        await cleanup_graph(graph_id=db_graph.inserted_id, db=db)
+        logger.error(f"An error occurred while creating the graph: {str(e)}")
+        if cleanup is not None:
+            cleanup()
         raise HTTPException(status_code=500, detail="Internal server error")
-    except Exception as e:
-        logger.error(f"An error occurred while processing the graph: {str(e)}")
-        await cleanup_graph(graph_id=db_graph.inserted_id, db=db)
-        traceback.print_exc()
+
+    try:
+        job_id = await job_queue.submit(
+            kind=JobKind.create_graph,
+            graph_id=graph_id,
+            run=lambda job_db, progress: build_graph(
+                graph_id=graph_id,
+                graph_plugins=graph.plugins,
+                extract=extract,
+                db=job_db,
+                progress=progress,
+            ),
+            on_cancel=on_cancel,
+        )
     except:
-        await cleanup_graph(graph_id=db_graph.inserted_id, db=db)
+        await on_cancel(db)
+        raise
+
+    return {"id": str(graph_id), "job_id": str(job_id)}
+
+
+async def create_graph(graph: graph_model.InputGraph, db: AsyncIOMotorDatabase):
+    """
+    Creates a graph in the database.
+
+    The base graph is created immediately and the graph's nodes, edges and triples are populated by a background job whose progress can be polled via `/jobs/{job_id}`.
+
+    Note
+    ----
+    It also executes error detection (edm) and completion (cm) plugins (if specified).
+    """
+
+    async def extract(progress: JobProgress):
+        # Extraction is CPU bound so is run off the event loop
+        return await asyncio.get_running_loop().run_in_executor(
+            None, extract_nodes_and_edges, graph
+        )
+
+    return await submit_graph_job(graph=graph, extract=extract, db=db)
+
+
+async def spool_stream(chunks: AsyncIterator[bytes]) -> str:
+    """Writes a request body stream to a temporary file and returns its path."""
+    with tempfile.NamedTemporaryFile(
+        mode="wb",
+        suffix=".ndjson",
+        dir=settings.JOB_SPOOL_DIRECTORY,
+        delete=False,
+    ) as f:
+        try:
+            async for chunk in chunks:
+                f.write(chunk)
+        except BaseException:
+            f.close()
+            os.remove(f.name)
+            raise
+        return f.name
+
+
+async def iter_file_chunks(
+    path: str, progress: Optional[JobProgress] = None, chunk_size: int = 1 << 20
+) -> AsyncIterator[bytes]:
+    """Reads a file in chunks, reporting the fraction read as parse progress."""
+    total = max(os.path.getsize(path), 1)
+    loop = asyncio.get_running_loop()
+    read = 0
+
+    with open(path, "rb") as f:
+        while True:
+            chunk = await loop.run_in_executor(None, f.read, chunk_size)
+            if not chunk:
+                break
+            read += len(chunk)
+            if progress is not None:
+                # Parsing is only complete once the final line has been folded in
+                await progress.update(JobPhase.parse, read / total * 99)
+            yield chunk
+
+
+async def create_graph_from_stream(
+    graph: graph_model.BaseGraph,
+    chunks: AsyncIterator[bytes],
+    db: AsyncIOMotorDatabase,
+):
+    """
+    Creates a graph in the database from a stream of newline-delimited (NDJSON) triples.
+
+    The request body is spooled to a temporary file and parsed by a background job. Unlike `create_graph`, the triples are never held in memory as a whole; each line is parsed and folded into the unique node/triple counts before the next chunk is read.
+
+    Note
+    ----
+    It also executes error detection (edm) and completion (cm) plugins (if specified).
+    """
+    path = await spool_stream(chunks)
+
+    def remove_spooled_upload():
+        if os.path.exists(path):
+            os.remove(path)
+
+    async def extract(progress: JobProgress):
+        try:
+            return await extract_nodes_and_edges_from_stream(
+                chunks=iter_file_chunks(path, progress=progress)
+            )
+        finally:
+            remove_spooled_upload()
+
+    return await submit_graph_job(
+        graph=graph, extract=extract, db=db, cleanup=remove_spooled_upload
+    )
@@ -0,0 +1,204 @@
+"""
+Services maintaining the degree counters stored on each node.
+
+Each node document holds:
+- `degree`: the number of triples the node is the head or tail of (a self-referencing triple counts once),
+- `in_degree`/`out_degree`: the number of triples the node is the tail/head of,
+- `active_degree`: the number of its triples whose edge is active.
+
+Counters are written with nodes when a graph is created, refreshed for the affected nodes when triples are added or rewired (merges, new items), and updated with deltas when an edge is reversed or (de)activated. `verify_degrees` recounts them from the triples to detect drift.
+"""
+
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+
+from services.bulk import batched
+from services.triples import load_items
+from settings import settings
+
+DEGREE_FIELDS = ("degree", "in_degree", "out_degree", "active_degree")
+
+
+def empty_degrees() -> Dict[str, int]:
+    return {field: 0 for field in DEGREE_FIELDS}
+
+
+def count_triple(
+    degrees: Dict[ObjectId, Dict[str, int]],
+    head: ObjectId,
+    tail: ObjectId,
+    is_active: bool,
+    sign: int = 1,
+) -> None:
+    """Adds (or with `sign` -1, removes) a triple's contribution to its head and tail's degrees"""
+    degrees[head]["out_degree"] += sign
+    degrees[tail]["in_degree"] += sign
+    for node in {head, tail}:
+        degrees[node]["degree"] += sign
+        if is_active:
+            degrees[node]["active_degree"] += sign
+
+
+def count_activation(
+    degrees: Dict[ObjectId, Dict[str, int]],
+    head: ObjectId,
+    tail: ObjectId,
+    sign: int,
+) -> None:
+    """Adds a triple's edge being activated (`sign` 1) or deactivated (-1) to its head and tail's active degrees"""
+    for node in {head, tail}:
+        degrees[node]["active_degree"] += sign
+
+
+def count_degrees(
+    triples: Iterable[Tuple[ObjectId, ObjectId, bool]],
+) -> Dict[ObjectId, Dict[str, int]]:
+    """Counts the degrees of the nodes of `(head, tail, is_active)` triples"""
+    degrees = defaultdict(empty_degrees)
+    for head, tail, is_active in triples:
+        count_triple(degrees, head, tail, is_active)
+    return degrees
+
+
+async def compute_degrees(
+    graph_id: ObjectId,
+    db: AsyncIOMotorDatabase,
+    node_ids: Optional[Iterable[ObjectId]] = None,
+) -> Dict[ObjectId, Dict[str, int]]:
+    """
+    Counts node degrees from a graph's triples.
+
+    Triples are read in batches, with only their edges' activation state loaded, so memory is bounded by the number of nodes. If `node_ids` is given, only those nodes' triples are read and only their degrees are returned.
+    """
+    nodes = None if node_ids is None else set(node_ids)
+    match = {"graph_id": graph_id}
+    if nodes is not None:
+        match["$or"] = [
+            {"head": {"$in": list(nodes)}},
+            {"tail": {"$in": list(nodes)}},
+        ]
+
+    degrees = defaultdict(empty_degrees)
+    cursor = db["triples"].find(
+        match,
+        {"_id": 0, "head": 1, "tail": 1, "edge": 1},
+        batch_size=settings.POPULATE_BATCH_SIZE,
+    )
+    batch = []
+
+    async def count(batch: List[Dict]) -> None:
+        edges = await load_items(
+            "edges", {t["edge"] for t in batch}, db, fields=("is_active",)
+        )
+        for t in batch:
+            edge = edges.get(t["edge"])
+            count_triple(
+                degrees, t["head"], t["tail"], edge is not None and edge["is_active"]
+            )
+
+    async for triple in cursor:
+        batch.append(triple)
+        if len(batch) == settings.POPULATE_BATCH_SIZE:
+            await count(batch)
+            batch = []
+    if batch:
+        await count(batch)
+
+    if nodes is None:
+        return degrees
+    return {node: degrees.get(node, empty_degrees()) for node in nodes}
+
+
+async def refresh_degrees(
+    graph_id: ObjectId,
+    db: AsyncIOMotorDatabase,
+    node_ids: Optional[Iterable[ObjectId]] = None,
+) -> Dict[ObjectId, Dict[str, int]]:
+    """
+    Recounts and stores the degrees of nodes.
+
+    Arguments
+    ---------
+    graph_id: The graph the nodes belong to.
+    node_ids: The nodes to refresh. If None, every node on the graph is refreshed.
+
+    Returns
+    -------
+    The refreshed degrees by node id.
+    """
+    if node_ids is not None:
+        node_ids = set(node_ids)
+        if not node_ids:
+            return {}
+
+    degrees = await compute_degrees(graph_id=graph_id, db=db, node_ids=node_ids)
+
+    if node_ids is None:
+        # Nodes without triples have zero degrees
+        node_ids = [
+            n["_id"] async for n in db["nodes"].find({"graph_id": graph_id}, {"_id": 1})
+        ]
+        degrees = {node: degrees.get(node, empty_degrees()) for node in node_ids}
+
+    updates = (
+        UpdateOne({"_id": node}, {"$set": node_degrees})
+        for node, node_degrees in degrees.items()
+    )
+    for batch in batched(updates, settings.BULK_WRITE_BATCH_SIZE):
+        await db["nodes"].bulk_write(batch, ordered=False)
+
+    return degrees
+
+
+async def apply_degree_deltas(
+    db: AsyncIOMotorDatabase, deltas: Dict[ObjectId, Dict[str, int]]
+) -> None:
+    """
+    Increments nodes' degree counters by `deltas` (e.g. from `count_triple` with sign -1 for removed triples).
+
+    Nodes without counters (of graphs created before they were maintained) are left for `get_stored_degrees` to count.
+    """
+    updates = (
+        UpdateOne({"_id": node, "degree": {"$exists": True}}, {"$inc": changed})
+        for node, changed in (
+            (node, {k: v for k, v in node_deltas.items() if v})
+            for node, node_deltas in deltas.items()
+        )
+        if changed
+    )
+    for batch in batched(updates, settings.BULK_WRITE_BATCH_SIZE):
+        await db["nodes"].bulk_write(batch, ordered=False)
+
+
+async def get_stored_degrees(
+    graph_id: ObjectId, node_ids: List[ObjectId], db: AsyncIOMotorDatabase
+) -> Dict[ObjectId, Dict[str, int]]:
+    """Reads nodes' stored degrees, counting them for nodes of graphs created before counters were maintained"""
+    stored = {
+        n["_id"]: n
+        async for n in db["nodes"].find(
+            {"_id": {"$in": node_ids}}, {field: 1 for field in DEGREE_FIELDS}
+        )
+    }
+    missing = [n for n in node_ids if "degree" not in stored.get(n, {})]
+    if missing:
+        stored.update(await refresh_degrees(graph_id=graph_id, db=db, node_ids=missing))
+    return stored
+
+
+async def verify_degrees(graph_id: ObjectId, db: AsyncIOMotorDatabase) -> List[Dict]:
+    """Recounts a graph's node degrees, returning the nodes whose stored degrees have drifted with both values"""
+    degrees = await compute_degrees(graph_id=graph_id, db=db)
+    drifted = []
+    async for node in db["nodes"].find(
+        {"graph_id": graph_id}, {"_id": 1, **{f: 1 for f in DEGREE_FIELDS}}
+    ):
+        actual = degrees.get(node["_id"], empty_degrees())
+        stored = {field: node.get(field) for field in DEGREE_FIELDS}
+        if stored != actual:
+            drifted.append({"_id": node["_id"], "stored": stored, "actual": actual})
+    return drifted
@@ -0,0 +1,369 @@
+"""
+Services for streaming graph exports.
+
+Unlike `services.graph.download`, which builds the whole export in memory, exports are written to the response as triples are populated in batches (see `services.triples`), so memory use is constant regardless of graph size. Triples have the same shape as `graph_model.DownloadTriple`.
+
+Columnar exports (Parquet or Arrow IPC) instead write nodes, edges and triples as separate flat tables, batching cursors into typed arrays. They require the optional `pyarrow` dependency.
+"""
+
+import asyncio
+import json
+import os
+import zipfile
+import zlib
+from datetime import datetime
+from typing import Any, AsyncIterator, Callable, Dict, List
+
+from bson import ObjectId
+from fastapi import HTTPException, status
+from fastapi.encoders import jsonable_encoder
+from loguru import logger
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from models import graph as graph_model
+from services.triples import DOWNLOAD_FIELDS, iter_populated_triples
+from settings import settings
+
+
+def download_triple(
+    triple: Dict,
+    node_id2name: Dict[ObjectId, str],
+    edge_id2name: Dict[ObjectId, str],
+) -> Dict[str, Any]:
+    """Converts a populated triple into the fields of a `graph_model.DownloadTriple`"""
+    head, edge, tail = triple["head"], triple["edge"], triple["tail"]
+    return {
+        "head": head["name"],
+        "head_type": node_id2name.get(head["type"]),
+        "head_properties": {
+            # "main": head["properties"],
+            "is_reviewed": head["is_reviewed"],
+            "is_active": head["is_active"],
+            "created_at": head["created_at"],
+            "updated_at": head["updated_at"],
+        },
+        "head_errors": head["errors"],
+        "head_suggestions": head["suggestions"],
+        "relation": edge_id2name.get(edge["type"]),
+        "relation_properties": {
+            "main": edge["properties"],
+            "is_reviewed": edge["is_reviewed"],
+            "is_active": edge["is_active"],
+            "created_at": edge["created_at"],
+            "updated_at": edge["updated_at"],
+        },
+        "relation_errors": edge["errors"],
+        "relation_suggestions": edge["suggestions"],
+        "tail": tail["name"],
+        "tail_type": node_id2name.get(tail["type"]),
+        "tail_properties": {
+            "main": tail["properties"],
+            "is_reviewed": tail["is_reviewed"],
+            "is_active": tail["is_active"],
+            "created_at": tail["created_at"],
+            "updated_at": tail["updated_at"],
+        },
+        "tail_errors": tail["errors"],
+        "tail_suggestions": tail["suggestions"],
+    }
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(value: Any) -> str:
+    return json.dumps(value, default=_json_default)
+
+
+async def export_chunks(
+    graph: Dict,
+    db: AsyncIOMotorDatabase,
+    format: graph_model.ExportFormat,
+) -> AsyncIterator[str]:
+    """
+    Yields a graph export as text chunks, one per batch of triples.
+
+    JSON exports have the same structure as `graph_model.GraphDownload` (`{"meta": ..., "data": [...]}`). NDJSON exports have a first line holding `{"meta": ...}` followed by one triple per line.
+    """
+    node_id2name = {n["_id"]: n["name"] for n in graph["node_classes"]}
+    edge_id2name = {e["_id"]: e["name"] for e in graph["edge_classes"]}
+    meta = dumps(jsonable_encoder(graph_model.DownloadMeta(**graph)))
+
+    is_ndjson = format == graph_model.ExportFormat.ndjson
+
+    def join(batch: List[str], is_first_batch: bool) -> str:
+        if is_ndjson:
+            return "\n".join(batch) + "\n"
+        return ("" if is_first_batch else ",") + ",".join(batch)
+
+    yield f'{{"meta": {meta}}}\n' if is_ndjson else f'{{"meta": {meta}, "data": ['
+
+    is_first_batch = True
+    async for triples in iter_populated_triples(
+        {"graph_id": graph["_id"]},
+        db,
+        node_fields=DOWNLOAD_FIELDS,
+        edge_fields=DOWNLOAD_FIELDS,
+        batch_size=settings.EXPORT_BATCH_SIZE,
+    ):
+        if triples:
+            yield join(
+                [
+                    dumps(download_triple(t, node_id2name, edge_id2name))
+                    for t in triples
+                ],
+                is_first_batch,
+            )
+            is_first_batch = False
+
+    if not is_ndjson:
+        yield "]}"
+
+
+async def encode_chunks(
+    chunks: AsyncIterator[str], compress: bool = False
+) -> AsyncIterator[bytes]:
+    """Encodes text chunks as UTF-8, optionally gzip compressing them as they're streamed"""
+    if not compress:
+        async for chunk in chunks:
+            yield chunk.encode("utf-8")
+        return
+
+    # wbits=31 writes a gzip header and trailer
+    compressor = zlib.compressobj(level=6, wbits=31)
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk.encode("utf-8"))
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def import_pyarrow():
+    """Imports pyarrow, which is an optional dependency only needed for columnar exports"""
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise HTTPException(
+            status_code=status.HTTP_501_NOT_IMPLEMENTED,
+            detail="Columnar exports require pyarrow (`pip install pyarrow`)",
+        )
+    return pyarrow
+
+
+COLUMNAR_FORMATS = {
+    graph_model.ExportFormat.parquet: "parquet",
+    graph_model.ExportFormat.arrow: "arrow",
+}
+
+
+def _item_columns_pipeline(graph_id: ObjectId, is_node: bool) -> List[Dict]:
+    """Projects item columns, counting errors/suggestions server-side so their arrays aren't transferred"""
+    return [
+        {"$match": {"graph_id": graph_id}},
+        {
+            "$project": {
+                **({"name": 1} if is_node else {}),
+                "type": 1,
+                "value": 1,
+                "is_reviewed": 1,
+                "is_active": 1,
+                "errors": {"$size": {"$ifNull": ["$errors", []]}},
+                "suggestions": {"$size": {"$ifNull": ["$suggestions", []]}},
+            }
+        },
+    ]
+
+
+def columnar_schemas(pa) -> Dict[str, Any]:
+    item_fields = [
+        ("type", pa.string()),
+        ("value", pa.int64()),
+        ("is_reviewed", pa.bool_()),
+        ("is_active", pa.bool_()),
+        ("errors", pa.int32()),
+        ("suggestions", pa.int32()),
+    ]
+    return {
+        "nodes": pa.schema([("id", pa.string()), ("name", pa.string()), *item_fields]),
+        "edges": pa.schema([("id", pa.string()), *item_fields]),
+        "triples": pa.schema(
+            [
+                ("id", pa.string()),
+                ("head", pa.string()),
+                ("edge", pa.string()),
+                ("tail", pa.string()),
+            ]
+        ),
+    }
+
+
+async def write_columnar_table(
+    cursor: AsyncIterator[Dict],
+    columns: Dict[str, Callable[[Dict], Any]],
+    schema: Any,
+    path: str,
+    format: graph_model.ExportFormat,
+    batch_size: int,
+) -> int:
+    """
+    Writes documents from a cursor to a Parquet or Arrow IPC file in record batches of `batch_size` rows.
+
+    Arguments
+    ---------
+    cursor: The documents to write.
+    columns: Functions extracting each column's value from a document, in schema order.
+    schema: The pyarrow schema of the table.
+    path: The file to write.
+    format: `parquet` (one row group per batch) or `arrow` (Arrow IPC file format).
+    batch_size: Number of rows buffered before a batch is converted to typed arrays and written.
+
+    Returns
+    -------
+    The number of rows written.
+    """
+    pa = import_pyarrow()
+    loop = asyncio.get_running_loop()
+
+    if format == graph_model.ExportFormat.parquet:
+        writer = pa.parquet.ParquetWriter(path, schema, compression="zstd")
+
+        def write(batch):
+            writer.write_table(pa.Table.from_batches([batch]))
+
+    else:
+        writer = pa.ipc.new_file(
+            path, schema, options=pa.ipc.IpcWriteOptions(compression="zstd")
+        )
+        write = writer.write_batch
+
+    getters = list(columns.values())
+    buffers = [[] for _ in getters]
+    rows = 0
+
+    async def flush():
+        batch = pa.record_batch(
+            [
+                pa.array(values, type=field.type)
+                for values, field in zip(buffers, schema)
+            ],
+            schema=schema,
+        )
+        # Encoding and compression are CPU bound, so are kept off the event loop
+        await loop.run_in_executor(None, write, batch)
+        for values in buffers:
+            values.clear()
+
+    try:
+        async for document in cursor:
+            for values, getter in zip(buffers, getters):
+                values.append(getter(document))
+            rows += 1
+            if rows % batch_size == 0:
+                await flush()
+        if rows % batch_size or rows == 0:
+            await flush()
+    finally:
+        writer.close()
+
+    return rows
+
+
+async def export_columnar(
+    graph: Dict,
+    db: AsyncIOMotorDatabase,
+    format: graph_model.ExportFormat,
+    directory: str,
+) -> str:
+    """
+    Writes a graph's nodes, edges and triples as separate columnar files and zips them with the graph's metadata.
+
+    Item types are written as class names and ids as hex strings. Rows are read and written in batches of `settings.EXPORT_ROW_GROUP_SIZE`, so memory is bounded regardless of graph size; the files are written to `directory`.
+
+    Returns
+    -------
+    The path of the zip archive.
+    """
+    pa = import_pyarrow()
+    schemas = columnar_schemas(pa)
+    extension = COLUMNAR_FORMATS[format]
+    batch_size = settings.EXPORT_ROW_GROUP_SIZE
+    graph_id = graph["_id"]
+
+    node_id2name = {n["_id"]: n["name"] for n in graph["node_classes"]}
+    edge_id2name = {e["_id"]: e["name"] for e in graph["edge_classes"]}
+
+    def item_columns(id2name: Dict[ObjectId, str], is_node: bool):
+        return {
+            "id": lambda d: str(d["_id"]),
+            **({"name": lambda d: d["name"]} if is_node else {}),
+            "type": lambda d: id2name.get(d["type"]),
+            "value": lambda d: d.get("value"),
+            "is_reviewed": lambda d: d.get("is_reviewed"),
+            "is_active": lambda d: d.get("is_active"),
+            "errors": lambda d: d["errors"],
+            "suggestions": lambda d: d["suggestions"],
+        }
+
+    tables = {
+        "nodes": (
+            db["nodes"].aggregate(
+                _item_columns_pipeline(graph_id, is_node=True), batchSize=batch_size
+            ),
+            item_columns(node_id2name, is_node=True),
+        ),
+        "edges": (
+            db["edges"].aggregate(
+                _item_columns_pipeline(graph_id, is_node=False), batchSize=batch_size
+            ),
+            item_columns(edge_id2name, is_node=False),
+        ),
+        "triples": (
+            db["triples"].find(
+                {"graph_id": graph_id},
+                {"_id": 1, "head": 1, "edge": 1, "tail": 1},
+                batch_size=batch_size,
+            ),
+            {
+                "id": lambda d: str(d["_id"]),
+                "head": lambda d: str(d["head"]),
+                "edge": lambda d: str(d["edge"]),
+                "tail": lambda d: str(d["tail"]),
+            },
+        ),
+    }
+
+    paths = {"meta.json": os.path.join(directory, "meta.json")}
+    with open(paths["meta.json"], "w") as f:
+        f.write(dumps(jsonable_encoder(graph_model.DownloadMeta(**graph))))
+
+    for name, (cursor, columns) in tables.items():
+        filename = f"{name}.{extension}"
+        paths[filename] = os.path.join(directory, filename)
+        rows = await write_columnar_table(
+            cursor=cursor,
+            columns=columns,
+            schema=schemas[name],
+            path=paths[filename],
+            format=format,
+            batch_size=batch_size,
+        )
+        logger.info(f"Exported {rows} {name} of graph {graph_id} as {extension}")
+
+    archive_path = os.path.join(directory, f"{graph_id}.{extension}.zip")
+
+    def write_archive():
+        # The files are already compressed, so are stored as is
+        with zipfile.ZipFile(archive_path, "w", compression=zipfile.ZIP_STORED) as z:
+            for filename, path in paths.items():
+                z.write(path, arcname=filename)
+                os.remove(path)
+
+    await asyncio.get_running_loop().run_in_executor(None, write_archive)
+    return archive_path
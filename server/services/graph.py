@@ -1,15 +1,31 @@
 """Services for performing CRUD operation on entire graphs"""
 
-from typing import List, Dict, Tuple, Optional
+from typing import Any, List, Dict, Tuple, Optional
 from fastapi import HTTPException, status
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ASCENDING, DESCENDING
+import base64
+import json
+import re
 import traceback
 from loguru import logger
 
 from services.utils import flatten_nested_dict
+from services.neighbourhood import ensure_neighbourhoods, get_review_progress
+from services.degree import get_stored_degrees
+from services.jobs import JobProgress, job_queue
+from services.export import download_triple
+from services.triples import (
+    DOWNLOAD_FIELDS,
+    find_populated_triples,
+    iter_populated_triples,
+)
 from models import graph as graph_model
+from models.job import JobKind, JobPhase, JobStatus
 from models.misc import SettingUpdate
+from settings import settings
 
 
 async def read_graphs(
@@ -34,152 +50,110 @@ async def read_graphs(
 async def get_subgraph_review_progress(graph_id: ObjectId, db: AsyncIOMotorDatabase):
     """Fetches the reviewed progress on graph subgraphs
 
-    # TODO: OPTIMISE AND MAKE MORE EFFICIENT - SHOULD HAVE LIMIT ON SUBGRAPHS TO CHECK!
+    Progress is read from the graph's reviewed counters and the neighbourhood summaries maintained on each node (see `services/neighbourhood.py`).
     """
-    nodes = (
-        await db["nodes"]
-        .find(
-            {"graph_id": graph_id},
-            {
-                "_id": 1,
-                "value": 1,
-                "errors": 1,
-                "suggestions": 1,
-                "is_reviewed": 1,
-            },
+    return await get_review_progress(graph_id=graph_id, db=db)
+
+
+SUBGRAPH_SORT_FIELDS = {
+    graph_model.SubGraphSort.errors: "neighbourhood.errors",
+    graph_model.SubGraphSort.suggestions: "neighbourhood.suggestions",
+    graph_model.SubGraphSort.progress: "neighbourhood.reviewed_progress",
+    graph_model.SubGraphSort.value: "value",
+}
+
+
+def subgraph_query(graph_id: ObjectId, search: Optional[str] = None) -> Dict:
+    """Matches the nodes centring subgraphs (those with at least one triple), optionally filtered by a case-insensitive name search"""
+    query = {"graph_id": graph_id, "neighbourhood.edge_count": {"$gt": 0}}
+    if search:
+        query["name"] = {"$regex": re.escape(search), "$options": "i"}
+    return query
+
+
+def encode_cursor(value: Any, _id: ObjectId) -> str:
+    """Encodes the sort value and id of the last subgraph on a page as an opaque cursor"""
+    return base64.urlsafe_b64encode(json.dumps([value, str(_id)]).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[Any, ObjectId]:
+    try:
+        value, _id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return value, ObjectId(_id)
+    except (ValueError, TypeError, InvalidId):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+async def get_subgraph_totals(graph_id: ObjectId, db: AsyncIOMotorDatabase) -> Dict:
+    """Sums the errors and suggestions over a graph's subgraphs"""
+    totals = await (
+        db["nodes"]
+        .aggregate(
+            [
+                {"$match": subgraph_query(graph_id)},
+                {
+                    "$group": {
+                        "_id": None,
+                        "subgraph_count": {"$sum": 1},
+                        "total_errors": {"$sum": "$neighbourhood.errors"},
+                        "total_suggestions": {"$sum": "$neighbourhood.suggestions"},
+                    }
+                },
+                {"$project": {"_id": 0}},
+            ]
         )
-        .to_list(None)
+        .to_list(1)
     )
-    edges = (
-        await db["edges"]
-        .find(
-            {"graph_id": graph_id},
-            {
-                "_id": 1,
-                "is_reviewed": 1,
-            },
-        )
-        .to_list(None)
+    return (
+        totals[0]
+        if totals
+        else {"subgraph_count": 0, "total_errors": 0, "total_suggestions": 0}
     )
 
-    # 1. Create neighbours
-    pipeline = [
-        {"$match": {"graph_id": graph_id}},
-        {
-            "$facet": {
-                "fromHead": [
-                    {
-                        "$group": {
-                            "_id": "$head",
-                            "nodes": {"$addToSet": "$tail"},
-                            "links": {"$addToSet": "$edge"},
-                        }
-                    }
-                ],
-                "fromTail": [
-                    {
-                        "$group": {
-                            "_id": "$tail",
-                            "nodes": {"$addToSet": "$head"},
-                            "links": {"$addToSet": "$edge"},
-                        }
-                    }
-                ],
-            }
-        },
-        {"$project": {"all": {"$concatArrays": ["$fromHead", "$fromTail"]}}},
-        {"$unwind": "$all"},
-        {
-            "$group": {
-                "_id": "$all._id",
-                "nodes": {"$addToSet": "$all.nodes"},
-                "links": {"$addToSet": "$all.links"},
-            }
-        },
+
+async def get_graph_overview(
+    graph_id: ObjectId, db: AsyncIOMotorDatabase
+) -> graph_model.GraphOverview:
+    """Fetches a graph's overview statistics (totals and reviewed counts) without its subgraphs"""
+    db_graph = await db["graphs"].find_one(
+        {"_id": graph_id},
         {
-            "$project": {
-                "_id": 1,
-                "nodes": {
-                    "$reduce": {
-                        "input": "$nodes",
-                        "initialValue": [],
-                        "in": {"$setUnion": ["$$this", "$$value"]},
-                    }
-                },
-                "links": {
-                    "$reduce": {
-                        "input": "$links",
-                        "initialValue": [],
-                        "in": {"$setUnion": ["$$this", "$$value"]},
-                    }
-                },
-            }
+            "name": 1,
+            "start_node_count": 1,
+            "start_edge_count": 1,
+            "neighbourhoods_built": 1,
+            "reviewed_nodes": 1,
+            "reviewed_edges": 1,
         },
-    ]
+    )
 
-    neighbours = await db["triples"].aggregate(pipeline).to_list(None)
-    # print("neighbours", neighbours)
+    if db_graph is None:
+        raise HTTPException(status_code=404, detail="Graph not found")
 
-    # 2. Get counts of errors on all nodes/edges
-    node_counts = {
-        n["_id"]: {
-            "is_reviewed": n["is_reviewed"],
-        }
-        for n in nodes
-    }
-    edge_counts = {
-        e["_id"]: {
-            "is_reviewed": e["is_reviewed"],
-        }
-        for e in edges
-    }
+    await ensure_neighbourhoods(graph=db_graph, db=db)
 
-    reviewed_nodes = sum([n["is_reviewed"] for n in nodes])
-    reviewed_edges = sum([e["is_reviewed"] for e in edges])
-
-    # 3. Aggregate on neighbour keys
-    subgraph_progress = {}
-    for neigh in neighbours:
-        node_id = neigh["_id"]
-
-        _nodes = 1  # Starts from one as the central node isn't included in its own neighbours
-        _edges = 0
-        _nodes_reviewed = int(
-            node_counts[node_id]["is_reviewed"]
-        )  # Starts with the count of the central nodes "is_reviewed" state.
-        _edges_reviewed = 0
-
-        for n_id in neigh["nodes"]:
-            _nodes_reviewed += int(node_counts[n_id]["is_reviewed"])
-            _nodes += 1
-
-        for e_id in neigh["links"]:
-            _edges_reviewed += int(edge_counts[e_id]["is_reviewed"])
-            _edges += 1
-
-        subgraph_progress[str(node_id)] = {
-            "node_count": _nodes,
-            "edge_count": _edges,
-            "nodes_reviewed": _nodes_reviewed,
-            "edges_reviewed": _edges_reviewed,
-            "reviewed_progress": round(
-                (_nodes_reviewed + _edges_reviewed) / (_nodes + _edges) * 100
-            )
-            if _nodes + _edges > 0
-            else 0,
-        }
-
-    return reviewed_nodes, reviewed_edges, subgraph_progress
+    return graph_model.GraphOverview(
+        **db_graph, **await get_subgraph_totals(graph_id=graph_id, db=db)
+    )
 
 
-async def read_graph(graph_id: ObjectId, db: AsyncIOMotorDatabase) -> graph_model.Graph:
+async def read_graph(
+    graph_id: ObjectId,
+    db: AsyncIOMotorDatabase,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    sort: graph_model.SubGraphSort = graph_model.SubGraphSort.value,
+    order: graph_model.SortOrder = graph_model.SortOrder.desc,
+    search: Optional[str] = None,
+) -> graph_model.Graph:
     """
     Fetches the details of a single graph.
 
-    TODO
-    ----
-    - Compute errors and suggestions for subgraphs and return them.
-    - Make process more efficient
+    Subgraph errors, suggestions and progress are read from the neighbourhood summaries maintained on each node and reviewed counts from the graph's counters. Only nodes with at least one triple centre a subgraph.
+
+    Subgraphs are paginated by keyset: each page is sorted by `sort` then `_id` and the returned `next_cursor` encodes the last subgraph's position, so fetching any page is an indexed range scan regardless of its depth. If `limit` is None, all matching subgraphs are returned.
+
+    Error and suggestion totals aggregate over every subgraph, so are only computed for the first page (without a `cursor`); later pages leave them unset. `get_graph_overview` serves them on their own.
     """
 
     try:
@@ -188,185 +162,71 @@ async def read_graph(graph_id: ObjectId, db: AsyncIOMotorDatabase) -> graph_mode
         if db_graph is None:
             raise HTTPException(status_code=404, detail="Graph not found")
 
-        nodes = (
-            await db["nodes"]
+        await ensure_neighbourhoods(graph=db_graph, db=db)
+
+        sort_field = SUBGRAPH_SORT_FIELDS[sort]
+        direction = DESCENDING if order == graph_model.SortOrder.desc else ASCENDING
+
+        query = subgraph_query(graph_id=graph_id, search=search)
+        if cursor:
+            value, last_id = decode_cursor(cursor)
+            operator = "$lt" if direction == DESCENDING else "$gt"
+            query["$or"] = [
+                {sort_field: {operator: value}},
+                {sort_field: value, "_id": {operator: last_id}},
+            ]
+
+        nodes_cursor = (
+            db["nodes"]
             .find(
-                {"graph_id": graph_id},
+                query,
                 {
                     "_id": 1,
                     "name": 1,
                     "type": 1,
                     "value": 1,
-                    "errors": 1,
-                    "suggestions": 1,
-                    "is_reviewed": 1,
+                    "neighbourhood": 1,
                 },
             )
-            .to_list(None)
+            .sort([(sort_field, direction), ("_id", direction)])
         )
-        node_id2detail = {n["_id"]: n for n in nodes}
-        edges = (
-            await db["edges"]
-            .find(
-                {"graph_id": graph_id},
-                {
-                    "_id": 1,
-                    "name": 1,
-                    "value": 1,
-                    "errors": 1,
-                    "suggestions": 1,
-                    "is_reviewed": 1,
-                },
+        if limit is not None:
+            # One extra subgraph is fetched to tell whether there's a next page
+            nodes_cursor = nodes_cursor.limit(limit + 1)
+        nodes = await nodes_cursor.to_list(None)
+
+        next_cursor = None
+        if limit is not None and len(nodes) > limit:
+            nodes = nodes[:limit]
+            last_value = nodes[-1]
+            for key in sort_field.split("."):
+                last_value = last_value[key]
+            next_cursor = encode_cursor(last_value, nodes[-1]["_id"])
+
+        subgraphs = [
+            graph_model.SubGraph(
+                _id=n["_id"],
+                name=n["name"],
+                value=n["value"],
+                type=n["type"],
+                **n["neighbourhood"],
             )
-            .to_list(None)
-        )
-
-        # Get errors and suggestions on subgraphs centred on nodes...
-
-        # 1. Create neighbours
-        pipeline = [
-            {"$match": {"graph_id": graph_id}},
-            {
-                "$facet": {
-                    "fromHead": [
-                        {
-                            "$group": {
-                                "_id": "$head",
-                                "nodes": {"$addToSet": "$tail"},
-                                "links": {"$addToSet": "$edge"},
-                            }
-                        }
-                    ],
-                    "fromTail": [
-                        {
-                            "$group": {
-                                "_id": "$tail",
-                                "nodes": {"$addToSet": "$head"},
-                                "links": {"$addToSet": "$edge"},
-                            }
-                        }
-                    ],
-                }
-            },
-            {"$project": {"all": {"$concatArrays": ["$fromHead", "$fromTail"]}}},
-            {"$unwind": "$all"},
-            {
-                "$group": {
-                    "_id": "$all._id",
-                    "nodes": {"$addToSet": "$all.nodes"},
-                    "links": {"$addToSet": "$all.links"},
-                }
-            },
-            {
-                "$project": {
-                    "_id": 1,
-                    "nodes": {
-                        "$reduce": {
-                            "input": "$nodes",
-                            "initialValue": [],
-                            "in": {"$setUnion": ["$$this", "$$value"]},
-                        }
-                    },
-                    "links": {
-                        "$reduce": {
-                            "input": "$links",
-                            "initialValue": [],
-                            "in": {"$setUnion": ["$$this", "$$value"]},
-                        }
-                    },
-                }
-            },
-        ]
-
-        neighbours = await db["triples"].aggregate(pipeline).to_list(None)
-        # print("neighbours", neighbours)
-
-        # 2. Get counts of errors on all nodes/edges
-        node_counts = {
-            n["_id"]: {
-                "errors": len(n["errors"]),
-                "suggestions": len(n["suggestions"]),
-                "is_reviewed": n["is_reviewed"],
-            }
             for n in nodes
-        }
-        edge_counts = {
-            e["_id"]: {
-                "errors": len(e["errors"]),
-                "suggestions": len(e["suggestions"]),
-                "is_reviewed": e["is_reviewed"],
-            }
-            for e in edges
-        }
-
-        # print("node_counts", node_counts)
-        # print("edge_counts", edge_counts)
-
-        reviewed_nodes = sum([n["is_reviewed"] for n in nodes])
-        reviewed_edges = sum([e["is_reviewed"] for e in edges])
-
-        # print("reviewed_nodes", reviewed_nodes)
-        # print("reviewed_edges", reviewed_edges)
-
-        # 3. Aggregate errors on neighbour keys
-        total_errors = 0
-        total_suggestions = 0
-        subgraphs = []
-        for neigh in neighbours:
-            node_id = neigh["_id"]
-
-            _errors = 0
-            _suggestions = 0
-            _nodes = 1  # Starts from one as the central node isn't included in its own neighbours
-            _edges = 0
-            _nodes_reviewed = int(
-                node_counts[node_id]["is_reviewed"]
-            )  # Starts with the count of the central nodes "is_reviewed" state.
-            _edges_reviewed = 0
-
-            for n_id in neigh["nodes"]:
-                _errors += node_counts[n_id]["errors"]
-                _suggestions += node_counts[n_id]["suggestions"]
-
-                _nodes_reviewed += int(node_counts[n_id]["is_reviewed"])
-                _nodes += 1
-
-            for e_id in neigh["links"]:
-                _errors += edge_counts[e_id]["errors"]
-                _suggestions += edge_counts[e_id]["suggestions"]
-
-                _edges_reviewed += int(edge_counts[e_id]["is_reviewed"])
-                _edges += 1
-
-            subgraphs.append(
-                graph_model.SubGraph(
-                    _id=node_id,
-                    name=node_id2detail[node_id]["name"],
-                    value=node_id2detail[node_id]["value"],
-                    errors=_errors,
-                    node_count=_nodes,
-                    edge_count=_edges,
-                    nodes_reviewed=_nodes_reviewed,
-                    edges_reviewed=_edges_reviewed,
-                    suggestions=_suggestions,
-                    reviewed_progress=int(
-                        (_nodes_reviewed + _edges_reviewed) / (_nodes + _edges) * 100
-                    ),
-                    type=node_id2detail[node_id]["type"],
-                )
-            )
+        ]
 
-            total_errors += _errors
-            total_suggestions += _suggestions
+        totals = {}
+        if cursor is None:
+            totals = await get_subgraph_totals(graph_id=graph_id, db=db)
 
         return graph_model.Graph(
             **db_graph,
             subgraphs=subgraphs,
-            reviewed_nodes=reviewed_nodes,
-            reviewed_edges=reviewed_edges,
-            total_errors=total_errors,
-            total_suggestions=total_suggestions,
+            next_cursor=next_cursor,
+            total_errors=totals.get("total_errors"),
+            total_suggestions=totals.get("total_suggestions"),
         )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f'Error occurred on "read graph": {e}')
 
@@ -504,59 +364,28 @@ async def get_subgraph(
         focus_node_id = ObjectId(focus_node_id)
 
         focus_node = await db["nodes"].find_one({"_id": focus_node_id})
+        if "degree" in focus_node:
+            max_triples = focus_node["degree"]
+        else:
+            degrees = await get_stored_degrees(
+                graph_id=graph_id, node_ids=[focus_node_id], db=db
+            )
+            max_triples = degrees[focus_node_id]["degree"]
         focus_node = graph_model.Node(
             **{**focus_node, "color": nodeId2Details[focus_node["type"]]["color"]}
         )
 
-        max_triples = await db["triples"].count_documents(
+        # Whole items are loaded, as nodes are validated as `graph_model.Node`s
+        triples = await find_populated_triples(
             {
                 "graph_id": graph_id,
                 "$or": [{"head": focus_node_id}, {"tail": focus_node_id}],
-            }
-        )
-
-        pipeline = [
-            {
-                "$match": {
-                    "graph_id": graph_id,
-                    "$or": [{"head": focus_node_id}, {"tail": focus_node_id}],
-                }
-            },
-            {
-                "$lookup": {
-                    "from": "nodes",
-                    "localField": "head",
-                    "foreignField": "_id",
-                    "as": "head",
-                }
-            },
-            {
-                "$lookup": {
-                    "from": "nodes",
-                    "localField": "tail",
-                    "foreignField": "_id",
-                    "as": "tail",
-                }
             },
-            {
-                "$lookup": {
-                    "from": "edges",
-                    "localField": "edge",
-                    "foreignField": "_id",
-                    "as": "edge",
-                }
-            },
-            {"$unwind": "$head"},
-            {"$unwind": "$tail"},
-            {"$unwind": "$edge"},
-            {
-                "$sort": {"head._id": 1, "edge._id": 1, "tail._id": 1, "_id": 1},
-            },
-            {"$skip": skip},
-            {"$limit": limit},
-        ]
-
-        triples = await db["triples"].aggregate(pipeline).to_list(None)
+            db,
+            sort=[("head", 1), ("edge", 1), ("tail", 1), ("_id", 1)],
+            skip=skip,
+            limit=limit,
+        )
 
         # Add "color" to items so the graph in the UI can render accordingly
         triples = [
@@ -603,29 +432,189 @@ async def get_subgraph(
         logger.error(f"An error occurred: {e}")
 
 
-async def delete_graph(graph_id: ObjectId, db: AsyncIOMotorDatabase):
-    """Deletes a single graph including its nodes, edges, and triples."""
+# Collections of graph-owned items, in the order they're deleted (triples first, so no triple is left referencing a deleted item)
+GRAPH_ITEM_COLLECTIONS = [
+    (JobPhase.triples, "triples"),
+    (JobPhase.edges, "edges"),
+    (JobPhase.nodes, "nodes"),
+]
 
-    try:
-        db_graph = await db["graphs"].find_one({"_id": graph_id})
+# How long deleting a graph waits for its cancelled creation job to clean up
+JOB_CANCEL_WAIT_SECONDS = 30
 
-        if db_graph is None:
-            raise Exception("Graph not found")
 
-        await db["graphs"].delete_one({"_id": graph_id})
-        await db["edges"].delete_one({"graph_id": graph_id})
-        await db["nodes"].delete_one({"graph_id": graph_id})
-        await db["triples"].delete_one({"graph_id": graph_id})
+async def delete_graph_items(
+    graph_id: ObjectId,
+    db: AsyncIOMotorDatabase,
+    progress: Optional[JobProgress] = None,
+) -> Dict[str, int]:
+    """
+    Deletes all of a graph's triples, edges and nodes.
+
+    Documents are removed in batches of `settings.DELETE_BATCH_SIZE` ids, so each `delete_many` is bounded rather than one long-running delete holding the collection's write load for a whole graph. Progress is reported per collection if `progress` is given.
 
-        return "Deleted graph"
-    except Exception as e:
-        logger.error(f"Failed to delete graph: {e}")
+    Returns
+    -------
+    The number of documents deleted by collection.
+    """
+    deleted = {}
+    for phase, collection in GRAPH_ITEM_COLLECTIONS:
+        total = (
+            await db[collection].count_documents({"graph_id": graph_id})
+            if progress is not None
+            else 0
+        )
+        deleted[collection] = 0
+        while True:
+            ids = [
+                d["_id"]
+                async for d in db[collection].find(
+                    {"graph_id": graph_id}, {"_id": 1}, limit=settings.DELETE_BATCH_SIZE
+                )
+            ]
+            if not ids:
+                break
+            result = await db[collection].delete_many({"_id": {"$in": ids}})
+            deleted[collection] += result.deleted_count
+            if progress is not None:
+                await progress.update(
+                    phase, min(99, deleted[collection] * 100 // max(total, 1))
+                )
+        if progress is not None:
+            await progress.update(phase, 100)
+
+    logger.info(f"Deleted items of graph {graph_id}: {deleted}")
+    return deleted
+
+
+async def delete_graph(graph_id: ObjectId, db: AsyncIOMotorDatabase) -> Dict[str, Any]:
+    """
+    Deletes a single graph including its nodes, edges, triples and finished jobs.
+
+    Queued or running jobs for the graph (i.e. its creation) are cancelled first; if one doesn't finish in time (or is run by another server process), a 409 is raised so the deletion can be retried. The graph document is then removed, so the graph is gone from listings immediately. Graphs with more than `settings.DELETE_JOB_THRESHOLD` nodes and edges then have their items deleted by a background job (whose progress can be polled on `/jobs/{job_id}`); smaller graphs are deleted before returning.
+
+    Returns
+    -------
+    The deleted graph's id, and the id of the job deleting its items (None if they were deleted inline).
+    """
+    db_graph = await db["graphs"].find_one(
+        {"_id": graph_id}, {"start_node_count": 1, "start_edge_count": 1}
+    )
+    if db_graph is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Graph not found"
+        )
+
+    # Jobs still creating the graph would keep inserting items after the cascade below
+    active_job_ids = await db["jobs"].distinct(
+        "_id",
+        {
+            "graph_id": graph_id,
+            "status": {"$in": [JobStatus.queued.value, JobStatus.running.value]},
+        },
+    )
+    for job_id in active_job_ids:
+        await job_queue.cancel(job_id=job_id)
+        if not await job_queue.wait(job_id=job_id, timeout=JOB_CANCEL_WAIT_SECONDS):
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="The graph is still being created - its creation has been cancelled, please try again shortly",
+            )
+
+    await db["graphs"].delete_one({"_id": graph_id})
+    await db["jobs"].delete_many(
+        {
+            "graph_id": graph_id,
+            "status": {"$nin": [JobStatus.queued.value, JobStatus.running.value]},
+        }
+    )
+
+    size = (db_graph.get("start_node_count") or 0) + (
+        db_graph.get("start_edge_count") or 0
+    )
+    if size > settings.DELETE_JOB_THRESHOLD:
+
+        async def run(job_db: AsyncIOMotorDatabase, progress: JobProgress) -> None:
+            await delete_graph_items(graph_id=graph_id, db=job_db, progress=progress)
+
+        try:
+            job_id = await job_queue.submit(
+                kind=JobKind.delete_graph, run=run, graph_id=graph_id
+            )
+            return {"id": str(graph_id), "job_id": str(job_id)}
+        except HTTPException as e:
+            # The graph document is already deleted, so its items are removed now rather than left orphaned
+            logger.warning(
+                f"Could not queue deletion of graph {graph_id} ({e.detail}) - deleting inline"
+            )
+
+    await delete_graph_items(graph_id=graph_id, db=db)
+    return {"id": str(graph_id), "job_id": None}
+
+
+async def find_orphaned_graph_ids(db: AsyncIOMotorDatabase) -> List[ObjectId]:
+    """
+    Finds the ids of deleted graphs that still own nodes, edges or triples (e.g. left by interrupted deletions).
+
+    Graphs with a queued or running job (such as an in-progress deletion) are excluded.
+    """
+    graph_ids = set(await db["graphs"].distinct("_id"))
+    busy_ids = set(
+        await db["jobs"].distinct(
+            "graph_id",
+            {"status": {"$in": [JobStatus.queued.value, JobStatus.running.value]}},
+        )
+    )
+    orphaned_ids = set()
+    for _, collection in GRAPH_ITEM_COLLECTIONS:
+        orphaned_ids.update(await db[collection].distinct("graph_id"))
+    return sorted(orphaned_ids - graph_ids - busy_ids - {None})
+
+
+async def collect_orphans(
+    db: AsyncIOMotorDatabase, dry_run: bool = False
+) -> Dict[str, int]:
+    """
+    Deletes documents belonging to graphs that no longer exist: the items of orphaned graphs and their finished jobs.
+
+    Returns
+    -------
+    The number of documents deleted (or, if `dry_run`, that would be deleted) by collection.
+    """
+    orphaned_ids = await find_orphaned_graph_ids(db=db)
+    collected = {collection: 0 for _, collection in GRAPH_ITEM_COLLECTIONS}
+
+    for graph_id in orphaned_ids:
+        if dry_run:
+            for _, collection in GRAPH_ITEM_COLLECTIONS:
+                collected[collection] += await db[collection].count_documents(
+                    {"graph_id": graph_id}
+                )
+        else:
+            deleted = await delete_graph_items(graph_id=graph_id, db=db)
+            for collection, count in deleted.items():
+                collected[collection] += count
+
+    graph_ids = await db["graphs"].distinct("_id")
+    jobs_query = {
+        "graph_id": {"$nin": graph_ids + [None]},
+        "status": {"$nin": [JobStatus.queued.value, JobStatus.running.value]},
+    }
+    if dry_run:
+        collected["jobs"] = await db["jobs"].count_documents(jobs_query)
+    else:
+        collected["jobs"] = (await db["jobs"].delete_many(jobs_query)).deleted_count
+
+    return collected
 
 
 async def download(
     graph_id: ObjectId, db: AsyncIOMotorDatabase
 ):  # -> graph_model.GraphDownload:
-    """Prepares graph data for download as JSON in client. Converts _id types to human readable format."""
+    """Prepares graph data for download as JSON in client. Converts _id types to human readable format.
+
+    The whole export is built in memory; large graphs should be exported with `services.export`, which streams it.
+    """
     try:
         graph = await db["graphs"].find_one({"_id": graph_id})
 
@@ -637,93 +626,22 @@ async def download(
         nodeId2Name = {n["_id"]: n["name"] for n in graph["node_classes"]}
         edgeId2Name = {e["_id"]: e["name"] for e in graph["edge_classes"]}
 
-        triple_pipeline = [
-            {
-                "$match": {
-                    "graph_id": graph_id,
-                }
-            },
-            {
-                "$lookup": {
-                    "from": "nodes",
-                    "localField": "head",
-                    "foreignField": "_id",
-                    "as": "head",
-                }
-            },
-            {
-                "$lookup": {
-                    "from": "nodes",
-                    "localField": "tail",
-                    "foreignField": "_id",
-                    "as": "tail",
-                }
-            },
-            {
-                "$lookup": {
-                    "from": "edges",
-                    "localField": "edge",
-                    "foreignField": "_id",
-                    "as": "edge",
-                }
-            },
-            {"$unwind": "$head"},
-            {"$unwind": "$tail"},
-            {"$unwind": "$edge"},
-            {
-                "$project": {
-                    "_id": 0,
-                    "graph_id": 0,
-                    "head.graph_id": 0,
-                    "head._id": 0,
-                    "edge.graph_id": 0,
-                    "edge._id": 0,
-                    "tail.graph_id": 0,
-                    "tail._id": 0,
-                }
-            },
-        ]
-
-        triples = await db["triples"].aggregate(triple_pipeline).to_list(None)
-
         # Transform triples
-        data = [
-            graph_model.DownloadTriple(
-                head=t["head"]["name"],
-                head_type=nodeId2Name.get(t["head"]["type"]),
-                head_properties={
-                    # "main": t["head"]["properties"],
-                    "is_reviewed": t["head"]["is_reviewed"],
-                    "is_active": t["head"]["is_active"],
-                    "created_at": t["head"]["created_at"],
-                    "updated_at": t["head"]["updated_at"],
-                },
-                head_errors=t["head"]["errors"],
-                head_suggestions=t["head"]["suggestions"],
-                relation=edgeId2Name.get(t["edge"]["type"]),
-                relation_properties={
-                    "main": t["edge"]["properties"],
-                    "is_reviewed": t["edge"]["is_reviewed"],
-                    "is_active": t["edge"]["is_active"],
-                    "created_at": t["edge"]["created_at"],
-                    "updated_at": t["edge"]["updated_at"],
-                },
-                relation_errors=t["edge"]["errors"],
-                relation_suggestions=t["edge"]["suggestions"],
-                tail=t["tail"]["name"],
-                tail_type=nodeId2Name.get(t["tail"]["type"]),
-                tail_properties={
-                    "main": t["tail"]["properties"],
-                    "is_reviewed": t["tail"]["is_reviewed"],
-                    "is_active": t["tail"]["is_active"],
-                    "created_at": t["tail"]["created_at"],
-                    "updated_at": t["tail"]["updated_at"],
-                },
-                tail_errors=t["tail"]["errors"],
-                tail_suggestions=t["tail"]["suggestions"],
+        data = []
+        async for triples in iter_populated_triples(
+            {"graph_id": graph_id},
+            db,
+            node_fields=DOWNLOAD_FIELDS,
+            edge_fields=DOWNLOAD_FIELDS,
+        ):
+            data.extend(
+                graph_model.DownloadTriple(
+                    **download_triple(
+                        t, node_id2name=nodeId2Name, edge_id2name=edgeId2Name
+                    )
+                )
+                for t in triples
             )
-            for t in triples
-        ]
 
         meta = graph_model.DownloadMeta(**graph)
         return graph_model.GraphDownload(meta=meta, data=data)
@@ -756,7 +674,11 @@ async def update_settings(
 
         result = await db["graphs"].update_one(
             {"_id": graph_id},
-            {"$set": update_data, "$currentDate": {"updated_at": True}},
+            {
+                "$set": update_data,
+                "$currentDate": {"updated_at": True},
+                "$inc": {"version": 1},
+            },
             upsert=True,
         )
         # Return if modified.
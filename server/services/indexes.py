@@ -0,0 +1,133 @@
+"""
+Declarations of the indexes required by the API's queries.
+
+Every hot query is scoped to a single graph, so indexes lead with `graph_id`. `ensure_indexes` creates them (it is idempotent) and `verify_indexes` reports any that are missing. Both run at startup (see `main.py`) and are available via `db_manager.py`.
+"""
+
+from typing import Dict, List, NamedTuple, Tuple
+
+from loguru import logger
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ASCENDING, IndexModel
+
+
+class IndexDeclaration(NamedTuple):
+    collection: str
+    keys: List[Tuple[str, int]]
+    name: str
+    serves: str  # The queries that rely on the index
+
+
+INDEXES: List[IndexDeclaration] = [
+    IndexDeclaration(
+        collection="nodes",
+        keys=[("graph_id", ASCENDING), ("name", ASCENDING), ("type", ASCENDING)],
+        name="graph_id_name_type",
+        serves="node lookups by name/type (update_item, merge_nodes, add_graph_items) and graph-scoped node scans (read_graph, errors, suggestions, delete_graph_items, gc-orphans)",
+    ),
+    *[
+        IndexDeclaration(
+            collection="nodes",
+            keys=[("graph_id", ASCENDING), (field, ASCENDING), ("_id", ASCENDING)],
+            name=f"graph_id_{field.replace('.', '_')}_id",
+            serves=f"keyset pagination of subgraphs sorted by {field} (read_graph)",
+        )
+        for field in [
+            "neighbourhood.errors",
+            "neighbourhood.suggestions",
+            "neighbourhood.reviewed_progress",
+            "value",
+        ]
+    ],
+    IndexDeclaration(
+        collection="edges",
+        keys=[("graph_id", ASCENDING)],
+        name="graph_id",
+        serves="graph-scoped edge scans (read_graph, get_subgraph_review_progress, delete_graph_items, gc-orphans)",
+    ),
+    IndexDeclaration(
+        collection="triples",
+        keys=[("graph_id", ASCENDING), ("head", ASCENDING)],
+        name="graph_id_head",
+        serves="neighbourhood lookups by head (get_subgraph, merge_nodes, toggle_activation) and graph-scoped triple scans (delete_graph_items, gc-orphans)",
+    ),
+    IndexDeclaration(
+        collection="triples",
+        keys=[("graph_id", ASCENDING), ("tail", ASCENDING)],
+        name="graph_id_tail",
+        serves="neighbourhood lookups by tail (get_subgraph, merge_nodes, toggle_activation)",
+    ),
+    IndexDeclaration(
+        collection="triples",
+        keys=[("edge", ASCENDING)],
+        name="edge",
+        serves="triple lookups by edge (update_item reversal, toggle_activation, merge_nodes)",
+    ),
+    IndexDeclaration(
+        collection="jobs",
+        keys=[("status", ASCENDING)],
+        name="status",
+        serves="failing abandoned jobs and job heartbeats",
+    ),
+    IndexDeclaration(
+        collection="jobs",
+        keys=[("graph_id", ASCENDING)],
+        name="graph_id",
+        serves="finding a graph's jobs (delete_graph, gc-orphans)",
+    ),
+]
+
+
+def _group_by_collection(
+    declarations: List[IndexDeclaration],
+) -> Dict[str, List[IndexDeclaration]]:
+    by_collection = {}
+    for declaration in declarations:
+        by_collection.setdefault(declaration.collection, []).append(declaration)
+    return by_collection
+
+
+async def verify_indexes(db: AsyncIOMotorDatabase) -> List[IndexDeclaration]:
+    """
+    Returns the declared indexes that are missing from the database.
+
+    An index is considered present if an index with the same keys exists, regardless of its name.
+    """
+    missing = []
+    for collection, declarations in _group_by_collection(INDEXES).items():
+        existing = {
+            tuple((field, int(direction)) for field, direction in info["key"])
+            for info in (await db[collection].index_information()).values()
+        }
+        missing.extend(d for d in declarations if tuple(d.keys) not in existing)
+    return missing
+
+
+async def ensure_indexes(db: AsyncIOMotorDatabase) -> List[str]:
+    """
+    Creates the declared indexes that are missing and returns their names.
+
+    Only missing indexes are created, as MongoDB rejects an index whose keys already exist under a different name.
+    """
+    created = []
+    missing = await verify_indexes(db)
+    for collection, declarations in _group_by_collection(missing).items():
+        names = await db[collection].create_indexes(
+            [IndexModel(d.keys, name=d.name) for d in declarations]
+        )
+        created.extend(f"{collection}.{name}" for name in names)
+    logger.info(f"Created {len(created)} missing indexes")
+    return created
+
+
+async def check_indexes(db: AsyncIOMotorDatabase, create: bool) -> None:
+    """Optionally creates the declared indexes, then warns about any that are missing. Used at startup."""
+    try:
+        if create:
+            await ensure_indexes(db)
+        for declaration in await verify_indexes(db):
+            logger.warning(
+                f"Missing index {declaration.name} on '{declaration.collection}' {declaration.keys} - used by {declaration.serves}"
+            )
+    except Exception as e:
+        logger.error(f"Unable to check indexes: {e}")
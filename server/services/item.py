@@ -1,18 +1,25 @@
 """Services for performing CRUD operations on graph items (nodes/edges)"""
 
-from typing import Dict
+from typing import Dict, Optional
+from collections import defaultdict
 from fastapi import HTTPException, status
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from bson import ObjectId
 import traceback
 from datetime import datetime
-from collections import defaultdict
 from loguru import logger
 
-from models import graph as graph_model
 from models.misc import ItemClass, ItemClassWithId, ItemType, ItemUpdate, ReviewBody
-from .utils import concatenate_arrays
-from .graph import get_subgraph_review_progress
+from .cache import bump_graph_version
+from .merge import merge_node_group
+from .neighbourhood import apply_review_deltas, get_review_progress
+from .degree import (
+    apply_degree_deltas,
+    count_activation,
+    count_triple,
+    empty_degrees,
+    get_stored_degrees,
+)
 
 
 async def delete_property(
@@ -21,12 +28,16 @@ async def delete_property(
     """Deletes a single property from an item (node/edge)"""
 
     try:
-        result = await db["nodes" if is_node else "edges"].update_one(
-            {"_id": ObjectId(item_id)},
+        # Matching on the property means the item is only returned if the property is removed
+        item = await db["nodes" if is_node else "edges"].find_one_and_update(
+            {"_id": ObjectId(item_id), "properties.id": ObjectId(property_id)},
             {"$pull": {"properties": {"id": ObjectId(property_id)}}},
+            projection={"graph_id": 1},
         )
 
-        property_deleted = result.modified_count > 0
+        property_deleted = item is not None
+        if property_deleted:
+            await bump_graph_version(graph_id=item["graph_id"], db=db)
 
         return {"property_deleted": property_deleted}
     except Exception as e:
@@ -71,202 +82,17 @@ async def merge_nodes(
                 status_code=404, details="Unable to merge node - target node not found."
             )
 
-        # Both source/target nodes exist
-        source_id = ObjectId(source_node["_id"])
-        target_id = ObjectId(target_node["_id"])
-
-        # Create new merged node (merges properties together), sets is_reviewed and is_active to defaults.
-        merged_node_properties = concatenate_arrays(
-            array1=target_node.get("properties", []),
-            array2=source_node.get("properties", []),
-        )
-
-        new_merged_node = graph_model.CreateItem(
+        # Both source/target nodes exist; the target's properties take precedence
+        return await merge_node_group(
+            nodes=(
+                [target_node]
+                if target_node["_id"] == source_node["_id"]
+                else [target_node, source_node]
+            ),
             name=new_source_name,
             type=new_source_type,
-            properties=merged_node_properties,
-            value=source_node["value"] + target_node["value"],
-            errors=source_node["errors"] + target_node["errors"],
-            suggestions=source_node["suggestions"] + target_node["suggestions"],
-            is_reviewed=False,
-            is_active=True,
             graph_id=graph_id,
-        )
-
-        # Find all triples that are referenced to the source/target nodes and reassign them to the new node; deleting any that would be self referenced.
-        pipeline = [
-            {
-                "$match": {
-                    "graph_id": graph_id,
-                    "$or": [
-                        {"head": {"$in": [source_id, target_id]}},
-                        {"tail": {"$in": [source_id, target_id]}},
-                    ],
-                }
-            },
-            {
-                "$lookup": {
-                    "from": "nodes",
-                    "localField": "head",
-                    "foreignField": "_id",
-                    "as": "head",
-                }
-            },
-            {
-                "$lookup": {
-                    "from": "nodes",
-                    "localField": "tail",
-                    "foreignField": "_id",
-                    "as": "tail",
-                }
-            },
-            {
-                "$lookup": {
-                    "from": "edges",
-                    "localField": "edge",
-                    "foreignField": "_id",
-                    "as": "edge",
-                }
-            },
-            {"$unwind": "$head"},
-            {"$unwind": "$tail"},
-            {"$unwind": "$edge"},
-            {
-                "$project": {
-                    "graph_id": 0,
-                    "head.graph_id": 0,
-                    "edge.graph_id": 0,
-                    "tail.graph_id": 0,
-                }
-            },
-        ]
-
-        triples = await db["triples"].aggregate(pipeline).to_list(None)
-
-        # 3. Create new merged node
-        db_new_merged_node = await db["nodes"].insert_one(new_merged_node.dict())
-        new_merged_node_id = db_new_merged_node.inserted_id
-
-        def replace_id(id):
-            return new_merged_node_id if id in [source_id, target_id] else id
-
-        # UPDATE triples and edges
-        new_edges = defaultdict(list)
-        for triple in triples:
-            head_id = replace_id(triple["head"]["_id"])
-            tail_id = replace_id(triple["tail"]["_id"])
-            edge_type = triple["edge"]["type"]
-
-            if head_id != tail_id:
-                # Update edge information
-                base_triple = (head_id, edge_type, tail_id)
-                new_edges[base_triple].append(triple["edge"])
-
-        # Merge edges, create new triples and edges, remove old triples/edges
-        for base_triple, edges in new_edges.items():
-            head_id, edge_type, tail_id = base_triple
-
-            # TODO: filter errors/suggestions to make context make sense.
-            edge_errors = []
-            edge_suggestions = []
-            edge_properties = []
-            edge_value = 0
-            edge_ids = []
-
-            for e in edges:
-                edge_errors.extend(e["errors"])
-                edge_suggestions.extend(e["suggestions"])
-                edge_properties.extend(e["properties"])
-                edge_value += e["value"]
-                edge_ids.append(ObjectId(e["_id"]))
-
-            merged_edge = graph_model.CreateItem(
-                type=edge_type,
-                value=edge_value,
-                properties=edge_properties,
-                errors=edge_errors,
-                suggestions=edge_suggestions,
-                is_reviewed=False,
-                is_active=True,
-                graph_id=graph_id,
-            )
-
-            # Create new edge
-            _new_merged_edge = await db["edges"].insert_one(merged_edge.dict())
-            _new_merged_edge_id = _new_merged_edge.inserted_id
-
-            # Create new triple
-            await db["triples"].insert_one(
-                {
-                    "head": ObjectId(head_id),
-                    "edge": _new_merged_edge_id,
-                    "tail": ObjectId(tail_id),
-                    "graph_id": graph_id,
-                    "updated_at": datetime.utcnow(),
-                    "created_at": datetime.utcnow(),
-                }
-            )
-
-            # Delete existing edges
-            await db["edges"].delete_many({"_id": {"$in": edge_ids}})
-
-            # # Delete old triple(s)
-            await db["triples"].delete_many(
-                {"graph_id": graph_id, "edge": {"$in": edge_ids}}
-            )
-
-        # Delete existing nodes
-        await db["nodes"].delete_many({"_id": {"$in": [source_id, target_id]}})
-
-        # Return new subgraph data
-        unique_nodes = {}
-        unique_edges = {}
-
-        total_errors = 0
-        total_suggestions = 0
-        total_reviewed = 0
-
-        for item in triples:
-            for node_type in ["head", "tail"]:
-                node = item[node_type]
-                node_id = node["_id"]
-
-                if node_id not in unique_nodes:
-                    unique_nodes[node_id] = node
-                    total_errors += len(node["errors"])
-                    total_suggestions += len(node["suggestions"])
-                    total_reviewed += int(node["is_reviewed"])
-
-            edge = item["edge"]
-            edge_id = edge["_id"]
-
-            if edge_id not in unique_edges:
-                unique_edges[edge_id] = edge
-                total_errors += len(edge["errors"])
-                total_suggestions += len(edge["suggestions"])
-                total_reviewed += int(edge["is_reviewed"])
-
-        total_items = len(unique_nodes) + len(unique_edges)
-
-        new_subgraph = graph_model.SubGraph(
-            _id=new_merged_node_id,
-            name=new_merged_node.name,
-            type=new_merged_node.type,
-            value=new_merged_node.value,
-            errors=total_errors,
-            suggestions=total_suggestions,
-            reviewed_progress=total_reviewed / total_items,
-            node_count=0,
-            edge_count=0,
-            nodes_reviewed=0,
-            edges_reviewed=0,
-        )
-
-        return graph_model.MergedNode(
-            item_modified=True,
-            new_node=graph_model.Node(**new_merged_node.dict(), _id=new_merged_node_id),
-            old_node_ids=[str(source_id), str(target_id)],
-            new_subgraph=new_subgraph,
+            db=db,
         )
 
     except:
@@ -290,7 +116,7 @@ async def acknowledge(
     try:
         array_name = "errors" if is_error else "suggestions"
 
-        result = await db["nodes" if is_node else "edges"].update_one(
+        item = await db["nodes" if is_node else "edges"].find_one_and_update(
             {
                 "_id": item_id,
                 f"{array_name}.id": eos_item_id,
@@ -301,8 +127,11 @@ async def acknowledge(
                 },
                 "$currentDate": {f"{array_name}.$.updated_at": True},
             },
+            projection={"graph_id": 1},
         )
-        updated = result.modified_count > 0
+        updated = item is not None
+        if updated:
+            await bump_graph_version(graph_id=item["graph_id"], db=db)
         return {"item_acknowledged": updated}
 
     except Exception as e:
@@ -366,21 +195,10 @@ async def update_item(
                 linked_triples = 0
                 if existing_node:
                     # Get count of triples it has connected to it.
-                    triples = (
-                        await db["triples"]
-                        .find(
-                            {
-                                "graph_id": graph_id,
-                                "$or": [
-                                    {"head": existing_node["_id"]},
-                                    {"tail": existing_node["_id"]},
-                                ],
-                            },
-                            {"_id": 1},
-                        )
-                        .to_list(None)
+                    degrees = await get_stored_degrees(
+                        graph_id=graph_id, node_ids=[existing_node["_id"]], db=db
                     )
-                    linked_triples = len(triples)
+                    linked_triples = degrees[existing_node["_id"]]["degree"]
                     print("existing_node", existing_node)
                     return {
                         "node_exists": existing_node is not None,
@@ -398,11 +216,16 @@ async def update_item(
         if item_type == ItemType.node:
             update_data.pop("reverse_direction", None)
 
+        # Get triple edge is on
+        triple = (
+            await db["triples"].find_one({"edge": item_id})
+            if item_type == ItemType.edge
+            else None
+        )
+
         if update_data.get("reverse_direction"):
             print("reversing edge!")
             try:
-                # Get triple edge is on
-                triple = await db["triples"].find_one({"edge": item_id})
                 # Swap head/tail
                 result = await db["triples"].update_one(
                     {"edge": item_id},
@@ -428,11 +251,62 @@ async def update_item(
                 traceback.print_exc()
 
         updated = result.modified_count > 0
+
+        if updated and item_type == ItemType.edge:
+            await update_edge_degrees(
+                edge=item,
+                triple=triple,
+                reversed=bool(update_data.get("reverse_direction")),
+                # Reversing only updates the triple
+                is_active=(
+                    item.get("is_active", True)
+                    if update_data.get("reverse_direction")
+                    else update_data.get("is_active", item.get("is_active", True))
+                ),
+                db=db,
+            )
+
+        if updated:
+            await bump_graph_version(graph_id=ObjectId(item["graph_id"]), db=db)
+
+        if updated and "is_reviewed" in update_data:
+            review_delta = int(update_data["is_reviewed"]) - int(
+                item.get("is_reviewed", False)
+            )
+            is_node = item_type == ItemType.node
+            await apply_review_deltas(
+                graph_id=ObjectId(item["graph_id"]),
+                db=db,
+                node_deltas={item_id: review_delta} if is_node else None,
+                edge_deltas=None if is_node else {item_id: review_delta},
+            )
+
         return {"item_modified": updated}
     except:
         traceback.print_exc()
 
 
+async def update_edge_degrees(
+    edge: Dict,
+    triple: Optional[Dict],
+    reversed: bool,
+    is_active: bool,
+    db: AsyncIOMotorDatabase,
+) -> None:
+    """Updates the degrees of an edge's head and tail after the edge is reversed or its activation changes"""
+    if triple is None:
+        return
+    was_active = edge.get("is_active", True)
+    head, tail = triple["head"], triple["tail"]
+
+    deltas = defaultdict(empty_degrees)
+    count_triple(deltas, head, tail, was_active, sign=-1)
+    if reversed:
+        head, tail = tail, head
+    count_triple(deltas, head, tail, is_active)
+    await apply_degree_deltas(db=db, deltas=deltas)
+
+
 async def toggle_activation(item_id: ObjectId, is_node: bool, db: AsyncIOMotorDatabase):
     """
     Toggles the activation state of a given item and its neighbours in the database.
@@ -476,51 +350,69 @@ async def toggle_activation(item_id: ObjectId, is_node: bool, db: AsyncIOMotorDa
 
         # Check if the update was successful
         item_updated = update_result.modified_count > 0
+        if item_updated:
+            await bump_graph_version(graph_id=item["graph_id"], db=db)
 
         orphan_nodes = []
         orphan_edges = []
+        active_degree_deltas = defaultdict(empty_degrees)
+
+        if not is_node:
+            # get the triple of the provided edge
+            edge = await db["triples"].find_one(
+                {"graph_id": item["graph_id"], "edge": item_id},
+                {"head": 1, "edge": 1, "tail": 1},
+            )
+            connected_edges = [edge] if edge else []
+            if item_updated and edge:
+                count_activation(
+                    active_degree_deltas,
+                    edge["head"],
+                    edge["tail"],
+                    sign=1 if new_state else -1,
+                )
 
         # Only do 1-hop or orphan logic if deactivating.
         if new_state is False:
             if is_node:
                 connected_edges = (
                     await db["triples"]
-                    .find({"$or": [{"head": item_id}, {"tail": item_id}]})
+                    .find(
+                        {
+                            "graph_id": item["graph_id"],
+                            "$or": [{"head": item_id}, {"tail": item_id}],
+                        },
+                        {"head": 1, "edge": 1, "tail": 1},
+                    )
                     .to_list(None)
                 )
+                orphan_edges = [edge["edge"] for edge in connected_edges]
 
-                for edge in connected_edges:
-                    # get the count of edges connected to the head and tail
-                    count_head = await db["triples"].count_documents(
-                        {"$or": [{"head": edge["head"]}, {"tail": edge["head"]}]}
-                    )
-                    count_tail = await db["triples"].count_documents(
-                        {"$or": [{"head": edge["tail"]}, {"tail": edge["tail"]}]}
-                    )
-                    # if the count is 1, they will be orphaned if the edge is removed
-                    if count_head == 1:
-                        orphan_nodes.append(edge["head"])
-                    if count_tail == 1:
-                        orphan_nodes.append(edge["tail"])
-
-                    orphan_edges.append(edge["edge"])  # NOTE: _id is the triple id.
-
-            else:  # is_node = False
-                # get the edge with the provided id
-                edge = await db["triples"].find_one({"_id": item_id})
-                if edge:
-                    # get the count of edges connected to the head and tail
-                    count_head = await db["triples"].count_documents(
-                        {"$or": [{"head": edge["head"]}, {"tail": edge["head"]}]}
+                # Edges that are already inactive don't count towards active degrees
+                active_edges = {
+                    e["_id"]
+                    async for e in db["edges"].find(
+                        {"_id": {"$in": orphan_edges}, "is_active": True}, {"_id": 1}
                     )
-                    count_tail = await db["triples"].count_documents(
-                        {"$or": [{"head": edge["tail"]}, {"tail": edge["tail"]}]}
-                    )
-                    # if the count is 1, they will be orphaned if the edge is removed
-                    if count_head == 1:
-                        orphan_nodes.append(edge["head"])
-                    if count_tail == 1:
-                        orphan_nodes.append(edge["tail"])
+                }
+                for edge in connected_edges:
+                    if edge["edge"] in active_edges:
+                        count_activation(
+                            active_degree_deltas, edge["head"], edge["tail"], sign=-1
+                        )
+
+            # Nodes with a single triple will be orphaned if the edge is removed
+            candidate_ids = list(
+                dict.fromkeys(
+                    edge[node_type]
+                    for edge in connected_edges
+                    for node_type in ["head", "tail"]
+                )
+            )
+            degrees = await get_stored_degrees(
+                graph_id=item["graph_id"], node_ids=candidate_ids, db=db
+            )
+            orphan_nodes = [_id for _id in candidate_ids if degrees[_id]["degree"] == 1]
 
             # Update the orphan nodes and edges
             await db["nodes"].update_many(
@@ -532,6 +424,8 @@ async def toggle_activation(item_id: ObjectId, is_node: bool, db: AsyncIOMotorDa
                 {"$set": {"is_active": new_state, "updated_at": updated_at}},
             )
 
+        await apply_degree_deltas(db=db, deltas=active_degree_deltas)
+
         return {
             "item_updated": item_updated,
             "updated_node_ids": [str(id) for id in orphan_nodes],
@@ -559,8 +453,11 @@ async def toggle_review(
             and an optional "neighbours" field that lists the ids of neighbouring nodes and edges.
 
     Returns:
-    A dictionary with a single key, "item_reviewed", whose value is a boolean indicating whether
-    the operation was successful.
+    A dictionary containing:
+    - "item_reviewed": A boolean indicating whether the operation was successful.
+    - "node_diff"/"edge_diff": The change in the graph's reviewed node/edge counts for a single toggle.
+    - "reviewed_nodes"/"reviewed_edges": The graph's reviewed node/edge counts.
+    - "subgraph_progress": The review progress of only the subgraphs affected by the change (those centred on the item's nodes and their 1-hop nodes), by node id.
 
     Raises:
     HTTPException with a status code of 404 if the provided item_id does not correspond to an
@@ -575,6 +472,7 @@ async def toggle_review(
         updated_at = datetime.utcnow()
         node_diff = 0
         edge_diff = 0
+        affected_centres = set()
 
         item = await db[collection].find_one({"_id": item_id})
 
@@ -587,27 +485,24 @@ async def toggle_review(
             # Set all items inc. neighbours as True (this is the review all button action)
 
             # item_id is used twice but only one will match in the respective collection
+            node_ids = [item_id, *[ObjectId(_id) for _id in data.neighbours["nodes"]]]
+            edge_ids = [item_id, *[ObjectId(_id) for _id in data.neighbours["links"]]]
+
+            # Items that aren't yet reviewed are the ones whose neighbourhood counts change
+            unreviewed_node_ids = await db["nodes"].distinct(
+                "_id", {"_id": {"$in": node_ids}, "is_reviewed": {"$ne": True}}
+            )
+            unreviewed_edge_ids = await db["edges"].distinct(
+                "_id", {"_id": {"$in": edge_ids}, "is_reviewed": {"$ne": True}}
+            )
+
             updated_nodes = await db["nodes"].update_many(
-                {
-                    "_id": {
-                        "$in": [
-                            item_id,
-                            *[ObjectId(_id) for _id in data.neighbours["nodes"]],
-                        ]
-                    }
-                },
+                {"_id": {"$in": unreviewed_node_ids}},
                 {"$set": {"is_reviewed": True, "updated_at": updated_at}},
             )
 
             updated_edges = await db["edges"].update_many(
-                {
-                    "_id": {
-                        "$in": [
-                            item_id,
-                            *[ObjectId(_id) for _id in data.neighbours["links"]],
-                        ]
-                    }
-                },
+                {"_id": {"$in": unreviewed_edge_ids}},
                 {"$set": {"is_reviewed": True, "updated_at": updated_at}},
             )
 
@@ -615,6 +510,13 @@ async def toggle_review(
                 updated_nodes.modified_count > 0 or updated_edges.modified_count
             )
 
+            affected_centres = await apply_review_deltas(
+                graph_id=item["graph_id"],
+                db=db,
+                node_deltas={_id: 1 for _id in unreviewed_node_ids},
+                edge_deltas={_id: 1 for _id in unreviewed_edge_ids},
+            )
+
         else:
             result = await db[collection].update_one(
                 {"_id": item_id},
@@ -629,76 +531,24 @@ async def toggle_review(
                 else:
                     edge_diff = 1 if not is_reviewed else -1
 
-        # # TODO: Returns updated reviewed_progress for all items involved
-        # if is_node:
-        #     match_query = {"$match": {"$or": [{"head": item_id}, {"tail": item_id}]}}
-        # else:
-        #     match_query = {"$match": {"edge": item_id}}
-
-        # pipeline = [
-        #     match_query,
-        #     {
-        #         "$facet": {
-        #             "fromHead": [
-        #                 {
-        #                     "$group": {
-        #                         "_id": "$head",
-        #                         "nodes": {"$addToSet": "$tail"},
-        #                         "links": {"$addToSet": "$edge"},
-        #                     }
-        #                 }
-        #             ],
-        #             "fromTail": [
-        #                 {
-        #                     "$group": {
-        #                         "_id": "$tail",
-        #                         "nodes": {"$addToSet": "$head"},
-        #                         "links": {"$addToSet": "$edge"},
-        #                     }
-        #                 }
-        #             ],
-        #         }
-        #     },
-        #     {"$project": {"all": {"$concatArrays": ["$fromHead", "$fromTail"]}}},
-        #     {"$unwind": "$all"},
-        #     {
-        #         "$group": {
-        #             "_id": "$all._id",
-        #             "nodes": {"$addToSet": "$all.nodes"},
-        #             "links": {"$addToSet": "$all.links"},
-        #         }
-        #     },
-        #     {
-        #         "$project": {
-        #             "_id": 1,
-        #             "nodes": {
-        #                 "$reduce": {
-        #                     "input": "$nodes",
-        #                     "initialValue": [],
-        #                     "in": {"$setUnion": ["$$this", "$$value"]},
-        #                 }
-        #             },
-        #             "links": {
-        #                 "$reduce": {
-        #                     "input": "$links",
-        #                     "initialValue": [],
-        #                     "in": {"$setUnion": ["$$this", "$$value"]},
-        #                 }
-        #             },
-        #         }
-        #     },
-        # ]
-
-        # neighbours = await db["triples"].aggregate(pipeline).to_list(None)
-        # print("neighbours", neighbours)
-
-        # , "reviewed_progress": 0
+                affected_centres = await apply_review_deltas(
+                    graph_id=item["graph_id"],
+                    db=db,
+                    node_deltas={item_id: node_diff} if is_node else None,
+                    edge_deltas=None if is_node else {item_id: edge_diff},
+                )
+
+        if item_reviewed:
+            await bump_graph_version(graph_id=item["graph_id"], db=db)
 
+        # Only the subgraphs whose counts changed are returned
         (
             reviewed_nodes,
             reviewed_edges,
             sg_progress,
-        ) = await get_subgraph_review_progress(graph_id=item["graph_id"], db=db)
+        ) = await get_review_progress(
+            graph_id=item["graph_id"], db=db, node_ids=affected_centres
+        )
 
         return {
             "item_reviewed": item_reviewed,
@@ -741,7 +591,11 @@ async def add_item_class(
             }
 
             result = await db["graphs"].update_one(
-                {"_id": graph_id}, {"$push": {class_list_name: new_class_object}}
+                {"_id": graph_id},
+                {
+                    "$push": {class_list_name: new_class_object},
+                    "$inc": {"version": 1},
+                },
             )
 
             return {
@@ -782,6 +636,7 @@ async def update_item_class(
                     f"{class_list_name}.$.color": item_class.color,
                 },
                 "$currentDate": {f"{class_list_name}.$.updated_at": True},
+                "$inc": {"version": 1},
             },
         )
 
@@ -0,0 +1,356 @@
+"""Background job queue for long running graph operations (e.g. graph creation and deletion)"""
+
+import asyncio
+import traceback
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Optional
+
+from bson import ObjectId
+from fastapi import HTTPException, status
+from loguru import logger
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from database import database
+from models.job import JOB_KIND_PHASE_WEIGHTS, Job, JobKind, JobPhase, JobStatus
+from settings import settings
+
+
+class JobProgress:
+    """Records the per-phase and overall progress of a running job."""
+
+    def __init__(
+        self,
+        job_id: ObjectId,
+        db: AsyncIOMotorDatabase,
+        kind: JobKind = JobKind.create_graph,
+    ):
+        self.job_id = job_id
+        self.db = db
+        self.weights = JOB_KIND_PHASE_WEIGHTS[kind]
+        self.phases: Dict[JobPhase, int] = {phase: 0 for phase in self.weights}
+
+    @property
+    def current_phase(self) -> JobPhase:
+        """The first phase that hasn't completed."""
+        return next(
+            (phase for phase, percent in self.phases.items() if percent < 100),
+            list(self.phases)[-1],
+        )
+
+    @property
+    def overall(self) -> int:
+        total = sum(self.weights.values())
+        done = sum(
+            self.weights[phase] * percent for phase, percent in self.phases.items()
+        )
+        return int(done / total)
+
+    async def update(self, phase: JobPhase, percent: float) -> None:
+        """Sets the percentage complete of a phase. Only whole percentage changes are written."""
+        percent = max(0, min(100, int(percent)))
+        if percent == self.phases[phase]:
+            return
+
+        self.phases[phase] = percent
+
+        await self.db["jobs"].update_one(
+            {"_id": self.job_id},
+            {
+                "$set": {
+                    "phase": self.current_phase.value,
+                    "phases": {p.value: v for p, v in self.phases.items()},
+                    "progress": self.overall,
+                    "updated_at": datetime.utcnow(),
+                }
+            },
+        )
+
+    async def warn(self, message: str) -> None:
+        """Records a problem that doesn't fail the job, so it's reported when the job is polled."""
+        logger.warning(f"Job {self.job_id}: {message}")
+        await self.db["jobs"].update_one(
+            {"_id": self.job_id},
+            {
+                "$push": {"warnings": message},
+                "$set": {"updated_at": datetime.utcnow()},
+            },
+        )
+
+
+ACTIVE_STATUSES = {"$in": [JobStatus.queued.value, JobStatus.running.value]}
+
+JobFunction = Callable[[AsyncIOMotorDatabase, JobProgress], Awaitable[None]]
+CancelFunction = Callable[[AsyncIOMotorDatabase], Awaitable[None]]
+
+
+class JobQueue:
+    """
+    A bounded, in-process queue of background jobs.
+
+    Jobs are executed by a fixed number of worker tasks (`settings.JOB_MAX_WORKERS`) so concurrent uploads cannot starve the API. Job state is persisted in the "jobs" collection so it can be polled via the `/jobs` routes.
+
+    Several server processes (e.g. uvicorn workers, or the old and new processes of a rolling restart) can share the "jobs" collection. Each job records the process that owns it (`owner`), which refreshes the job's `heartbeat_at` every `settings.JOB_HEARTBEAT_SECONDS`. A process only fails jobs whose owner has stopped heartbeating, and cancels another live process's jobs by flagging them for that process to cancel.
+    """
+
+    def __init__(self):
+        self.owner = ObjectId()  # Identifies this process's jobs
+        self._db: Optional[AsyncIOMotorDatabase] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers = []
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._running: Dict[ObjectId, asyncio.Task] = {}
+        self._cancelled = set()
+
+    async def start(self) -> None:
+        """Starts the job workers. Jobs left unfinished by processes that have since stopped are marked as failed."""
+        self._db = database.db
+        self._queue = asyncio.Queue(maxsize=settings.JOB_MAX_QUEUED)
+
+        await self._fail_jobs(self._abandoned())
+
+        self._workers = [
+            asyncio.ensure_future(self._worker())
+            for _ in range(settings.JOB_MAX_WORKERS)
+        ]
+        self._heartbeat = asyncio.ensure_future(self._heartbeat_loop())
+        logger.info(f"Started {len(self._workers)} job workers (owner {self.owner})")
+
+    async def stop(self) -> None:
+        """Cancels the job workers and any running jobs. Jobs still queued are marked as failed."""
+        tasks = [*self._workers, *self._running.values()]
+        if self._heartbeat is not None:
+            tasks.append(self._heartbeat)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._heartbeat = None
+        self._running = {}
+
+        if self._db is not None:
+            await self._fail_jobs({"owner": self.owner, "status": ACTIVE_STATUSES})
+
+    async def _fail_jobs(self, query: Dict) -> None:
+        now = datetime.utcnow()
+        await self._db["jobs"].update_many(
+            query,
+            {
+                "$set": {
+                    "status": JobStatus.failed.value,
+                    "error": "Interrupted by server restart",
+                    "finished_at": now,
+                    "updated_at": now,
+                }
+            },
+        )
+
+    def _abandoned(self) -> Dict:
+        """Matches unfinished jobs whose owner has stopped heartbeating (including jobs without an owner)."""
+        cutoff = datetime.utcnow() - timedelta(seconds=settings.JOB_ABANDONED_SECONDS)
+        return {
+            "status": ACTIVE_STATUSES,
+            "owner": {"$ne": self.owner},
+            "$or": [{"heartbeat_at": None}, {"heartbeat_at": {"$lt": cutoff}}],
+        }
+
+    async def _heartbeat_loop(self) -> None:
+        """Marks this process's jobs as alive, cancels those other processes asked to cancel, and fails abandoned jobs."""
+        while True:
+            await asyncio.sleep(settings.JOB_HEARTBEAT_SECONDS)
+            try:
+                await self._db["jobs"].update_many(
+                    {"owner": self.owner, "status": ACTIVE_STATUSES},
+                    {"$set": {"heartbeat_at": datetime.utcnow()}},
+                )
+                async for job in self._db["jobs"].find(
+                    {
+                        "owner": self.owner,
+                        "status": ACTIVE_STATUSES,
+                        "cancel_requested": True,
+                    },
+                    {"_id": 1},
+                ):
+                    await self._cancel_owned(job["_id"])
+                await self._fail_jobs(self._abandoned())
+            except Exception as e:
+                logger.error(f"Job heartbeat failed: {e}")
+
+    async def submit(
+        self,
+        kind: JobKind,
+        run: JobFunction,
+        graph_id: Optional[ObjectId] = None,
+        on_cancel: Optional[CancelFunction] = None,
+    ) -> ObjectId:
+        """
+        Queues a job for execution and returns its id.
+
+        `on_cancel` is awaited if the job is cancelled before it starts; jobs cancelled while running receive `asyncio.CancelledError` and are expected to clean up after themselves.
+
+        Raises:
+            HTTPException: If the job queue isn't running or is full.
+        """
+        if self._queue is None:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Job queue is not running",
+            )
+        if self._queue.full():
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many queued jobs - please try again later",
+            )
+
+        now = datetime.utcnow()
+        result = await self._db["jobs"].insert_one(
+            {
+                "kind": kind.value,
+                "graph_id": graph_id,
+                "status": JobStatus.queued.value,
+                "phase": None,
+                "phases": {},
+                "progress": 0,
+                "error": None,
+                "warnings": [],
+                "owner": self.owner,
+                "heartbeat_at": now,
+                "cancel_requested": False,
+                "created_at": now,
+                "updated_at": now,
+                "started_at": None,
+                "finished_at": None,
+            }
+        )
+        job_id = result.inserted_id
+
+        self._queue.put_nowait((job_id, kind, run, on_cancel))
+        logger.info(f"Queued {kind.value} job {job_id}")
+
+        return job_id
+
+    async def get(self, job_id: ObjectId) -> Job:
+        """Fetches a job's current state.
+
+        Raises:
+            HTTPException: If the job does not exist.
+        """
+        job = await self._db["jobs"].find_one({"_id": job_id})
+
+        if job is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Job not found"
+            )
+
+        return Job(**job)
+
+    async def cancel(self, job_id: ObjectId) -> Dict[str, bool]:
+        """Cancels a queued or running job.
+
+        Jobs owned by another live process are flagged, and that process cancels them on its next heartbeat.
+        """
+        job = await self.get(job_id)
+
+        if job.status not in (JobStatus.queued, JobStatus.running):
+            return {"job_cancelled": False}
+
+        document = await self._db["jobs"].find_one(
+            {"_id": job_id}, {"owner": 1, "heartbeat_at": 1}
+        )
+        cutoff = datetime.utcnow() - timedelta(seconds=settings.JOB_ABANDONED_SECONDS)
+
+        if document.get("owner") == self.owner:
+            await self._cancel_owned(job_id)
+        elif (document.get("heartbeat_at") or datetime.min) < cutoff:
+            # The owner has stopped, so nothing else will finish the job
+            await self._finish(job_id, JobStatus.cancelled)
+        else:
+            await self._db["jobs"].update_one(
+                {"_id": job_id},
+                {
+                    "$set": {
+                        "cancel_requested": True,
+                        "updated_at": datetime.utcnow(),
+                    }
+                },
+            )
+
+        return {"job_cancelled": True}
+
+    async def wait(self, job_id: ObjectId, timeout: float) -> bool:
+        """Waits up to `timeout` seconds for a job run by this process to finish, returning whether it has finished (by any process)."""
+        task = self._running.get(job_id)
+        if task is not None:
+            await asyncio.wait([task], timeout=timeout)
+        job = await self.get(job_id)
+        return job.status not in (JobStatus.queued, JobStatus.running)
+
+    async def _cancel_owned(self, job_id: ObjectId) -> None:
+        task = self._running.get(job_id)
+        if task is not None:
+            task.cancel()
+        else:
+            self._cancelled.add(job_id)
+            await self._finish(job_id, JobStatus.cancelled)
+
+    async def _finish(
+        self, job_id: ObjectId, job_status: JobStatus, error: Optional[str] = None
+    ) -> None:
+        now = datetime.utcnow()
+        update = {
+            "status": job_status.value,
+            "error": error,
+            "finished_at": now,
+            "updated_at": now,
+        }
+        if job_status == JobStatus.completed:
+            update["progress"] = 100
+        await self._db["jobs"].update_one({"_id": job_id}, {"$set": update})
+
+    async def _run(self, job_id: ObjectId, kind: JobKind, run: JobFunction) -> None:
+        now = datetime.utcnow()
+        await self._db["jobs"].update_one(
+            {"_id": job_id},
+            {
+                "$set": {
+                    "status": JobStatus.running.value,
+                    "started_at": now,
+                    "updated_at": now,
+                }
+            },
+        )
+
+        try:
+            await run(self._db, JobProgress(job_id=job_id, db=self._db, kind=kind))
+            await self._finish(job_id, JobStatus.completed)
+            logger.info(f"Job {job_id} completed")
+        except asyncio.CancelledError:
+            await self._finish(job_id, JobStatus.cancelled)
+            logger.info(f"Job {job_id} cancelled")
+        except HTTPException as e:
+            await self._finish(job_id, JobStatus.failed, error=str(e.detail))
+            logger.error(f"Job {job_id} failed: {e.detail}")
+        except Exception as e:
+            await self._finish(job_id, JobStatus.failed, error=str(e))
+            logger.error(f"Job {job_id} failed: {e}")
+            traceback.print_exc()
+
+    async def _worker(self) -> None:
+        while True:
+            job_id, kind, run, on_cancel = await self._queue.get()
+            try:
+                if job_id in self._cancelled:
+                    self._cancelled.discard(job_id)
+                    if on_cancel is not None:
+                        await on_cancel(self._db)
+                    continue
+
+                task = asyncio.ensure_future(self._run(job_id, kind, run))
+                self._running[job_id] = task
+                # `wait` (rather than awaiting the task) so cancelling a job doesn't cancel the worker
+                await asyncio.wait([task])
+            finally:
+                self._running.pop(job_id, None)
+                self._queue.task_done()
+
+
+job_queue = JobQueue()
@@ -0,0 +1,400 @@
+"""
+Services for merging groups of nodes into single nodes.
+
+All triples incident to the merged nodes are rewired onto the new nodes in a fixed number of batched `bulk_write` calls, whatever the nodes' degree: triples that become parallel (same head, edge type and tail) are folded into one triple whose edge combines theirs, and triples between merged nodes (which would become self references) are removed.
+
+If `settings.MERGE_USE_TRANSACTIONS` is set, the writes are made in a single MongoDB transaction so a failed merge leaves the graph unchanged. Transactions require MongoDB to run as a replica set.
+"""
+
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from bson import ObjectId
+from fastapi import HTTPException, status
+from loguru import logger
+from motor.motor_asyncio import AsyncIOMotorClientSession, AsyncIOMotorDatabase
+from pymongo import DeleteMany, InsertOne
+
+from models import graph as graph_model
+from services.bulk import batched
+from services.cache import bump_graph_version
+from services.degree import refresh_degrees
+from services.neighbourhood import refresh_neighbourhoods, refresh_reviewed_counts
+from services.triples import ID_FIELDS, MERGE_EDGE_FIELDS, find_populated_triples
+from services.utils import concatenate_arrays
+from settings import settings
+
+
+@asynccontextmanager
+async def merge_session(db: AsyncIOMotorDatabase):
+    """Yields a session with an active transaction, or None if merges aren't transactional"""
+    if not settings.MERGE_USE_TRANSACTIONS:
+        yield None
+        return
+    async with await db.client.start_session() as session:
+        async with session.start_transaction():
+            yield session
+
+
+async def bulk_write(
+    collection,
+    operations: List,
+    session: Optional[AsyncIOMotorClientSession],
+) -> None:
+    for batch in batched(operations, settings.BULK_WRITE_BATCH_SIZE):
+        await collection.bulk_write(batch, ordered=False, session=session)
+
+
+def merge_items(items: Sequence[Dict], **fields) -> graph_model.CreateItem:
+    """Combines items into a new unreviewed, active item with their summed values and concatenated errors and suggestions"""
+    return graph_model.CreateItem(
+        value=sum(item["value"] for item in items),
+        errors=[e for item in items for e in item["errors"]],
+        suggestions=[s for item in items for s in item["suggestions"]],
+        is_reviewed=False,
+        is_active=True,
+        **fields,
+    )
+
+
+def merge_node_properties(nodes: Sequence[Dict]) -> List[Dict]:
+    """Concatenates node properties, keeping the first node's property for each name/value type"""
+    properties = []
+    for node in nodes:
+        properties = concatenate_arrays(
+            array1=properties, array2=node.get("properties", [])
+        )
+    return properties
+
+
+class NodeGroup(NamedTuple):
+    """Nodes to merge into a new node named `name` of class `type`. Earlier nodes' properties take precedence."""
+
+    nodes: List[Dict]
+    name: str
+    type: ObjectId
+
+
+async def merge_node_groups(
+    groups: List[NodeGroup],
+    graph_id: ObjectId,
+    db: AsyncIOMotorDatabase,
+) -> List[graph_model.MergedNode]:
+    """
+    Merges each group of nodes into a new node, in a single pass over their triples.
+
+    Groups must be disjoint and all their nodes belong to `graph_id`. Triples between nodes of two groups are rewired onto both merged nodes.
+
+    Returns
+    -------
+    For each group, its new node, the ids of the nodes it replaced and its subgraph summary.
+    """
+    merged_node_ids = [ObjectId() for _ in groups]
+    merged_nodes = [
+        merge_items(
+            group.nodes,
+            name=group.name,
+            type=group.type,
+            properties=merge_node_properties(group.nodes),
+            graph_id=graph_id,
+        )
+        for group in groups
+    ]
+    merged_into = {
+        node["_id"]: merged_node_id
+        for group, merged_node_id in zip(groups, merged_node_ids)
+        for node in group.nodes
+    }
+    node_ids = list(merged_into)
+
+    triples = await find_populated_triples(
+        {
+            "graph_id": graph_id,
+            "$or": [{"head": {"$in": node_ids}}, {"tail": {"$in": node_ids}}],
+        },
+        db,
+        node_fields=ID_FIELDS,
+        edge_fields=MERGE_EDGE_FIELDS,
+    )
+
+    def replace_id(_id: ObjectId) -> ObjectId:
+        return merged_into.get(_id, _id)
+
+    # Group the rewired triples' edges by (head, edge type, tail), skipping those that become self references
+    edge_groups: Dict[tuple, List[Dict]] = {}
+    for triple in triples:
+        head_id = replace_id(triple["head"]["_id"])
+        tail_id = replace_id(triple["tail"]["_id"])
+        if head_id != tail_id:
+            edge_groups.setdefault(
+                (head_id, triple["edge"]["type"], tail_id), []
+            ).append(triple["edge"])
+
+    # TODO: filter errors/suggestions to make context make sense.
+    now = datetime.utcnow()
+    edge_inserts, triple_inserts = [], []
+    for (head_id, edge_type, tail_id), edges in edge_groups.items():
+        edge_id = ObjectId()
+        edge_inserts.append(
+            InsertOne(
+                {
+                    "_id": edge_id,
+                    **merge_items(
+                        edges,
+                        type=edge_type,
+                        properties=[p for e in edges for p in e["properties"]],
+                        graph_id=graph_id,
+                    ).dict(),
+                }
+            )
+        )
+        triple_inserts.append(
+            InsertOne(
+                {
+                    "head": head_id,
+                    "edge": edge_id,
+                    "tail": tail_id,
+                    "graph_id": graph_id,
+                    "updated_at": now,
+                    "created_at": now,
+                }
+            )
+        )
+
+    # Deletes are batched so their `$in` lists stay bounded
+    def delete_batches(ids: List[ObjectId], field: str, **query) -> List[DeleteMany]:
+        return [
+            DeleteMany({**query, field: {"$in": batch}})
+            for batch in batched(ids, settings.BULK_WRITE_BATCH_SIZE)
+        ]
+
+    old_edge_ids = [triple["edge"]["_id"] for triple in triples]
+
+    async with merge_session(db) as session:
+        await bulk_write(
+            db["nodes"],
+            [
+                InsertOne({"_id": merged_node_id, **merged_node.dict()})
+                for merged_node_id, merged_node in zip(merged_node_ids, merged_nodes)
+            ]
+            + delete_batches(node_ids, "_id"),
+            session=session,
+        )
+        await bulk_write(
+            db["edges"],
+            edge_inserts + delete_batches(old_edge_ids, "_id"),
+            session=session,
+        )
+        await bulk_write(
+            db["triples"],
+            triple_inserts + delete_batches(old_edge_ids, "edge", graph_id=graph_id),
+            session=session,
+        )
+
+    logger.info(
+        f"Merged {len(node_ids)} nodes into {len(groups)} nodes: rewired {len(triples)} triples into {len(triple_inserts)}"
+    )
+
+    # Refresh the neighbourhoods and degrees of the merged nodes and of every node that was adjacent to them
+    neighbour_ids = {
+        replace_id(triple[node_type]["_id"])
+        for triple in triples
+        for node_type in ["head", "tail"]
+    }
+    summaries = await refresh_neighbourhoods(
+        graph_id=graph_id, db=db, node_ids=neighbour_ids | set(merged_node_ids)
+    )
+    await refresh_degrees(
+        graph_id=graph_id, db=db, node_ids=neighbour_ids | set(merged_node_ids)
+    )
+    # The merged nodes and edges start unreviewed, replacing possibly reviewed ones
+    await refresh_reviewed_counts(graph_id=graph_id, db=db)
+    await bump_graph_version(graph_id=graph_id, db=db)
+
+    return [
+        graph_model.MergedNode(
+            item_modified=True,
+            new_node=graph_model.Node(**merged_node.dict(), _id=merged_node_id),
+            old_node_ids=[str(node["_id"]) for node in group.nodes],
+            new_subgraph=graph_model.SubGraph(
+                _id=merged_node_id,
+                name=merged_node.name,
+                type=merged_node.type,
+                value=merged_node.value,
+                **summaries[merged_node_id],
+            ),
+        )
+        for group, merged_node_id, merged_node in zip(
+            groups, merged_node_ids, merged_nodes
+        )
+    ]
+
+
+async def merge_node_group(
+    nodes: List[Dict],
+    name: str,
+    type: ObjectId,
+    graph_id: ObjectId,
+    db: AsyncIOMotorDatabase,
+) -> graph_model.MergedNode:
+    """Merges nodes into a new node named `name` of class `type` (see `merge_node_groups`)"""
+    merged_nodes = await merge_node_groups(
+        groups=[NodeGroup(nodes=nodes, name=name, type=type)], graph_id=graph_id, db=db
+    )
+    return merged_nodes[0]
+
+
+async def merge_nodes(
+    node_ids: List[ObjectId],
+    name: str,
+    type: ObjectId,
+    db: AsyncIOMotorDatabase,
+) -> graph_model.MergedNode:
+    """Merges a cluster of duplicate nodes (e.g. those suggested by a plugin) into a single new node"""
+    node_ids = list(dict.fromkeys(node_ids))
+    if len(node_ids) < 2:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="At least two distinct nodes are required to merge",
+        )
+
+    nodes = await db["nodes"].find({"_id": {"$in": node_ids}}).to_list(None)
+    if len(nodes) != len(node_ids):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Unable to merge nodes - not all nodes were found.",
+        )
+
+    graph_ids = {node["graph_id"] for node in nodes}
+    if len(graph_ids) != 1:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Unable to merge nodes - nodes belong to different graphs.",
+        )
+
+    # Keep the requested order, so properties are concatenated in it
+    nodes_by_id = {node["_id"]: node for node in nodes}
+    return await merge_node_group(
+        nodes=[nodes_by_id[_id] for _id in node_ids],
+        name=name,
+        type=type,
+        graph_id=graph_ids.pop(),
+        db=db,
+    )
+
+
+class UnionFind:
+    """Disjoint sets of ids, with path halving."""
+
+    def __init__(self):
+        self.parents: Dict[ObjectId, ObjectId] = {}
+
+    def find(self, x: ObjectId) -> ObjectId:
+        self.parents.setdefault(x, x)
+        while self.parents[x] != x:
+            self.parents[x] = self.parents[self.parents[x]]
+            x = self.parents[x]
+        return x
+
+    def union(self, x: ObjectId, y: ObjectId) -> None:
+        self.parents[self.find(x)] = self.find(y)
+
+    def groups(self) -> List[List[ObjectId]]:
+        groups: Dict[ObjectId, List[ObjectId]] = {}
+        for x in self.parents:
+            groups.setdefault(self.find(x), []).append(x)
+        return list(groups.values())
+
+
+def merge_target(error: Dict) -> Optional[Tuple[str, ObjectId]]:
+    """Returns the (name, type) of the node an error's update action merges its item into, if it has one"""
+    action = error.get("action") or {}
+    data = action.get("data") or {}
+    if action.get("name") != graph_model.ActionEnum.UPDATE.value:
+        return None
+    if not data.get("item_name") or not ObjectId.is_valid(data.get("item_type")):
+        return None
+    return data["item_name"], ObjectId(data["item_type"])
+
+
+async def apply_errors(
+    graph_id: ObjectId, error_ids: List[ObjectId], db: AsyncIOMotorDatabase
+) -> graph_model.AppliedErrors:
+    """
+    Applies the update actions of node errors (e.g. those of the Node Edit Distance plugin), merging each erroneous node into the node its action names.
+
+    Chains of merges (A into B and B into C) and merges into the same node are resolved with union-find, so each connected set of nodes is merged once into a single node. That node keeps the name and type of a node that's only merged into (not itself erroneous), or otherwise of the highest valued node. All merges are made in one pass (see `merge_node_groups`) and the applied errors are acknowledged on the merged nodes.
+
+    Errors without an update action, or whose target node doesn't exist, are skipped.
+    """
+    error_ids = set(error_ids)
+    nodes = await (
+        db["nodes"]
+        .find({"graph_id": graph_id, "errors.id": {"$in": list(error_ids)}})
+        .to_list(None)
+    )
+
+    # Resolve each error's source and target nodes
+    targets = {}
+    for node in nodes:
+        for error in node["errors"]:
+            if error["id"] in error_ids and not error.get("acknowledged"):
+                targets[error["id"]] = (node["_id"], merge_target(error))
+
+    target_keys = {target for _, target in targets.values() if target is not None}
+    target_nodes = {}
+    for batch in batched(
+        list({name for name, _ in target_keys}), settings.POPULATE_BATCH_SIZE
+    ):
+        async for node in db["nodes"].find(
+            {"graph_id": graph_id, "name": {"$in": batch}}
+        ):
+            if (node["name"], node["type"]) in target_keys:
+                target_nodes.setdefault((node["name"], node["type"]), node)
+
+    # Erroneous nodes found as targets keep their first copy, whose errors are acknowledged below
+    nodes_by_id = {node["_id"]: node for node in nodes}
+    for node in target_nodes.values():
+        nodes_by_id.setdefault(node["_id"], node)
+
+    union_find = UnionFind()
+    sources, applied_error_ids = set(), set()
+    for error_id, (source_id, target) in targets.items():
+        target_node = target_nodes.get(target)
+        if target_node is None or target_node["_id"] == source_id:
+            continue
+        union_find.union(source_id, target_node["_id"])
+        sources.add(source_id)
+        applied_error_ids.add(error_id)
+
+    # Acknowledge applied errors on the copies carried over to the merged nodes
+    now = datetime.utcnow()
+    for node in nodes_by_id.values():
+        for error in node["errors"]:
+            if error["id"] in applied_error_ids:
+                error.update({"acknowledged": True, "updated_at": now})
+
+    groups = []
+    for node_ids in union_find.groups():
+        members = sorted(
+            (nodes_by_id[_id] for _id in node_ids),
+            key=lambda node: (node["_id"] not in sources, node["value"]),
+            reverse=True,
+        )
+        canonical = members[0]
+        groups.append(
+            NodeGroup(nodes=members, name=canonical["name"], type=canonical["type"])
+        )
+
+    merged = (
+        await merge_node_groups(groups=groups, graph_id=graph_id, db=db)
+        if groups
+        else []
+    )
+
+    return graph_model.AppliedErrors(
+        merged=merged,
+        applied_error_ids=[str(_id) for _id in applied_error_ids],
+        skipped_error_ids=[str(_id) for _id in error_ids - applied_error_ids],
+    )
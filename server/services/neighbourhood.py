@@ -0,0 +1,377 @@
+"""
+Services maintaining the materialised neighbourhood summary stored on each node.
+
+Each node document holds a `neighbourhood` sub-document summarising the subgraph centred on it (the node, its 1-hop nodes and the edges between them): node/edge counts, reviewed counts, error/suggestion counts and reviewed progress. Reading a graph overview is then a single indexed read of the graph's nodes rather than an aggregation over every triple.
+
+Summaries are rebuilt in full after graph creation, refreshed locally when the graph's structure changes (merges, new items) and updated with deltas when review states change. The graph document likewise holds `reviewed_nodes`/`reviewed_edges` counters so review progress never requires counting the graph's items.
+"""
+
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from bson import ObjectId
+from loguru import logger
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+
+from services.bulk import batched
+from settings import settings
+
+
+def _item_stats_pipeline(match: Dict) -> List[Dict]:
+    """Projects only the counts needed for summaries so error/suggestion arrays aren't transferred."""
+    return [
+        {"$match": match},
+        {
+            "$project": {
+                "errors": {"$size": {"$ifNull": ["$errors", []]}},
+                "suggestions": {"$size": {"$ifNull": ["$suggestions", []]}},
+                "is_reviewed": {"$toInt": {"$ifNull": ["$is_reviewed", False]}},
+            }
+        },
+    ]
+
+
+def reviewed_progress(
+    node_count: int, edge_count: int, nodes_reviewed: int, edges_reviewed: int
+) -> int:
+    total = node_count + edge_count
+    return round((nodes_reviewed + edges_reviewed) / total * 100) if total > 0 else 0
+
+
+def summarise(
+    centre_id: ObjectId,
+    neighbour_nodes: Set[ObjectId],
+    neighbour_links: Set[ObjectId],
+    node_stats: Dict[ObjectId, Dict],
+    edge_stats: Dict[ObjectId, Dict],
+) -> Dict[str, int]:
+    """
+    Summarises the subgraph centred on a node.
+
+    The centre contributes to the node and reviewed counts but, as it's the subgraph's focus, not to its error and suggestion counts.
+    """
+    missing = {"errors": 0, "suggestions": 0, "is_reviewed": 0}
+    nodes = [node_stats.get(n, missing) for n in neighbour_nodes]
+    links = [edge_stats.get(e, missing) for e in neighbour_links]
+
+    node_count = 1 + len(nodes)
+    edge_count = len(links)
+    nodes_reviewed = node_stats.get(centre_id, missing)["is_reviewed"] + sum(
+        n["is_reviewed"] for n in nodes
+    )
+    edges_reviewed = sum(e["is_reviewed"] for e in links)
+
+    return {
+        "node_count": node_count,
+        "edge_count": edge_count,
+        "nodes_reviewed": nodes_reviewed,
+        "edges_reviewed": edges_reviewed,
+        "errors": sum(i["errors"] for i in nodes) + sum(i["errors"] for i in links),
+        "suggestions": sum(i["suggestions"] for i in nodes)
+        + sum(i["suggestions"] for i in links),
+        "reviewed_progress": reviewed_progress(
+            node_count, edge_count, nodes_reviewed, edges_reviewed
+        ),
+    }
+
+
+async def refresh_neighbourhoods(
+    graph_id: ObjectId,
+    db: AsyncIOMotorDatabase,
+    node_ids: Optional[Iterable[ObjectId]] = None,
+) -> Dict[ObjectId, Dict[str, int]]:
+    """
+    Recomputes the neighbourhood summaries of nodes from their triples.
+
+    Arguments
+    ---------
+    graph_id: The graph the nodes belong to.
+    node_ids: The centre nodes to refresh. If None, every node on the graph is refreshed and the graph is marked as having built neighbourhoods.
+
+    Returns
+    -------
+    The refreshed summaries by node id.
+    """
+    centres = None if node_ids is None else set(node_ids)
+    if centres is not None and not centres:
+        return {}
+
+    triple_match = {"graph_id": graph_id}
+    if centres is not None:
+        triple_match["$or"] = [
+            {"head": {"$in": list(centres)}},
+            {"tail": {"$in": list(centres)}},
+        ]
+
+    neighbours: Dict[ObjectId, Tuple[Set, Set]] = defaultdict(lambda: (set(), set()))
+    async for triple in db["triples"].find(
+        triple_match, {"_id": 0, "head": 1, "tail": 1, "edge": 1}
+    ):
+        for centre, other in (
+            (triple["head"], triple["tail"]),
+            (triple["tail"], triple["head"]),
+        ):
+            if centres is None or centre in centres:
+                neighbours[centre][0].add(other)
+                neighbours[centre][1].add(triple["edge"])
+
+    if centres is None:
+        node_match = {"graph_id": graph_id}
+        edge_match = {"graph_id": graph_id}
+    else:
+        stats_node_ids = set(centres)
+        stats_edge_ids = set()
+        for nodes, links in neighbours.values():
+            stats_node_ids |= nodes
+            stats_edge_ids |= links
+        node_match = {"_id": {"$in": list(stats_node_ids)}}
+        edge_match = {"_id": {"$in": list(stats_edge_ids)}}
+
+    node_stats = {
+        n["_id"]: n
+        async for n in db["nodes"].aggregate(_item_stats_pipeline(node_match))
+    }
+    edge_stats = {
+        e["_id"]: e
+        async for e in db["edges"].aggregate(_item_stats_pipeline(edge_match))
+    }
+
+    if centres is None:
+        centres = set(node_stats.keys())
+
+    summaries = {
+        centre: summarise(
+            centre, *neighbours.get(centre, (set(), set())), node_stats, edge_stats
+        )
+        for centre in centres
+        if centre in node_stats
+    }
+
+    updates = (
+        UpdateOne({"_id": centre}, {"$set": {"neighbourhood": summary}})
+        for centre, summary in summaries.items()
+    )
+    for batch in batched(updates, settings.BULK_WRITE_BATCH_SIZE):
+        await db["nodes"].bulk_write(batch, ordered=False)
+
+    if node_ids is None:
+        await db["graphs"].update_one(
+            {"_id": graph_id},
+            {
+                "$set": {
+                    "neighbourhoods_built": True,
+                    "reviewed_nodes": sum(
+                        n["is_reviewed"] for n in node_stats.values()
+                    ),
+                    "reviewed_edges": sum(
+                        e["is_reviewed"] for e in edge_stats.values()
+                    ),
+                }
+            },
+        )
+        logger.info(f"Built {len(summaries)} neighbourhoods for graph {graph_id}")
+
+    return summaries
+
+
+async def refresh_reviewed_counts(
+    graph_id: ObjectId, db: AsyncIOMotorDatabase
+) -> Tuple[int, int]:
+    """Recounts a graph's reviewed nodes and edges, e.g. after items are removed, and stores them on the graph."""
+    reviewed_nodes = await db["nodes"].count_documents(
+        {"graph_id": graph_id, "is_reviewed": True}
+    )
+    reviewed_edges = await db["edges"].count_documents(
+        {"graph_id": graph_id, "is_reviewed": True}
+    )
+    await db["graphs"].update_one(
+        {"_id": graph_id},
+        {"$set": {"reviewed_nodes": reviewed_nodes, "reviewed_edges": reviewed_edges}},
+    )
+    return reviewed_nodes, reviewed_edges
+
+
+async def ensure_neighbourhoods(graph: Dict, db: AsyncIOMotorDatabase) -> None:
+    """
+    Builds neighbourhoods and reviewed counters for graphs created before they were maintained.
+
+    `graph` is updated in place with the built state and counters.
+    """
+    if graph.get("neighbourhoods_built") and "reviewed_nodes" in graph:
+        return
+
+    await refresh_neighbourhoods(graph_id=graph["_id"], db=db)
+    graph.update(
+        await db["graphs"].find_one(
+            {"_id": graph["_id"]},
+            {"neighbourhoods_built": 1, "reviewed_nodes": 1, "reviewed_edges": 1},
+        )
+    )
+
+
+def subgraph_progress(neighbourhood: Dict) -> Dict[str, int]:
+    """Formats a node's neighbourhood summary as subgraph review progress"""
+    return {
+        key: neighbourhood[key]
+        for key in [
+            "node_count",
+            "edge_count",
+            "nodes_reviewed",
+            "edges_reviewed",
+            "reviewed_progress",
+        ]
+    }
+
+
+async def get_review_progress(
+    graph_id: ObjectId,
+    db: AsyncIOMotorDatabase,
+    node_ids: Optional[Iterable[ObjectId]] = None,
+) -> Tuple[int, int, Dict[str, Dict[str, int]]]:
+    """
+    Reads review progress from the graph's counters and its nodes' neighbourhood summaries.
+
+    Arguments
+    ---------
+    graph_id: The graph to read progress for.
+    node_ids: The subgraph centres to return progress for. If None, every subgraph (node with at least one triple) is returned.
+
+    Returns
+    -------
+    The graph's reviewed node and edge counts, and the progress of each requested subgraph by node id.
+    """
+    graph = await db["graphs"].find_one(
+        {"_id": graph_id},
+        {"neighbourhoods_built": 1, "reviewed_nodes": 1, "reviewed_edges": 1},
+    )
+    await ensure_neighbourhoods(graph=graph, db=db)
+
+    query = {"graph_id": graph_id, "neighbourhood.edge_count": {"$gt": 0}}
+    if node_ids is not None:
+        query["_id"] = {"$in": list(node_ids)}
+
+    progress = {
+        str(n["_id"]): subgraph_progress(n["neighbourhood"])
+        async for n in db["nodes"].find(query, {"_id": 1, "neighbourhood": 1})
+    }
+
+    return graph["reviewed_nodes"], graph["reviewed_edges"], progress
+
+
+async def apply_review_deltas(
+    graph_id: ObjectId,
+    db: AsyncIOMotorDatabase,
+    node_deltas: Optional[Dict[ObjectId, int]] = None,
+    edge_deltas: Optional[Dict[ObjectId, int]] = None,
+) -> Set[ObjectId]:
+    """
+    Updates neighbourhood reviewed counts (and progress) and the graph's reviewed counters after items' review states change.
+
+    A node's review state counts towards its own subgraph and the subgraph of each of its 1-hop nodes; an edge's counts towards the subgraphs of its head and tail.
+
+    Arguments
+    ---------
+    graph_id: The graph the items belong to.
+    node_deltas: +1/-1 by id for nodes that were reviewed/unreviewed.
+    edge_deltas: +1/-1 by id for edges that were reviewed/unreviewed.
+
+    Returns
+    -------
+    The ids of the nodes whose subgraphs were updated.
+    """
+    node_deltas = {k: v for k, v in (node_deltas or {}).items() if v}
+    edge_deltas = {k: v for k, v in (edge_deltas or {}).items() if v}
+
+    centre_deltas: Dict[ObjectId, List[int]] = defaultdict(lambda: [0, 0])
+
+    if node_deltas:
+        changed = list(node_deltas)
+        adjacent = set()
+        async for triple in db["triples"].find(
+            {
+                "graph_id": graph_id,
+                "$or": [{"head": {"$in": changed}}, {"tail": {"$in": changed}}],
+            },
+            {"_id": 0, "head": 1, "tail": 1},
+        ):
+            if triple["head"] in node_deltas:
+                adjacent.add((triple["head"], triple["tail"]))
+            if triple["tail"] in node_deltas:
+                adjacent.add((triple["tail"], triple["head"]))
+
+        for node_id, delta in node_deltas.items():
+            centre_deltas[node_id][0] += delta
+        for node_id, centre in adjacent:
+            centre_deltas[centre][0] += node_deltas[node_id]
+
+    if edge_deltas:
+        async for triple in db["triples"].find(
+            {"edge": {"$in": list(edge_deltas)}},
+            {"_id": 0, "head": 1, "tail": 1, "edge": 1},
+        ):
+            for centre in {triple["head"], triple["tail"]}:
+                centre_deltas[centre][1] += edge_deltas[triple["edge"]]
+
+    updates = [
+        UpdateOne(
+            {"_id": centre, "neighbourhood": {"$exists": True}},
+            [
+                {
+                    "$set": {
+                        "neighbourhood.nodes_reviewed": {
+                            "$add": ["$neighbourhood.nodes_reviewed", node_delta]
+                        },
+                        "neighbourhood.edges_reviewed": {
+                            "$add": ["$neighbourhood.edges_reviewed", edge_delta]
+                        },
+                    }
+                },
+                {
+                    "$set": {
+                        "neighbourhood.reviewed_progress": {
+                            "$toInt": {
+                                "$round": [
+                                    {
+                                        "$multiply": [
+                                            {
+                                                "$divide": [
+                                                    {
+                                                        "$add": [
+                                                            "$neighbourhood.nodes_reviewed",
+                                                            "$neighbourhood.edges_reviewed",
+                                                        ]
+                                                    },
+                                                    {
+                                                        "$add": [
+                                                            "$neighbourhood.node_count",
+                                                            "$neighbourhood.edge_count",
+                                                        ]
+                                                    },
+                                                ]
+                                            },
+                                            100,
+                                        ]
+                                    },
+                                    0,
+                                ]
+                            }
+                        }
+                    }
+                },
+            ],
+        )
+        for centre, (node_delta, edge_delta) in centre_deltas.items()
+        if node_delta or edge_delta
+    ]
+    for batch in batched(updates, settings.BULK_WRITE_BATCH_SIZE):
+        await db["nodes"].bulk_write(batch, ordered=False)
+
+    reviewed_deltas = {
+        "reviewed_nodes": sum(node_deltas.values()),
+        "reviewed_edges": sum(edge_deltas.values()),
+    }
+    if any(reviewed_deltas.values()):
+        await db["graphs"].update_one({"_id": graph_id}, {"$inc": reviewed_deltas})
+
+    return set(centre_deltas)
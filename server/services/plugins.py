@@ -1,12 +1,18 @@
-from typing import List, Dict, Tuple, Optional, Union, Any
+from typing import Awaitable, List, Dict, Tuple, Optional, Union, Any
+from collections import defaultdict
+import asyncio
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from bson import ObjectId
 from loguru import logger
 
 from models import graph as graph_model
+from services.bulk import bulk_push
+from services.jobs import JobProgress
+from services.triples import PLUGIN_FIELDS, iter_populated_triples
 
 from plugin_models import ModelInput, ModelTriple
 from plugin_manager import PluginManager
+from plugin_executor import PluginExecutionError, PluginTimeoutError, plugin_executor
 from settings import settings
 
 
@@ -26,56 +32,9 @@ async def get_graph_data(
     TODO
     ----
     - Make this call only done once and allow data to be used in both plugins independently
-    - Refactor as this triple extraction and formatting is the same as the "download" route
 
     """
 
-    populated_triple_pipeline = [
-        {
-            "$match": {
-                "graph_id": graph_id,
-            }
-        },
-        {
-            "$lookup": {
-                "from": "nodes",
-                "localField": "head",
-                "foreignField": "_id",
-                "as": "head",
-            }
-        },
-        {
-            "$lookup": {
-                "from": "nodes",
-                "localField": "tail",
-                "foreignField": "_id",
-                "as": "tail",
-            }
-        },
-        {
-            "$lookup": {
-                "from": "edges",
-                "localField": "edge",
-                "foreignField": "_id",
-                "as": "edge",
-            }
-        },
-        {"$unwind": "$head"},
-        {"$unwind": "$tail"},
-        {"$unwind": "$edge"},
-        {
-            "$project": {
-                "_id": 0,
-                "graph_id": 0,
-                "head.graph_id": 0,
-                "edge.graph_id": 0,
-                "tail.graph_id": 0,
-            }
-        },
-    ]
-
-    triples = await db["triples"].aggregate(populated_triple_pipeline).to_list(None)
-
     graph = await db["graphs"].find_one(
         {"_id": graph_id}, {"node_classes": 1, "edge_classes": 1}
     )
@@ -84,8 +43,11 @@ async def get_graph_data(
     edgeId2Name = {e["_id"]: e["name"] for e in graph["edge_classes"]}
 
     # Transform triples - NOTE: head/relation/tail types are their human readable names, not their ObjectIds
-    data = ModelInput(
-        triples=[
+    model_triples = []
+    async for triples in iter_populated_triples(
+        {"graph_id": graph_id}, db, node_fields=PLUGIN_FIELDS, edge_fields=PLUGIN_FIELDS
+    ):
+        model_triples.extend(
             ModelTriple(
                 head=t["head"]["name"],
                 head_type=nodeId2Name[t["head"]["type"]],
@@ -100,8 +62,8 @@ async def get_graph_data(
                 tail_id=str(t["tail"]["_id"]),
             )
             for t in triples
-        ]
-    )
+        )
+    data = ModelInput(triples=model_triples)
 
     nodeName2Id = {v: k for k, v in nodeId2Name.items()}
     edgeName2Id = {v: k for k, v in edgeId2Name.items()}
@@ -112,74 +74,124 @@ async def get_graph_data(
 async def execute_edm(
     db: AsyncIOMotorDatabase,
     edm_plugin,
+    edm_plugin_name: str,
     data: ModelInput,
     nodeName2Id: Dict[str, ObjectId],
     edgeName2Id: Dict[str, ObjectId],
 ):
-    """Executes error detection model (EDM)"""
-
-    edm_output = edm_plugin.execute(triples=data.dict(exclude_unset=True)["triples"])
+    """Executes error detection model (EDM) in a plugin worker process and returns the metrics of writing its errors"""
+
+    edm_output = await plugin_executor.execute(
+        plugin_type="edm",
+        plugin_name=edm_plugin_name,
+        triples=data.dict(exclude_unset=True)["triples"],
+        timeout=edm_plugin.timeout,
+        max_memory_mb=edm_plugin.max_memory_mb,
+    )
 
     logger.debug(f"edm_output sample: {edm_output.data[:5]}")
 
-    # Update nodes with EDM errors
+    # Group errors by node so each node is updated once
+    node_errors = defaultdict(list)
     for err in edm_output.data:
         # Convert error into expected format for error array
 
         if err.is_node:
-            # _item_type = node_classes_with_ids.get(err.action.item_type_name)
-
             # Add item_type id to object.
             err.action.data.item_type = str(
                 nodeName2Id.get(err.action.data.item_type_name)
             )
-            # print("err action data", err.action.data)
-
-            new_error = graph_model.Error(**err.dict()).dict()
 
-            # print("adding new error to node!")
-            # Can optimise my tracking node errors and pushing them all at once as some nodes will have more than one error.
-            result = await db["nodes"].update_one(
-                {"_id": ObjectId(err.item_id)}, {"$push": {"errors": new_error}}
+            node_errors[ObjectId(err.item_id)].append(
+                graph_model.Error(**err.dict()).dict()
             )
-            # print("modified", result.modified_count > 0)
 
         # TODO: implement link errors...
 
+    # Update nodes with EDM errors
+    metrics = await bulk_push(db["nodes"], "errors", node_errors)
+    logger.info(
+        f"EDM plugin {edm_plugin_name} wrote {metrics['values']} errors to {metrics['documents']} nodes in {metrics['batches']} batches in {metrics['seconds']}s"
+    )
+
+    return metrics
+
 
 async def execute_cm(
     db: AsyncIOMotorDatabase,
     cm_plugin,
+    cm_plugin_name: str,
     data: ModelInput,
     nodeName2Id: Dict[str, ObjectId] = None,
     edgeName2Id: Dict[str, ObjectId] = None,
 ):
-    """ """
-    # Execute plugin
-    cm_output = cm_plugin.execute(triples=data.dict(exclude_unset=True)["triples"])
+    """Executes completion model (CM) in a plugin worker process and returns the metrics of writing its suggestions"""
+    cm_output = await plugin_executor.execute(
+        plugin_type="cm",
+        plugin_name=cm_plugin_name,
+        triples=data.dict(exclude_unset=True)["triples"],
+        timeout=cm_plugin.timeout,
+        max_memory_mb=cm_plugin.max_memory_mb,
+    )
 
-    # Update nodes with CM suggestion
+    # Group suggestions by node so each node is updated once
+    node_suggestions = defaultdict(list)
     for suggestion in cm_output.data:
-        # print("suggestion", suggestion)
         # Convert suggestion into expected format for suggestion array
 
-        new_suggestion = graph_model.Suggestion(
-            suggestion_type=suggestion.suggestion_type,
-            suggestion_value=suggestion.suggestion_value,
-        ).dict()
-
         if suggestion.is_node:
-            # print("adding new suggestion to node!")
-            # Can optimise my tracking node suggestion and pushing them all at once as some nodes will have more than one error.
-            result = await db["nodes"].update_one(
-                {"_id": ObjectId(suggestion.id)},
-                {"$push": {"suggestions": new_suggestion}},
+            node_suggestions[ObjectId(suggestion.id)].append(
+                graph_model.Suggestion(
+                    suggestion_type=suggestion.suggestion_type,
+                    suggestion_value=suggestion.suggestion_value,
+                ).dict()
             )
-            # print("modified", result.modified_count > 0)
+
+    # Update nodes with CM suggestions
+    metrics = await bulk_push(db["nodes"], "suggestions", node_suggestions)
+    logger.info(
+        f"CM plugin {cm_plugin_name} wrote {metrics['values']} suggestions to {metrics['documents']} nodes in {metrics['batches']} batches in {metrics['seconds']}s"
+    )
+
+    return metrics
+
+
+async def report_plugin_failure(
+    message: str, progress: Optional[JobProgress] = None
+) -> None:
+    """Logs a plugin failure and, when run as a job, records it as a job warning so it's visible to clients"""
+    logger.error(message)
+    if progress is not None:
+        await progress.warn(message)
+
+
+async def run_plugin(
+    name: str, execution: Awaitable, progress: Optional[JobProgress] = None
+) -> None:
+    """Awaits a plugin's execution, reporting timeouts and failures rather than failing the job. Cancellation is propagated."""
+    try:
+        await execution
+    except asyncio.CancelledError:
+        raise
+    except PluginTimeoutError:
+        await report_plugin_failure(
+            f"Plugin {name} timed out and was terminated; its results were not saved",
+            progress,
+        )
+    except PluginExecutionError as e:
+        logger.debug(str(e))
+        # The last line of a worker's traceback is its exception
+        reason = str(e).strip().splitlines()[-1]
+        await report_plugin_failure(
+            f"Plugin {name} failed; its results were not saved ({reason})", progress
+        )
 
 
 async def execute_plugins(
-    db: AsyncIOMotorDatabase, graph_id: ObjectId, graph_plugins: graph_model.Plugins
+    db: AsyncIOMotorDatabase,
+    graph_id: ObjectId,
+    graph_plugins: graph_model.Plugins,
+    progress: Optional[JobProgress] = None,
 ) -> None:
     """
     Executes specified error detection models (EDM) and completion models (CM) on graph data.
@@ -188,9 +200,11 @@ async def execute_plugins(
     - db: The database instance
     - graph_id: The ObjectId of the graph
     - graph_plugins: The plugins that will be used to process the graph data
+    - progress: The progress of the job creating the graph, on which plugin failures are recorded as warnings
 
     The function first retrieves available plugins and the graph data. Then it executes the EDM and CM plugins
-    if they are specified in the graph_plugins parameter.
+    if they are specified in the graph_plugins parameter. Plugins run in worker processes (see `plugin_executor.py`) so they don't block the event loop.
+    A plugin that times out, exceeds its memory limit or fails doesn't fail graph creation: its results are skipped and the failure is recorded on the job.
     """
 
     try:
@@ -206,18 +220,34 @@ async def execute_plugins(
         if graph_plugins.edm:
             edm_plugin = plugins["edm"][graph_plugins.edm]
             logger.info(f"Executing EDM plugin - {graph_plugins.edm}")
-            await execute_edm(
-                db=db,
-                edm_plugin=edm_plugin,
-                data=data,
-                nodeName2Id=nodeName2Id,
-                edgeName2Id=edgeName2Id,
+            await run_plugin(
+                graph_plugins.edm,
+                execute_edm(
+                    db=db,
+                    edm_plugin=edm_plugin,
+                    edm_plugin_name=graph_plugins.edm,
+                    data=data,
+                    nodeName2Id=nodeName2Id,
+                    edgeName2Id=edgeName2Id,
+                ),
+                progress,
             )
 
         if graph_plugins.cm:
             cm_plugin = plugins["cm"][graph_plugins.cm]
             logger.info(f"Executing CM plugin - {graph_plugins.cm}")
-            await execute_cm(db=db, cm_plugin=cm_plugin, data=data)
+            await run_plugin(
+                graph_plugins.cm,
+                execute_cm(
+                    db=db,
+                    cm_plugin=cm_plugin,
+                    cm_plugin_name=graph_plugins.cm,
+                    data=data,
+                ),
+                progress,
+            )
 
+    except asyncio.CancelledError:
+        raise
     except Exception as e:
-        logger.error(f"Error executing plugin(s): {e}")
+        await report_plugin_failure(f"Error executing plugin(s): {e}", progress)
@@ -0,0 +1,184 @@
+"""
+Services for populating triples with their head, edge and tail items.
+
+Rather than joining each triple to its items with `$lookup` (which fetches a node once per incident triple, so a hub node with 10k triples is loaded 10k times), the distinct node and edge ids of a set of triples are collected, each item is loaded once with batched `$in` queries, and the triples are joined in Python.
+
+Callers request only the item fields they use (e.g. `PLUGIN_FIELDS`), so unused fields such as errors and suggestions are never transferred from MongoDB. Streamed triples are populated in batches, with recently loaded nodes kept in a bounded cache so hub nodes are loaded once rather than once per batch.
+"""
+
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Sequence
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from services.bulk import batched, run_concurrently
+from settings import settings
+
+# Item fields needed by each consumer of populated triples (`_id` is always included). None loads whole documents.
+PLUGIN_FIELDS = ("name", "type", "properties")
+DOWNLOAD_FIELDS = (
+    "name",
+    "type",
+    "properties",
+    "errors",
+    "suggestions",
+    "is_reviewed",
+    "is_active",
+    "created_at",
+    "updated_at",
+)
+MERGE_EDGE_FIELDS = ("type", "value", "properties", "errors", "suggestions")
+ID_FIELDS = ()
+
+
+def item_projection(fields: Optional[Sequence[str]]) -> Optional[Dict]:
+    return None if fields is None else {"_id": 1, **{f: 1 for f in fields}}
+
+
+class ItemCache:
+    """A least recently used cache of item documents, bounded by count."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._items: "OrderedDict[ObjectId, Dict]" = OrderedDict()
+
+    def get(self, ids: Iterable[ObjectId]) -> Dict[ObjectId, Dict]:
+        found = {}
+        for _id in ids:
+            item = self._items.get(_id)
+            if item is not None:
+                self._items.move_to_end(_id)
+                found[_id] = item
+        return found
+
+    def update(self, items: Dict[ObjectId, Dict]) -> None:
+        if self.max_size <= 0:
+            return
+        self._items.update(items)
+        for _id in items:
+            self._items.move_to_end(_id)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+
+async def load_items(
+    collection: str,
+    ids: Iterable[ObjectId],
+    db: AsyncIOMotorDatabase,
+    fields: Optional[Sequence[str]] = None,
+    batch_size: Optional[int] = None,
+    cache: Optional[ItemCache] = None,
+) -> Dict[ObjectId, Dict]:
+    """Loads documents by id in batched `$in` queries, returning them by id. Documents in `cache` aren't reloaded."""
+    batch_size = batch_size or settings.POPULATE_BATCH_SIZE
+    items = {} if cache is None else cache.get(ids)
+    missing = [_id for _id in ids if _id not in items]
+
+    loaded = {}
+    for batch in batched(missing, batch_size):
+        async for item in db[collection].find(
+            {"_id": {"$in": batch}}, item_projection(fields)
+        ):
+            loaded[item["_id"]] = item
+
+    if cache is not None:
+        cache.update(loaded)
+    items.update(loaded)
+    return items
+
+
+async def populate_triples(
+    triples: List[Dict],
+    db: AsyncIOMotorDatabase,
+    node_fields: Optional[Sequence[str]] = None,
+    edge_fields: Optional[Sequence[str]] = None,
+    node_cache: Optional[ItemCache] = None,
+) -> List[Dict]:
+    """
+    Replaces the head, edge and tail ids of triples with their documents, projected to `node_fields` and `edge_fields`.
+
+    Each distinct node and edge is loaded once, and populated triples share item documents, so callers must copy an item before modifying it. Triples whose items no longer exist are dropped (as `$unwind` would drop them).
+    """
+    node_ids = {t["head"] for t in triples} | {t["tail"] for t in triples}
+    edge_ids = {t["edge"] for t in triples}
+
+    nodes, edges = await run_concurrently(
+        load_items("nodes", node_ids, db, fields=node_fields, cache=node_cache),
+        load_items("edges", edge_ids, db, fields=edge_fields),
+    )
+
+    populated = []
+    for triple in triples:
+        head = nodes.get(triple["head"])
+        edge = edges.get(triple["edge"])
+        tail = nodes.get(triple["tail"])
+        if head is None or edge is None or tail is None:
+            continue
+        populated.append({**triple, "head": head, "edge": edge, "tail": tail})
+    return populated
+
+
+async def iter_populated_triples(
+    query: Dict,
+    db: AsyncIOMotorDatabase,
+    node_fields: Optional[Sequence[str]] = None,
+    edge_fields: Optional[Sequence[str]] = None,
+    sort: Optional[List] = None,
+    batch_size: Optional[int] = None,
+    **kwargs,
+) -> AsyncIterator[List[Dict]]:
+    """
+    Yields batches of populated triples matching `query`, so memory is bounded by the batch size rather than the number of triples.
+
+    Arguments
+    ---------
+    query: Filter on the triples collection.
+    node_fields, edge_fields: Item fields to load; None loads whole documents.
+    sort: Sort specification of the triples.
+    batch_size: Number of triples populated at a time. Defaults to `settings.POPULATE_BATCH_SIZE`.
+    kwargs: Passed to `find` (e.g. skip and limit).
+
+    Nodes are cached across batches (up to `settings.POPULATE_NODE_CACHE_SIZE`), as they recur across a graph's triples; edges belong to a single triple so aren't.
+    """
+    batch_size = batch_size or settings.POPULATE_BATCH_SIZE
+    node_cache = ItemCache(max_size=settings.POPULATE_NODE_CACHE_SIZE)
+
+    async def populate(batch: List[Dict]) -> List[Dict]:
+        return await populate_triples(
+            batch,
+            db,
+            node_fields=node_fields,
+            edge_fields=edge_fields,
+            node_cache=node_cache,
+        )
+
+    cursor = db["triples"].find(query, {"graph_id": 0}, batch_size=batch_size, **kwargs)
+    if sort:
+        cursor = cursor.sort(sort)
+
+    batch = []
+    async for triple in cursor:
+        batch.append(triple)
+        if len(batch) == batch_size:
+            yield await populate(batch)
+            batch = []
+    if batch:
+        yield await populate(batch)
+
+
+async def find_populated_triples(
+    query: Dict,
+    db: AsyncIOMotorDatabase,
+    node_fields: Optional[Sequence[str]] = None,
+    edge_fields: Optional[Sequence[str]] = None,
+    sort: Optional[List] = None,
+    **kwargs,
+) -> List[Dict]:
+    """Finds and populates all triples matching `query` (see `iter_populated_triples`)"""
+    triples = []
+    async for batch in iter_populated_triples(
+        query, db, node_fields=node_fields, edge_fields=edge_fields, sort=sort, **kwargs
+    ):
+        triples.extend(batch)
+    return triples
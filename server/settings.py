@@ -1,3 +1,6 @@
+import os
+import tempfile
+from typing import Optional
 from pydantic import BaseSettings
 
 
@@ -11,8 +14,99 @@ class Settings(BaseSettings):
     MONGO_CLUSTER_NAME: str = "<ENTER_CLUSTER_NAME>"
     MONGO_DB_NAME: str = "<ENTER_DB_NAME>"
     MONGO_URI: str = "<ENTER_URI>"
+    MONGO_MAX_POOL_SIZE: int = 100  # Maximum connections in the shared client's pool
+    MONGO_MIN_POOL_SIZE: int = 0  # Connections kept open while idle
+    MONGO_MAX_IDLE_TIME_MS: Optional[int] = (
+        None  # Idle time before a pooled connection is closed
+    )
+    MONGO_WAIT_QUEUE_TIMEOUT_MS: Optional[int] = (
+        None  # Time a request waits for a free connection before failing
+    )
+    MONGO_CONNECT_TIMEOUT_MS: int = 20_000
+    MONGO_SOCKET_TIMEOUT_MS: Optional[int] = None
+    MONGO_SERVER_SELECTION_TIMEOUT_MS: int = 30_000
+    MONGO_ENSURE_INDEXES: bool = (
+        True  # Create missing indexes at startup (otherwise they're only reported)
+    )
+    MONGO_COMPRESSORS: Optional[str] = (
+        None  # Wire compressors in order of preference, e.g. "zstd,snappy,zlib"
+    )
 
     PLUGIN_DIRECTORY: str = "./plugins"
+    PLUGIN_MAX_WORKERS: int = 2  # Number of plugin worker processes run concurrently
+    PLUGIN_TIMEOUT_SECONDS: int = (
+        3600  # Default time a plugin may run before it's terminated
+    )
+    PLUGIN_MAX_MEMORY_MB: Optional[int] = (
+        None  # Default address space limit of plugin worker processes (None is unlimited)
+    )
+    PLUGIN_START_METHOD: str = (
+        "spawn"  # multiprocessing start method for plugin workers
+    )
+    PLUGIN_WRITE_BATCH_SIZE: int = (
+        1_000  # Number of item updates per plugin output bulk write
+    )
+    EDIT_DISTANCE_MAX_DISTANCE: int = (
+        1  # Maximum edit distance between node names the Node Edit Distance plugin reports as similar
+    )
+    EDIT_DISTANCE_WORKERS: Optional[int] = (
+        None  # Processes the Node Edit Distance plugin shards large comparisons across (defaults to the number of CPUs)
+    )
+
+    EMBEDDING_CACHE_DIRECTORY: Optional[str] = os.path.join(
+        tempfile.gettempdir(), "cleangraph_embedding_cache"
+    )  # Where completion plugins cache trained embeddings (None disables caching)
+    EMBEDDING_CACHE_MAX_MB: int = (
+        1024  # Size of the embedding cache before least recently used entries are evicted
+    )
+
+    RESPONSE_CACHE_MAX_MB: int = (
+        256  # Size of the in-process response cache for graph read endpoints (0 disables caching)
+    )
+
+    POPULATE_BATCH_SIZE: int = (
+        1_000  # Number of triples populated at a time, and ids per $in query
+    )
+
+    POPULATE_NODE_CACHE_SIZE: int = (
+        10_000  # Number of nodes cached across batches when streaming populated triples
+    )
+
+    EXPORT_BATCH_SIZE: int = (
+        1_000  # Number of triples fetched and written per streamed export chunk
+    )
+
+    EXPORT_ROW_GROUP_SIZE: int = (
+        100_000  # Number of rows per record batch (Parquet row group) in columnar exports
+    )
+
+    INGEST_PROGRESS_INTERVAL: int = (
+        100_000  # Number of streamed triples between ingestion progress reports
+    )
+
+    BULK_WRITE_BATCH_SIZE: int = 10_000  # Number of documents per bulk insert batch
+    BULK_WRITE_CONCURRENCY: int = 4  # Maximum number of in-flight bulk insert batches
+    MERGE_USE_TRANSACTIONS: bool = (
+        False  # Make node merge writes in a transaction (requires a replica set)
+    )
+
+    JOB_MAX_WORKERS: int = (
+        2  # Number of background jobs (e.g. graph creation) run concurrently
+    )
+    JOB_MAX_QUEUED: int = 100  # Maximum number of background jobs waiting to run
+    JOB_HEARTBEAT_SECONDS: int = (
+        15  # How often a server process marks its background jobs as still alive
+    )
+    JOB_ABANDONED_SECONDS: int = (
+        60  # Unfinished jobs without a heartbeat for this long are failed (their process has stopped)
+    )
+    JOB_SPOOL_DIRECTORY: Optional[str] = (
+        None  # Where streamed uploads are spooled before parsing (defaults to the system temp directory)
+    )
+    DELETE_BATCH_SIZE: int = 10_000  # Number of documents removed per delete batch
+    DELETE_JOB_THRESHOLD: int = (
+        100_000  # Graphs with more nodes and edges than this are deleted as a background job
+    )
 
     UNTYPED_GRAPH_NODE_CLASS: str = (
         "Untyped"  # This is the "type" given to nodes in untyped graphs